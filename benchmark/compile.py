@@ -0,0 +1,280 @@
+# Benchmark query compilation;
+import argparse
+import cProfile
+import gc
+import time
+from functools import partial
+from itertools import cycle
+
+import datetime
+
+from elasticmagic import (
+    Bool, Document, Field, FunctionScore, SearchQuery,
+    Weight, FieldValueFactor,
+    )
+from elasticmagic import actions
+from elasticmagic.agg import Terms, Avg
+from elasticmagic.cache import CompiledExpressionCache
+from elasticmagic.compiler import Compiler_6_0, Compiler_7_0
+from elasticmagic.types import Integer, Float, Keyword, Date
+
+
+COMPILERS = {
+    '6': Compiler_6_0,
+    '7': Compiler_7_0,
+}
+
+
+def setup():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(help='Valid commands')
+    for command, handler in [
+            ('query', run_query), ('bulk', run_bulk), ('build', run_build),
+            ('fragments', run_fragments),
+    ]:
+        sub_ap = sub.add_parser(command, help=handler.__doc__)
+        sub_ap.set_defaults(action=handler)
+        common_setup(sub_ap)
+    return ap
+
+
+def common_setup(ap):
+    ap.add_argument('-c', '--compiler', dest='compiler',
+                    choices=sorted(COMPILERS), default='7',
+                    help="Elasticsearch compiler version, default: 7")
+    ap.add_argument('-d', '--depth', dest='depth',
+                    type=int, default=4,
+                    help="Depth of the nested bool tree, default: 4")
+    ap.add_argument('-w', '--width', dest='width',
+                    type=int, default=4,
+                    help="Clauses on every bool level, default: 4")
+    ap.add_argument('-n', '--number', dest='number',
+                    type=int, default=200,
+                    help="Number of compilations, default: 200")
+    ap.add_argument('-a', '--actions', dest='actions',
+                    type=int, default=1000,
+                    help="Number of bulk actions, default: 1000")
+    ap.add_argument('--filters', dest='filters',
+                    type=int, default=50,
+                    help="Number of chained filter calls, default: 50")
+    ap.add_argument('--aggs', dest='aggs',
+                    type=int, default=20,
+                    help="Number of chained aggregation calls, default: 20")
+    ap.add_argument('--builder', dest='builder',
+                    action='store_true', default=False,
+                    help="Build query in place using SearchQuery.builder")
+    ap.add_argument('--compiled-cache', dest='compiled_cache',
+                    choices=['identity', 'structural'], default=None,
+                    help="Cache compiled fragments between queries")
+    ap.add_argument('--rebuild', dest='rebuild',
+                    action='store_true', default=False,
+                    help="Build fragments anew for every query")
+    ap.add_argument('--validate', dest='validate',
+                    action='store_true', default=False,
+                    help="Validate documents when compiling bulk actions")
+    ap.add_argument('-p', '--profile', dest='profile',
+                    action='store_true', default=False)
+
+
+def main():
+    ap = setup()
+    options = ap.parse_args()
+    if not hasattr(options, 'action'):
+        ap.print_help()
+        return
+    return options.action(options)
+
+
+def measure(options, func):
+    prof = cProfile.Profile()
+    gc.disable()
+    if options.profile:
+        prof.enable()
+    start = time.monotonic()
+    for _ in range(options.number):
+        func()
+    duration = (time.monotonic() - start) * 1000
+    if options.profile:
+        prof.disable()
+    gc.enable()
+
+    print("Took {:10.3f}ms total, {:8.3f}ms per iteration".format(
+        duration, duration / options.number
+    ))
+    if options.profile:
+        prof.print_stats('cumulative')
+
+
+# Actions
+
+
+def run_query(options):
+    """Compile large nested search query."""
+    compiler = COMPILERS[options.compiler]
+    sq = gen_search_query(options.depth, options.width)
+    measure(options, lambda: compiler.compiled_query(sq).body)
+
+
+def run_bulk(options):
+    """Compile and serialize bulk actions."""
+    compiler = COMPILERS[options.compiler]
+    bulk_actions = gen_bulk_actions(options.actions)
+    compiled_bulk = compiler.compiled_bulk
+    compiled_source = compiled_bulk.compiled_source
+    validate = options.validate
+
+    def compile_bulk():
+        for action in bulk_actions:
+            compiled_bulk.compiled_meta(action).body
+            compiled_source(action, validate=validate).body
+
+    measure(options, compile_bulk)
+
+
+def run_build(options):
+    """Build search query with chained filter and aggregation calls."""
+    compiler = COMPILERS[options.compiler]
+    filters, aggs = gen_filters_and_aggs(options.filters, options.aggs)
+    build_query = partial(
+        build_search_query, filters, aggs, builder=options.builder
+    )
+    build_query()
+    measure(options, build_query)
+    compiled_query = compiler.compiled_query(build_query()).body
+    assert len(compiled_query['query']['bool']['filter']) == options.filters
+
+
+def run_fragments(options):
+    """Compile queries that reuse filter and aggregation fragments."""
+    compiler = COMPILERS[options.compiler]
+    compiled_cache = None
+    if options.compiled_cache:
+        compiled_cache = CompiledExpressionCache(
+            structural=options.compiled_cache == 'structural'
+        )
+    fragments = gen_fragments(options.depth, options.width)
+    statuses = cycle(range(10))
+
+    def compile_query():
+        if options.rebuild:
+            query_fragments = gen_fragments(options.depth, options.width)
+        else:
+            query_fragments = fragments
+        sq = build_fragments_query(*query_fragments, status=next(statuses))
+        if compiled_cache is not None:
+            sq = sq.with_compiled_cache(compiled_cache)
+        return compiler.compiled_query(sq).body
+
+    measure(options, compile_query)
+
+
+class ProductDocument(Document):
+    __doc_type__ = 'product'
+
+    status = Field(Integer)
+    price = Field(Float)
+    rank = Field(Float)
+    tags = Field(Keyword)
+    created_at = Field(Date)
+
+
+def gen_bulk_actions(n):
+    created_at = datetime.datetime(2020, 1, 1)
+    return [
+        actions.Index(
+            ProductDocument(
+                _id=i, _routing=i % 10,
+                status=i % 3, price=i * 1.5, rank=i / 10.0,
+                tags=['tag-{}'.format(i % 7), 'common'],
+                created_at=created_at,
+            )
+        )
+        for i in range(n)
+    ]
+
+
+def gen_bool_tree(depth, width, seed=0):
+    if depth == 0:
+        return [
+            ProductDocument.status == seed,
+            ProductDocument.tags.in_(['tag-{}'.format(seed), 'common']),
+            ProductDocument.price.range(gte=seed, lt=seed + 100),
+        ][seed % 3]
+    clauses = [
+        gen_bool_tree(depth - 1, width, seed=seed * width + i)
+        for i in range(width)
+    ]
+    if depth % 2:
+        return FunctionScore(
+            query=Bool(must=clauses[:1], should=clauses[1:]),
+            functions=[
+                Weight(2, filter=ProductDocument.status == depth),
+                FieldValueFactor(ProductDocument.rank, missing=1),
+            ],
+        )
+    return Bool(filter=clauses[:-1], must_not=clauses[-1:])
+
+
+def gen_filters_and_aggs(filters, aggs):
+    return (
+        [ProductDocument.status != i for i in range(filters)],
+        [
+            {'tags_{}'.format(i): Terms(ProductDocument.tags)}
+            for i in range(aggs)
+        ],
+    )
+
+
+def gen_fragments(depth, width):
+    return (
+        [
+            ProductDocument.status.in_([1, 2, 3]),
+            ProductDocument.created_at >= 'now-1d',
+            gen_bool_tree(depth, width),
+        ],
+        {
+            'tags': Terms(
+                ProductDocument.tags, size=100,
+                aggs={'avg_price': Avg(ProductDocument.price)}
+            ),
+            'statuses': Terms(ProductDocument.status),
+        },
+    )
+
+
+def build_fragments_query(filters, aggs, status):
+    return (
+        SearchQuery(ProductDocument.status == status)
+        .filter(*filters)
+        .aggs(aggs)
+        .order_by(ProductDocument.rank.desc())
+        .limit(20)
+    )
+
+
+def build_search_query(filters, aggs, builder=False):
+    sq = SearchQuery.builder() if builder else SearchQuery()
+    for filter_expr in filters:
+        sq = sq.filter(filter_expr)
+    for agg in aggs:
+        sq = sq.aggs(agg)
+    return sq.order_by(ProductDocument.rank.desc()).limit(20).freeze()
+
+
+def gen_search_query(depth, width):
+    return (
+        SearchQuery(gen_bool_tree(depth, width))
+        .filter(ProductDocument.created_at >= 'now-1d')
+        .aggs(
+            tags=Terms(
+                ProductDocument.tags, size=100,
+                aggs={'avg_price': Avg(ProductDocument.price)}
+            )
+        )
+        .order_by(ProductDocument.rank.desc())
+        .limit(20)
+    )
+
+
+if __name__ == '__main__':
+    main()
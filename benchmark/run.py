@@ -6,7 +6,6 @@ import json
 import time
 import cProfile
 import gc
-import coverage
 
 from collections import OrderedDict
 
@@ -125,7 +124,9 @@ def gen_sample(options):
 def run(options):
     """Run benchmark."""
     prof = cProfile.Profile()
-    cov = coverage.Coverage()
+    if options.profile:
+        import coverage
+        cov = coverage.Coverage()
 
     times = OrderedDict.fromkeys(['data_load', 'json_loads', 'searchResult'])
     start = time.monotonic() * 1000
@@ -146,16 +147,17 @@ def run(options):
         cov.start()
         prof.enable()
 
+    start = time.monotonic() * 1000
     SearchResult(
         raw_results,
         query._aggregations,
-        doc_cls=query._get_doc_cls(),
+        doc_cls_map={SimpleDocument.__doc_type__: SimpleDocument},
         instance_mapper=query._instance_mapper)
     times['searchResult'] = time.monotonic() * 1000 - start
     if options.profile:
         prof.disable()
         cov.stop()
-        gc.enable()
+    gc.enable()
 
     for key, duration in times.items():
         print("Took {} {:10.3f}ms".format(key, duration))
@@ -25,12 +25,14 @@
            compiler=Compiler_7_0)
        return cluster.search_query()
 """
+from array import array
 from itertools import chain
 
 from .document import DynamicDocument
 from .document import get_doc_type_for_hit
 from .expression import ParamsExpression, Params
-from .types import instantiate, Type
+from .mapper import populate_instances
+from .types import instantiate, Date, Type
 from .util import _with_clone, cached_property, maybe_float, merge_params
 
 
@@ -38,6 +40,8 @@ class AggExpression(ParamsExpression):
     __visit_name__ = 'agg'
 
     result_cls = None
+    # instance mappers are only used to process results
+    _fingerprint_exclude = ('_instance_mapper', '_columnar')
 
     def clone(self):
         return self.__class__(**self.params)
@@ -270,22 +274,19 @@ class TopHitsResult(AggResult):
                     .setdefault(instance_mapper, []) \
                     .append(self)
 
+    def _get_instance_targets(self, instance_mapper):
+        return [
+            (hit._id, hit) for hit in self.hits
+            if self._instance_mappers.get(hit.__class__) is instance_mapper
+        ]
+
     def _populate_instances(self, doc_cls):
         instance_mapper = self._instance_mappers.get(doc_cls)
-        hits = list(chain(
-            *(
-                map(
-                    lambda r: filter(
-                        lambda hit: isinstance(hit, doc_cls), r.hits
-                    ),
-                    self._mapper_registry.get(instance_mapper, [self])
-                )
-            )
-        ))
-        ids = [hit._id for hit in hits]
-        instances = instance_mapper(ids) if instance_mapper else {}
-        for hit in hits:
-            hit.__dict__['instance'] = instances.get(hit._id)
+        agg_results = self._mapper_registry.get(instance_mapper, [self])
+        populate_instances(instance_mapper, list(chain(*(
+            r._get_instance_targets(instance_mapper)
+            for r in _unique(agg_results)
+        ))))
 
 
 class TopHits(MetricsAgg):
@@ -664,6 +665,101 @@ class Bucket(object):
         )
 
 
+class BucketColumns(object):
+    """Columnar representation of the buckets.
+
+    ``doc_counts`` is an ``array('q')``. Numeric keys are stored in
+    ``array('q')`` or ``array('d')``, dates as epoch milliseconds, other keys
+    are kept in a list. Values of single value metric sub-aggregations are
+    stored in ``metrics`` as ``array('d')`` with ``nan`` for missing values.
+    """
+
+    def __init__(self, keys, doc_counts, metrics):
+        self.keys = keys
+        self.doc_counts = doc_counts
+        self.metrics = metrics
+
+    def __len__(self):
+        return len(self.doc_counts)
+
+    def get_metric(self, name):
+        return self.metrics.get(name)
+
+    def to_numpy(self):
+        """Returns a dict of NumPy arrays. Numeric columns share memory with
+        the arrays.
+        """
+        import numpy as np
+
+        def to_ndarray(column):
+            if isinstance(column, array):
+                return np.frombuffer(column, dtype=column.typecode)
+            return np.array(column, dtype=object)
+
+        columns = {
+            'key': to_ndarray(self.keys),
+            'doc_count': to_ndarray(self.doc_counts),
+        }
+        for name, values in self.metrics.items():
+            columns[name] = to_ndarray(values)
+        return columns
+
+
+def _unique(agg_results):
+    # the same result can be registered for several document classes
+    return list({id(r): r for r in agg_results}.values())
+
+
+def _get_key_typecode(key_type):
+    if isinstance(key_type, Date):
+        return 'q'
+    if key_type.python_type is int:
+        return 'q'
+    if key_type.python_type is float:
+        return 'd'
+    return None
+
+
+def _to_array(typecode, values):
+    try:
+        return array(typecode, values)
+    except (TypeError, OverflowError):
+        return None
+
+
+def _build_bucket_columns(agg_expr, bucket_cls, raw_buckets):
+    raw_keys = [raw_bucket.get('key') for raw_bucket in raw_buckets]
+    keys = None
+    if bucket_cls._typed_key:
+        typecode = _get_key_typecode(agg_expr._type)
+        if typecode:
+            keys = _to_array(typecode, raw_keys)
+        if keys is None:
+            to_python = agg_expr._type.to_python_single
+            keys = [to_python(key) for key in raw_keys]
+    else:
+        keys = raw_keys
+
+    doc_counts = array(
+        'q', [raw_bucket['doc_count'] for raw_bucket in raw_buckets]
+    )
+
+    nan = float('nan')
+    metrics = {}
+    for agg_name, sub_agg_expr in agg_expr._aggregations.items():
+        if not isinstance(sub_agg_expr, SingleValueMetricsAgg):
+            continue
+        values = []
+        for raw_bucket in raw_buckets:
+            value = raw_bucket[agg_name]['value']
+            values.append(nan if value is None else value)
+        values = _to_array('d', values)
+        if values is not None:
+            metrics[agg_name] = values
+
+    return BucketColumns(keys, doc_counts, metrics)
+
+
 class MultiBucketAggResult(AggResult):
     bucket_cls = Bucket
 
@@ -683,15 +779,16 @@ class MultiBucketAggResult(AggResult):
                 raw_bucket = raw_bucket.copy()
                 raw_bucket.setdefault('key', key)
                 raw_buckets.append(raw_bucket)
-
-        self._buckets = []
-        self._buckets_map = {}
-        for raw_bucket in raw_buckets:
-            bucket = self.bucket_cls(
-                raw_bucket, agg_expr, self, doc_cls_map=doc_cls_map,
-                mapper_registry=mapper_registry,
-            )
-            self.add_bucket(bucket)
+        self._raw_buckets = raw_buckets
+
+        self._buckets = None
+        self._buckets_map = None
+        if getattr(agg_expr, '_columnar', False):
+            # buckets are created on demand
+            self._doc_cls_map = doc_cls_map
+            self._bucket_mapper_registry = mapper_registry
+        else:
+            self._build_buckets(doc_cls_map, mapper_registry)
 
         self._instance_mapper = instance_mapper
         if mapper_registry is None:
@@ -704,49 +801,76 @@ class MultiBucketAggResult(AggResult):
                 .setdefault(self._instance_mapper, []) \
                 .append(self)
 
+    def _build_buckets(self, doc_cls_map, mapper_registry):
+        self._buckets = []
+        self._buckets_map = {}
+        for raw_bucket in self._raw_buckets:
+            bucket = self.bucket_cls(
+                raw_bucket, self.expr, self, doc_cls_map=doc_cls_map,
+                mapper_registry=mapper_registry,
+            )
+            self.add_bucket(bucket)
+
+    def _get_buckets(self):
+        if self._buckets is None:
+            self._build_buckets(
+                self._doc_cls_map, self._bucket_mapper_registry
+            )
+        return self._buckets
+
+    @cached_property
+    def columns(self):
+        """Buckets as :class:`BucketColumns`."""
+        return _build_bucket_columns(
+            self.expr, self.bucket_cls, self._raw_buckets
+        )
+
     def add_bucket(self, bucket):
+        if self._buckets is None:
+            self._get_buckets()
         self._buckets.append(bucket)
         if bucket.key is not None:
             self._buckets_map[bucket.key] = bucket
 
     def get_bucket(self, key):
+        self._get_buckets()
         return self._buckets_map.get(key)
 
     @property
     def buckets(self):
-        return list(self._buckets)
+        return list(self._get_buckets())
 
     def __iter__(self):
-        return iter(self._buckets)
+        return iter(self._get_buckets())
+
+    def _get_instance_targets(self, instance_mapper):
+        return [(bucket.key, bucket) for bucket in self._get_buckets()]
 
     def _populate_instances(self):
-        buckets = list(chain(
-            *(
-                a._buckets for a in
-                self._mapper_registry.get(self._instance_mapper, [self])
-            )
-        ))
-        keys = [bucket.key for bucket in buckets]
-        instances = (
-            self._instance_mapper(keys) if self._instance_mapper else {}
-        )
-        for bucket in buckets:
-            bucket.__dict__['instance'] = instances.get(bucket.key)
+        agg_results = self._mapper_registry.get(self._instance_mapper, [self])
+        populate_instances(self._instance_mapper, list(chain(*(
+            r._get_instance_targets(self._instance_mapper)
+            for r in _unique(agg_results)
+        ))))
 
 
 class MultiBucketAgg(BucketAgg):
     result_cls = MultiBucketAggResult
 
-    def __init__(self, type=None, instance_mapper=None, **kwargs):
+    def __init__(
+            self, type=None, instance_mapper=None, columnar=False, **kwargs
+    ):
         super(MultiBucketAgg, self).__init__(**kwargs)
         self._type = instantiate(type or Type)
         self._instance_mapper = instance_mapper
+        self._columnar = columnar
 
     def clone(self):
         return self.__class__(
             aggs=self._aggregations,
             type=self._type,
             instance_mapper=self._instance_mapper,
+            columnar=self._columnar,
             **self.params
         )
 
@@ -784,6 +908,7 @@ class Terms(MultiBucketAgg):
             type=self._type,
             aggs=self._aggregations,
             instance_mapper=self._instance_mapper,
+            columnar=self._columnar,
             **self.params
         )
 
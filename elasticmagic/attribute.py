@@ -16,6 +16,8 @@ def _attributed_field_factory(
 class AttributedField(Expression, FieldOperators):
     __visit_name__ = 'attributed_field'
 
+    _fingerprint_exclude = ('_dynamic_fields', '_sub_fields')
+
     def __init__(self, parent, attr_name, field):
         self._parent = parent
         self._attr_name = attr_name
@@ -0,0 +1,266 @@
+import json
+import time
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+
+from elasticsearch import TransportError
+
+from .result import ActionResult
+from .result import BulkResult
+from .util import clean_params
+
+TOO_MANY_REQUESTS = 429
+
+
+class BaseBulkIndexer(object):
+    def __init__(
+            self, cluster, chunk_size=500, max_chunk_bytes=10 * 1024 * 1024,
+            max_retries=3, initial_backoff=1.0, max_backoff=60.0,
+            json_dumps=None, **params
+    ):
+        self._cluster = cluster
+        self.chunk_size = chunk_size
+        self.max_chunk_bytes = max_chunk_bytes
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self._json_dumps = json_dumps or cluster._bulk_json_dumps
+        self._params = clean_params(params)
+
+        self.actions = 0
+        self.errors = 0
+        self.retries = 0
+        self.chunks = 0
+        self.bytes = 0
+        self._started_at = None
+        self._finished_at = None
+
+    @property
+    def elapsed(self):
+        """Seconds since the first chunk was compiled."""
+        if self._started_at is None:
+            return 0.0
+        return (self._finished_at or time.monotonic()) - self._started_at
+
+    @property
+    def actions_per_sec(self):
+        elapsed = self.elapsed
+        return self.actions / elapsed if elapsed else 0.0
+
+    @property
+    def bytes_per_sec(self):
+        elapsed = self.elapsed
+        return self.bytes / elapsed if elapsed else 0.0
+
+    def _serialize_action(self, compiled_bulk, action):
+        # every action gets its own buffer, so serialization can run in
+        # several threads and the buffer is joined into a chunk without
+        # copying it
+        buf = bytearray()
+        compiled_bulk.write_action(buf, action, self._json_dumps)
+        return buf
+
+    def _serialize_actions(self, compiled_bulk, actions):
+        return [
+            self._serialize_action(compiled_bulk, action)
+            for action in actions
+        ]
+
+    def _iter_serialized(self, compiled_bulk, actions):
+        for action in actions:
+            yield self._serialize_action(compiled_bulk, action)
+
+    def _iter_chunks(self, serialized_actions):
+        """Groups serialized actions into chunks limited by ``chunk_size``
+        and ``max_chunk_bytes``.
+        """
+        chunk = []
+        chunk_bytes = 0
+        for data in serialized_actions:
+            if self._started_at is None:
+                self._started_at = time.monotonic()
+            if chunk and (
+                    len(chunk) >= self.chunk_size or
+                    chunk_bytes + len(data) > self.max_chunk_bytes
+            ):
+                yield chunk
+                chunk = []
+                chunk_bytes = 0
+            chunk.append(data)
+            chunk_bytes += len(data)
+        if chunk:
+            yield chunk
+
+    def _get_backoff(self, attempt):
+        return min(self.max_backoff, self.initial_backoff * 2 ** attempt)
+
+    def _process_response(
+            self, chunk, pending, raw_result, results, attempt
+    ):
+        """Stores results of the items and returns indexes of the items that
+        should be retried. Actions missing in the response are retried too.
+        """
+        retry_items = []
+        items = BulkResult(raw_result).items
+        for ix, item in zip(pending, items):
+            if (
+                    item.status == TOO_MANY_REQUESTS and
+                    attempt < self.max_retries
+            ):
+                retry_items.append(ix)
+            else:
+                results[ix] = item
+        for ix in pending[len(items):]:
+            if attempt < self.max_retries:
+                retry_items.append(ix)
+            else:
+                results[ix] = self._make_missing_item_result(chunk[ix])
+        return retry_items
+
+    def _make_missing_item_result(self, data):
+        action_line = bytes(data).split(b'\n', 1)[0]
+        action_name, meta = next(iter(json.loads(action_line).items()))
+        doc_id = meta.get('_id')
+        return ActionResult({
+            action_name: {
+                '_index': meta.get('_index', self._params.get('index')),
+                '_type': meta.get('_type'),
+                '_id': str(doc_id) if doc_id is not None else None,
+                'status': None,
+                'error': {
+                    'type': 'missing_item',
+                    'reason': 'Bulk response does not contain the action',
+                },
+            }
+        })
+
+    def _should_retry_request(self, error, attempt):
+        return (
+            error.status_code == TOO_MANY_REQUESTS and
+            attempt < self.max_retries
+        )
+
+    def _complete_chunk(self, chunk_stats):
+        results, retries, sent_bytes = chunk_stats
+        self.chunks += 1
+        self.actions += len(results)
+        self.errors += sum(1 for r in results if r.error is not None)
+        self.retries += retries
+        self.bytes += sent_bytes
+        return results
+
+    def _finish(self):
+        if self._finished_at is None and self._started_at is not None:
+            self._finished_at = time.monotonic()
+
+    def __repr__(self):
+        return (
+            '<{} actions={} errors={} retries={} actions_per_sec={:.2f}>'
+        ).format(
+            self.__class__.__name__, self.actions, self.errors,
+            self.retries, self.actions_per_sec
+        )
+
+
+class BulkIndexer(BaseBulkIndexer):
+    """Sends a stream of actions using bulk api.
+
+    Actions are compiled and serialized one by one and sent in chunks
+    limited by ``chunk_size`` actions and ``max_chunk_bytes`` bytes, so the
+    whole stream is never kept in memory. Up to ``concurrency`` chunks are
+    sent at the same time from a thread pool. Items rejected with 429 status
+    (and whole requests rejected with 429) are retried up to
+    ``max_retries`` times with exponential backoff starting from
+    ``initial_backoff`` seconds.
+
+    Other keyword arguments are passed to the bulk api.
+
+    .. code-block:: python
+
+       indexer = BulkIndexer(cluster, index='products', concurrency=4)
+       for action_result in indexer.send(actions):
+           if action_result.error:
+               log_error(action_result)
+       print(indexer.actions_per_sec)
+    """
+
+    _sleep = staticmethod(time.sleep)
+
+    def __init__(self, cluster, concurrency=1, **kwargs):
+        super(BulkIndexer, self).__init__(cluster, **kwargs)
+        self.concurrency = concurrency
+
+    def send(self, actions):
+        """Sends actions and yields :class:`.result.ActionResult` for every
+        action. Results of a chunk are yielded when the chunk is completed.
+        """
+        chunks = self._iter_chunks(
+            self._iter_serialized(
+                self._cluster.get_compiler().compiled_bulk, actions
+            )
+        )
+        try:
+            if self.concurrency <= 1:
+                for chunk in chunks:
+                    for action_result in self._complete_chunk(
+                            self._send_chunk(chunk)
+                    ):
+                        yield action_result
+            else:
+                for action_result in self._send_concurrently(chunks):
+                    yield action_result
+        finally:
+            self._finish()
+
+    def _send_concurrently(self, chunks):
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        in_flight = set()
+        try:
+            for chunk in chunks:
+                if len(in_flight) >= self.concurrency:
+                    done, in_flight = wait(
+                        in_flight, return_when=FIRST_COMPLETED
+                    )
+                    for future in done:
+                        for action_result in self._complete_chunk(
+                                future.result()
+                        ):
+                            yield action_result
+                in_flight.add(executor.submit(self._send_chunk, chunk))
+            while in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for action_result in self._complete_chunk(
+                            future.result()
+                    ):
+                        yield action_result
+        finally:
+            executor.shutdown()
+
+    def _send_chunk(self, chunk):
+        client = self._cluster.get_client()
+        results = [None] * len(chunk)
+        pending = list(range(len(chunk)))
+        retries = 0
+        sent_bytes = 0
+        attempt = 0
+        while True:
+            body = b''.join(chunk[ix] for ix in pending)
+            sent_bytes += len(body)
+            try:
+                raw_result = client.bulk(body=body, **self._params)
+            except TransportError as e:
+                if not self._should_retry_request(e, attempt):
+                    raise
+                retry_items = pending
+            else:
+                retry_items = self._process_response(
+                    chunk, pending, raw_result, results, attempt
+                )
+            if not retry_items:
+                return results, retries, sent_bytes
+            retries += len(retry_items)
+            self._sleep(self._get_backoff(attempt))
+            attempt += 1
+            pending = retry_items
@@ -0,0 +1,185 @@
+import hashlib
+import json
+import threading
+from collections.abc import Sequence
+
+from .expression import Expression
+from .util import LRUCache
+from .util import collect_doc_classes
+
+
+class BaseResultCache(object):
+    """Base class of the search result caches.
+
+    Raw responses are stored by keys built from the hosts of the cluster and
+    the compiled request (endpoint, params including index and body). To use
+    an external storage implement :meth:`_get` and :meth:`_set`, keys are
+    strings and values are JSON serializable dictionaries. Asynchronous
+    clusters call the cache in an executor unless ``blocking`` is false:
+
+    .. code-block:: python
+
+       class RedisResultCache(BaseResultCache):
+           def __init__(self, redis):
+               super().__init__()
+               self.redis = redis
+
+           def _get(self, key):
+               value = self.redis.get(key)
+               return json.loads(value) if value is not None else None
+
+           def _set(self, key, raw_result, ttl):
+               self.redis.set(key, json.dumps(raw_result), ex=ttl)
+    """
+
+    key_prefix = 'elasticmagic:'
+    blocking = True
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        if not total:
+            return 0.0
+        return self.hits / total
+
+    def make_key(self, request_key):
+        return self.key_prefix + hashlib.sha1(
+            '\n'.join(request_key).encode('utf-8')
+        ).hexdigest()
+
+    def get(self, key):
+        """Returns cached raw result or ``None``."""
+        raw_result = self._get(key)
+        with self._stats_lock:
+            if raw_result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return raw_result
+
+    def set(self, key, raw_result, ttl=None):
+        self._set(key, raw_result, ttl)
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def _set(self, key, raw_result, ttl):
+        raise NotImplementedError
+
+
+class LRUResultCache(BaseResultCache):
+    """In-process result cache that keeps at most ``maxsize`` recently used
+    results with total size at most ``maxbytes``. Results are stored as JSON,
+    so every hit gets its own copy and the size of a result is the length of
+    its JSON representation.
+    """
+
+    blocking = False
+
+    def __init__(self, maxsize=1024, maxbytes=64 * 1024 * 1024, ttl=None):
+        super(LRUResultCache, self).__init__()
+        self._cache = LRUCache(
+            maxsize=maxsize, ttl=ttl,
+            maxbytes=maxbytes, sizeof=len,
+        )
+
+    @property
+    def size_bytes(self):
+        return self._cache.size_bytes
+
+    def __len__(self):
+        return len(self._cache)
+
+    def clear(self):
+        self._cache.clear()
+
+    def _get(self, key):
+        value = self._cache.get(key)
+        if value is None:
+            return None
+        return json.loads(value)
+
+    def _set(self, key, raw_result, ttl):
+        self._cache.set(
+            key, json.dumps(raw_result, separators=(',', ':')), ttl=ttl
+        )
+
+
+class CompiledExpressionCache(object):
+    """Keeps compiled bodies of query and aggregation expressions between
+    compilations, so filters and aggregations that are reused by many
+    queries are compiled once.
+
+    By default expressions are cached by identity, so only the same
+    expression objects share a compiled body. With ``structural=True``
+    equal expressions are cached by their
+    :meth:`~elasticmagic.expression.Expression.fingerprint`, which also
+    covers expressions that are built anew for every query but requires
+    hashing them.
+
+    Compiled bodies share the cached parts so they must not be modified.
+    """
+
+    _doc_classes_key = 'doc_classes'
+
+    def __init__(self, maxsize=1024, structural=False):
+        self.structural = structural
+        self.hits = 0
+        self.misses = 0
+        self._cache = LRUCache(maxsize=maxsize)
+        self._stats_lock = threading.Lock()
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        if not total:
+            return 0.0
+        return self.hits / total
+
+    def __len__(self):
+        return len(self._cache)
+
+    def clear(self):
+        self._cache.clear()
+
+    def make_key(self, compiled_key, expr):
+        if self.structural:
+            return compiled_key, expr.fingerprint()
+        return compiled_key, id(expr)
+
+    def get(self, key, expr):
+        """Returns cached compiled body of the expression or ``None``."""
+        cached = self._cache.get(key)
+        # cached expression is kept alive so its id cannot be reused
+        found = cached is not None and (
+            self.structural or cached[0] is expr
+        )
+        with self._stats_lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return cached[1] if found else None
+
+    def set(self, key, expr, body):
+        self._cache.set(key, (None if self.structural else expr, body))
+
+    def collect_doc_classes(self, expr):
+        """Same as :func:`~elasticmagic.util.collect_doc_classes` but caches
+        document classes of the expressions.
+        """
+        if isinstance(expr, Sequence) and not isinstance(expr, str):
+            return set().union(*map(self.collect_doc_classes, expr))
+        if not isinstance(expr, Expression):
+            return collect_doc_classes(expr)
+        key = self.make_key(self._doc_classes_key, expr)
+        doc_classes = self.get(key, expr)
+        if doc_classes is None:
+            doc_classes = frozenset(collect_doc_classes(expr))
+            self.set(key, expr, doc_classes)
+        return doc_classes
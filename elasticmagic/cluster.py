@@ -1,29 +1,100 @@
+import gzip
+import json
+import uuid
 from abc import ABCMeta
+from urllib.parse import urlencode
+
+from elasticsearch import ConnectionError
+from elasticsearch import ConnectionTimeout
+from elasticsearch import TransportError
+from urllib3 import HTTPConnectionPool
+from urllib3.exceptions import HTTPError
+from urllib3.exceptions import ReadTimeoutError
 
 from .compiler import (
     ESVersion,
     get_compiler_by_es_version,
 )
+from .bulk import BulkIndexer
 from .index import Index
 from .result import (
     ClearScrollResult,
+    ClosePointInTimeResult,
     FlushResult,
+    OpenPointInTimeResult,
     RefreshResult,
 )
 from .search import SearchQuery
+from .stream import DEFAULT_CHUNK_SIZE
+from .util import SingleFlight
 from .util import clean_params
 
 MAX_RESULT_WINDOW = 10000
 
 
+def _iter_response_chunks(response):
+    try:
+        for chunk in response.stream(DEFAULT_CHUNK_SIZE):
+            yield chunk
+    finally:
+        response.release_conn()
+
+
+def _open_raw_response(connection, method, path, params, body):
+    """Sends a request using the connection and returns the response body.
+    Bodies of the urllib3 connections are read lazily by chunks.
+    """
+    pool = getattr(connection, 'pool', None)
+    if not isinstance(pool, HTTPConnectionPool):
+        _, _, raw_data = connection.perform_request(
+            method, path, params, body
+        )
+        return raw_data
+
+    url = connection.url_prefix + path
+    if params:
+        url = '{}?{}'.format(url, urlencode(params))
+    headers = connection.headers.copy()
+    if connection.http_compress and body:
+        body = gzip.compress(body)
+        headers['content-encoding'] = 'gzip'
+    try:
+        response = pool.urlopen(
+            method, url, body, headers=headers, retries=False,
+            preload_content=False,
+        )
+    except ReadTimeoutError as e:
+        raise ConnectionTimeout('TIMEOUT', str(e), e)
+    except HTTPError as e:
+        raise ConnectionError('N/A', str(e), e)
+    if not 200 <= response.status < 300:
+        raw_data = response.data.decode('utf-8', 'surrogatepass')
+        response.release_conn()
+        connection._raise_error(response.status, raw_data)
+    return _iter_response_chunks(response)
+
+
+def _get_result_cache_namespace(client):
+    """Returns a key part that separates cached results of different
+    clusters. Clients with the same hosts share cached results, so
+    an external cache can be shared by several processes.
+    """
+    hosts = getattr(getattr(client, 'transport', None), 'hosts', None)
+    if isinstance(hosts, list) and hosts:
+        return json.dumps(hosts, sort_keys=True, default=str)
+    return uuid.uuid4().hex
+
+
 class BaseCluster(metaclass=ABCMeta):
     _index_cls = None
     _search_query_cls = None
+    _single_flight_cls = None
 
     def __init__(
             self, client, index_cls=None,
             multi_search_raise_on_error=True,
             autodetect_es_version=True, compiler=None,
+            bulk_json_dumps=None, coalesce_requests=False,
     ):
         self._client = client
         self._index_cls = index_cls or self._index_cls
@@ -34,6 +105,15 @@ class BaseCluster(metaclass=ABCMeta):
         )
         self._autodetect_es_version = autodetect_es_version
         self._compiler = compiler
+        # when set bulk bodies are serialized into NDJSON bytes by
+        # the compiler instead of the client's serializer
+        self._bulk_json_dumps = bulk_json_dumps
+        # when enabled concurrent identical read requests share
+        # a single response
+        self._single_flight = (
+            self._single_flight_cls() if coalesce_requests else None
+        )
+        self._result_cache_namespace = _get_result_cache_namespace(client)
         self._index_cache = {}
         self._es_version = None
 
@@ -51,6 +131,46 @@ class BaseCluster(metaclass=ABCMeta):
     def get_client(self):
         return self._client
 
+    @property
+    def coalesced_requests(self):
+        """Number of requests that were served by a concurrent identical
+        request.
+        """
+        if self._single_flight is None:
+            return 0
+        return self._single_flight.shared
+
+    def _get_request_key(self, compiled_query):
+        if (
+                self._single_flight is None and
+                compiled_query.result_cache is None
+        ):
+            return None
+        return compiled_query.get_request_key()
+
+    def _make_result_cache_key(self, result_cache, request_key):
+        return result_cache.make_key(
+            (self._result_cache_namespace,) + tuple(request_key)
+        )
+
+    def _get_cached_response(self, compiled_query, request_key):
+        if request_key is None or compiled_query.result_cache is None:
+            return None
+        result_cache = compiled_query.result_cache
+        return result_cache.get(
+            self._make_result_cache_key(result_cache, request_key)
+        )
+
+    def _cache_response(self, compiled_query, request_key, raw_result):
+        if request_key is None or compiled_query.result_cache is None:
+            return
+        result_cache = compiled_query.result_cache
+        result_cache.set(
+            self._make_result_cache_key(result_cache, request_key),
+            raw_result,
+            ttl=compiled_query.result_cache_ttl,
+        )
+
     def search_query(self, *args, **kwargs):
         """Returns a :class:`search.SearchQuery` instance that is bound to this
         cluster.
@@ -90,11 +210,20 @@ class BaseCluster(metaclass=ABCMeta):
         return self._preprocess_params(params, 'q', 'doc_or_id', 'doc_cls')
 
     def _scroll_params(self, params):
-        return self._preprocess_params(params, 'doc_cls', 'instance_mapper')
+        return self._preprocess_params(
+            params, 'doc_cls', 'instance_mapper', 'lazy_hits',
+            'compact_documents'
+        )
 
     def _clear_scroll_result(self, raw_result):
         return ClearScrollResult(raw_result)
 
+    def _open_point_in_time_result(self, raw_result):
+        return OpenPointInTimeResult(raw_result)
+
+    def _close_point_in_time_result(self, raw_result):
+        return ClosePointInTimeResult(raw_result)
+
     def _multi_search_params(self, params):
         params = self._preprocess_params(params, 'queries')
         raise_on_error = params.pop(
@@ -134,18 +263,76 @@ class BaseCluster(metaclass=ABCMeta):
 class Cluster(BaseCluster):
     _index_cls = Index
     _search_query_cls = SearchQuery
+    _single_flight_cls = SingleFlight
 
     def _do_request(self, compiler, *args, **kwargs):
-        compiled_query = compiler(*args, **kwargs)
+        return self._do_compiled_request(compiler(*args, **kwargs))
+
+    def _do_compiled_request(self, compiled_query):
         api_method = compiled_query.api_method(self._client)
-        if compiled_query.body is None:
-            raw_res = api_method(**compiled_query.params)
+        request_key = self._get_request_key(compiled_query)
+        raw_res = self._get_cached_response(compiled_query, request_key)
+        if raw_res is not None:
+            return compiled_query.process_result(raw_res)
+        if request_key is None or self._single_flight is None:
+            raw_res = self._do_api_call(
+                api_method, compiled_query.params, compiled_query.body
+            )
         else:
-            raw_res = api_method(
-                body=compiled_query.body, **compiled_query.params
+            raw_res = self._single_flight.do(
+                request_key, self._do_api_call,
+                api_method, compiled_query.params, compiled_query.body
             )
+        self._cache_response(compiled_query, request_key, raw_res)
         return compiled_query.process_result(raw_res)
 
+    def _do_api_call(self, api_method, api_kwargs, body):
+        if body is None:
+            return api_method(**api_kwargs)
+        return api_method(body=body, **api_kwargs)
+
+    def _do_stream_request(self, compiled_query):
+        method, path, params, body = compiled_query.api_raw_request()
+        if body is not None:
+            body = self._client.transport.serializer.dumps(body) \
+                .encode('utf-8')
+        raw_stream = self._perform_raw_request(method, path, params, body)
+        return compiled_query.process_stream(raw_stream)
+
+    def _perform_raw_request(self, method, path, params, body):
+        """Performs a request and returns a raw response body without
+        deserializing it. The result can be a ``str``, ``bytes``, a file-like
+        object or an iterable of chunks. Responses of the urllib3
+        connections are read from the socket while they are being parsed,
+        other connections read the whole body.
+
+        Failed requests are retried and connections are marked as dead
+        the same way the transport of the client does it.
+        """
+        transport = self._client.transport
+        for attempt in range(transport.max_retries + 1):
+            connection = transport.get_connection()
+            try:
+                raw_data = _open_raw_response(
+                    connection, method, path, params, body
+                )
+            except TransportError as e:
+                if isinstance(e, ConnectionTimeout):
+                    retry = transport.retry_on_timeout
+                elif isinstance(e, ConnectionError):
+                    retry = True
+                else:
+                    retry = e.status_code in transport.retry_on_status
+                if not retry or attempt == transport.max_retries:
+                    raise
+                try:
+                    transport.mark_dead(connection)
+                except TransportError:
+                    pass
+            else:
+                transport.connection_pool.mark_live(connection)
+                return raw_data
+
     def get_compiler(self):
         if self._compiler:
             return self._compiler
@@ -192,6 +379,20 @@ class Cluster(BaseCluster):
             q, self._search_params(locals())
         )
 
+    def stream_search(
+            self, q, index=None, doc_type=None, routing=None, preference=None,
+            timeout=None, search_type=None, query_cache=None,
+            terminate_after=None, scroll=None, stats=None, **kwargs
+    ):
+        """Same as :meth:`search` but parses the response incrementally and
+        returns :class:`~elasticmagic.result.StreamingSearchResult`.
+        """
+        return self._do_stream_request(
+            self.get_compiler().compiled_search_query(
+                q, self._search_params(locals())
+            )
+        )
+
     def explain(
             self, q, doc_or_id, index, doc_cls=None, routing=None, **kwargs
     ):
@@ -220,12 +421,36 @@ class Cluster(BaseCluster):
 
     def scroll(
             self, scroll_id, scroll, doc_cls=None, instance_mapper=None,
-            **kwargs
+            lazy_hits=False, compact_documents=False, **kwargs
     ):
         return self._do_request(
             self.get_compiler().compiled_scroll,
             self._scroll_params(locals()),
-            doc_cls=doc_cls, instance_mapper=instance_mapper
+            doc_cls=doc_cls, instance_mapper=instance_mapper,
+            lazy_hits=lazy_hits, compact_documents=compact_documents,
+        )
+
+    def stream_scroll(self, scroll_id, scroll, doc_cls=None, **kwargs):
+        """Same as :meth:`scroll` but parses the response incrementally and
+        returns :class:`~elasticmagic.result.StreamingSearchResult`.
+        """
+        params = self._preprocess_params(locals(), 'doc_cls')
+        return self._do_stream_request(
+            self.get_compiler().compiled_scroll(params, doc_cls=doc_cls)
+        )
+
+    def open_point_in_time(self, index, keep_alive, **kwargs):
+        params = self._preprocess_params(locals())
+        return self._open_point_in_time_result(
+            self._client.open_point_in_time(**params)
+        )
+
+    def close_point_in_time(self, pit_id, **kwargs):
+        params = self._preprocess_params(locals(), 'pit_id')
+        return self._close_point_in_time_result(
+            self._client.close_point_in_time(
+                body={'id': pit_id}, **params
+            )
         )
 
     def clear_scroll(self, scroll_id, **kwargs):
@@ -295,9 +520,16 @@ class Cluster(BaseCluster):
     ):
         return self._do_request(
             self.get_compiler().compiled_bulk,
-            actions, self._bulk_params(locals())
+            actions, self._bulk_params(locals()),
+            json_dumps=self._bulk_json_dumps,
         )
 
+    def bulk_indexer(self, **kwargs):
+        """Returns :class:`.bulk.BulkIndexer` that sends a stream of actions
+        to this cluster in chunks.
+        """
+        return BulkIndexer(self, **kwargs)
+
     def refresh(self, index=None, **kwargs):
         params = self._preprocess_params(locals())
         return self._refresh_result(
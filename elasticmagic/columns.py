@@ -0,0 +1,257 @@
+import datetime
+from array import array
+
+from .types import Boolean
+from .types import Date
+from .types import Float
+from .types import Type
+from .types import _Float
+from .types import _Int
+
+# columns that are taken from the hit itself rather than from the source
+META_COLUMN_TYPES = {
+    '_id': None,
+    '_index': None,
+    '_type': None,
+    '_routing': None,
+    '_score': Float(),
+}
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_EPOCH_TZ = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+_MISSING = object()
+
+
+def _make_date_converter(date_type):
+    def to_epoch_millis(value):
+        if isinstance(value, (int, float)):
+            return int(value)
+        if not isinstance(value, datetime.datetime):
+            value = date_type.to_python(value)
+        epoch = _EPOCH if value.tzinfo is None else _EPOCH_TZ
+        return (value - epoch) // datetime.timedelta(milliseconds=1)
+    return to_epoch_millis
+
+
+def _to_int(value):
+    # floats with a fractional part are not truncated
+    if isinstance(value, float) and not value.is_integer():
+        raise ValueError(value)
+    return int(value)
+
+
+def _make_bool_converter(bool_type):
+    def to_int(value):
+        # any non-empty list is true for the boolean type
+        if isinstance(value, (list, dict)):
+            raise TypeError(value)
+        return 1 if bool_type.to_python(value) else 0
+    return to_int
+
+
+def _get_typecode_and_converter(field_type):
+    if isinstance(field_type, _Int):
+        return 'q', _to_int
+    if isinstance(field_type, _Float):
+        return 'd', float
+    if isinstance(field_type, Boolean):
+        return 'b', _make_bool_converter(field_type)
+    if isinstance(field_type, Date):
+        # naive dates are considered as UTC
+        return 'q', _make_date_converter(field_type)
+    return None, None
+
+
+class Column(object):
+    """Buffer of a single column.
+
+    Integer, float, boolean and date values are stored in ``values`` as
+    ``array('q')``, ``array('d')``, ``array('b')`` and ``array('q')`` of
+    epoch milliseconds correspondingly. For such columns ``valid`` is a
+    ``bytearray`` where zeros mark missing values. Values of any other types
+    are stored in a list as is and ``valid`` is ``None``.
+
+    When a value cannot be stored in the array (for instance a multi-valued
+    field) the column falls back to a list of python values.
+    """
+
+    def __init__(self, name, field_type=None):
+        self.name = name
+        self.field_type = field_type
+        self.typecode, self._convert = _get_typecode_and_converter(
+            field_type or Type()
+        )
+        if self.typecode:
+            self.values = array(self.typecode)
+            self.valid = bytearray()
+        else:
+            self.values = []
+            self.valid = None
+
+    def __len__(self):
+        return len(self.values)
+
+    def append(self, value):
+        if self.typecode is None:
+            self.values.append(value)
+            return
+        if value is None:
+            self.values.append(0)
+            self.valid.append(0)
+            return
+        try:
+            value = self._convert(value)
+            self.values.append(value)
+        except (TypeError, ValueError, OverflowError):
+            self._fallback_to_list()
+            self.values.append(value)
+            return
+        self.valid.append(1)
+
+    def _fallback_to_list(self):
+        self.values = self.to_list()
+        self.typecode = None
+        self.valid = None
+
+    def to_list(self):
+        """Returns column values as a list with ``None`` for missing values.
+        Dates are returned as epoch milliseconds.
+        """
+        if self.valid is None:
+            return list(self.values)
+        return [
+            value if is_valid else None
+            for value, is_valid in zip(self.values, self.valid)
+        ]
+
+    def to_numpy(self):
+        """Returns NumPy array. Integer, float and date arrays share memory
+        with the column buffer. Typed columns with missing values are
+        returned as masked arrays.
+        """
+        import numpy as np
+
+        if self.typecode is None:
+            return np.array(self.values, dtype=object)
+
+        values = np.frombuffer(self.values, dtype=self.typecode)
+        if isinstance(self.field_type, Date):
+            values = values.view('datetime64[ms]')
+        elif isinstance(self.field_type, Boolean):
+            values = values.astype(bool)
+        valid = np.frombuffer(self.valid, dtype=np.uint8)
+        if valid.all():
+            return values
+        return np.ma.masked_array(values, mask=valid == 0)
+
+
+class HitColumns(object):
+    """Columns of the search hits. Every column is a :class:`Column`."""
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def __len__(self):
+        for column in self.columns.values():
+            return len(column)
+        return 0
+
+    def keys(self):
+        return self.columns.keys()
+
+    def to_dict(self):
+        return {
+            name: column.to_list() for name, column in self.columns.items()
+        }
+
+    def to_numpy(self):
+        return {
+            name: column.to_numpy() for name, column in self.columns.items()
+        }
+
+
+class HitColumnsBuilder(object):
+    """Writes raw hits into :class:`HitColumns` without creating documents.
+
+    :param fields: list of attributed fields (``Product.price``) or field
+       names. By default ``_id`` and all fields of the document classes are
+       used
+    :param doc_classes: document classes that are used to find types of the
+       fields passed by name
+    """
+
+    def __init__(self, fields=None, doc_classes=None):
+        doc_classes = list(doc_classes or [])
+        if fields is None:
+            fields = ['_id']
+            for doc_cls in doc_classes:
+                for attr_field in doc_cls.user_fields:
+                    if attr_field.get_field_name() not in fields:
+                        fields.append(attr_field.get_field_name())
+
+        self._columns = []
+        for field in fields:
+            if isinstance(field, str):
+                name = field
+                field_type = self._find_field_type(name, doc_classes)
+            else:
+                name = field.get_field_name()
+                field_type = field.get_type()
+            if name in META_COLUMN_TYPES:
+                path = None
+                field_type = META_COLUMN_TYPES[name] or field_type
+            else:
+                path = tuple(name.split('.'))
+            self._columns.append((name, path, field_type))
+
+    @staticmethod
+    def _find_field_type(name, doc_classes):
+        for doc_cls in doc_classes:
+            attr_field = doc_cls._field_name_map.get(name)
+            if attr_field is not None:
+                return attr_field.get_type()
+        return None
+
+    def build(self, raw_hits):
+        columns = HitColumns({
+            name: Column(name, field_type)
+            for name, _, field_type in self._columns
+        })
+        return self.extend(columns, raw_hits)
+
+    def extend(self, hit_columns, raw_hits):
+        """Appends raw hits to the columns."""
+        columns = [
+            (hit_columns[name].append, name, path)
+            for name, path, _ in self._columns
+        ]
+        for hit in raw_hits:
+            source = hit.get('_source') or {}
+            fields = None
+            for append, name, path in columns:
+                if path is None:
+                    append(hit.get(name))
+                    continue
+                value = source
+                for key in path:
+                    if not isinstance(value, dict):
+                        value = _MISSING
+                        break
+                    value = value.get(key, _MISSING)
+                if value is _MISSING:
+                    if fields is None:
+                        fields = hit.get('fields') or {}
+                    value = fields.get(name)
+                    if isinstance(value, list) and len(value) == 1:
+                        value = value[0]
+                append(value)
+        return hit_columns
@@ -1,17 +1,24 @@
+import copy
+import json
 from collections import OrderedDict
 from collections import namedtuple
 from collections.abc import Iterable, Mapping
 from functools import partial
+from functools import wraps
+from urllib.parse import quote
 
 from elasticsearch import ElasticsearchException
+from elasticsearch.serializer import JSONSerializer
 
 from elasticmagic.attribute import AttributedField
+from .agg import AggExpression
 from .document import DOC_TYPE_JOIN_FIELD
 from .document import DOC_TYPE_FIELD
 from .document import DOC_TYPE_NAME_FIELD
 from .document import DOC_TYPE_PARENT_FIELD
 from .document import Document
 from .document import DynamicDocument
+from .document import _make_source_field
 from .document import get_doc_type_for_hit
 from .document import mk_uid
 from .expression import Bool
@@ -22,6 +29,11 @@ from .expression import Ids
 from .expression import MatchPhrase
 from .expression import MatchPhrasePrefix
 from .expression import Params
+from .expression import QueryExpression
+from .optimizer import FILTER
+from .optimizer import QUERY
+from .optimizer import SCORE
+from .optimizer import OptimizationReport
 from .expression import Terms
 from .result import BulkResult
 from .result import CountResult
@@ -31,8 +43,10 @@ from .result import ExistsResult
 from .result import ExplainResult
 from .result import PutMappingResult
 from .result import SearchResult
+from .result import StreamingSearchResult
 from .search import BaseSearchQuery
 from .search import SearchQueryContext
+from .types import Date
 from .types import ValidationError
 from .util import collect_doc_classes
 
@@ -115,6 +129,60 @@ def _mk_doc_type(doc_types):
     return ','.join(doc_types)
 
 
+class ParamSlot(object):
+    """Marks the place of a :class:`.Param` in a prepared body template.
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return '<ParamSlot {}>'.format(self.name)
+
+
+def _collect_param_slots(node):
+    """Returns a tree of paths to the parameter slots. Leaves of the tree
+    are parameter names.
+    """
+    if isinstance(node, ParamSlot):
+        return node.name
+    if isinstance(node, dict):
+        items = node.items()
+    elif isinstance(node, list):
+        items = enumerate(node)
+    else:
+        return None
+
+    slots = {}
+    for key, value in items:
+        if isinstance(key, ParamSlot):
+            raise CompilationError(
+                'Parameter cannot be used as a key: [{}]'.format(key.name)
+            )
+        value_slots = _collect_param_slots(value)
+        if value_slots is not None:
+            slots[key] = value_slots
+    return slots or None
+
+
+def _iter_param_slot_names(slots):
+    if isinstance(slots, dict):
+        for value_slots in slots.values():
+            yield from _iter_param_slot_names(value_slots)
+    elif slots is not None:
+        yield slots
+
+
+def _bind_param_slots(node, slots, values):
+    # only containers on the way to the slots are copied,
+    # all other subtrees are shared with the template
+    if not isinstance(slots, dict):
+        return values[slots]
+    node = node.copy()
+    for key, value_slots in slots.items():
+        node[key] = _bind_param_slots(node[key], value_slots, values)
+    return node
+
+
 def _mk_doc_cls_map(doc_classes, requires_doc_type):
     if doc_classes is None:
         doc_classes = ()
@@ -132,10 +200,74 @@ def _mk_doc_cls_map(doc_classes, requires_doc_type):
     return doc_cls_map
 
 
+def _visit_dynamic(compiled, expr, **kwargs):
+    visit_name = None
+    if hasattr(expr, '__visit_name__'):
+        visit_name = expr.__visit_name__
+
+    if visit_name:
+        visit_func = getattr(compiled, 'visit_{}'.format(visit_name))
+        return visit_func(expr, **kwargs)
+
+    if isinstance(expr, dict):
+        return compiled.visit_dict(expr)
+
+    if isinstance(expr, (list, tuple)):
+        return compiled.visit_list(expr)
+
+    return expr
+
+
+def _visit_dict(compiled, expr, **kwargs):
+    return compiled.visit_dict(expr)
+
+
+def _visit_list(compiled, expr, **kwargs):
+    return compiled.visit_list(expr)
+
+
+def _visit_as_is(compiled, expr, **kwargs):
+    return expr
+
+
+def _memoized(visit_func):
+    @wraps(visit_func)
+    def visit_memoized(compiled, expr, **kwargs):
+        cache = compiled.compiled_cache
+        # without the compiled cache every occurrence of an expression
+        # gets its own body that can be modified independently
+        if kwargs or cache is None:
+            return visit_func(compiled, expr, **kwargs)
+
+        memoized = compiled._memo.get(id(expr))
+        if memoized is not None and memoized[0] is expr:
+            return memoized[1]
+
+        key = cache.make_key(compiled._compiled_cache_key, expr)
+        body = cache.get(key, expr)
+        if body is None:
+            body = visit_func(compiled, expr)
+            cache.set(key, expr, body)
+        # keeps the expression alive so its id is not reused
+        # during compilation
+        compiled._memo[id(expr)] = (expr, body)
+        return body
+
+    return visit_memoized
+
+
 class Compiled(object):
     compiler = None
     features = None
 
+    # maps expression type to an unbound visitor function,
+    # every subclass gets its own table (see ``__init_subclass__``)
+    _dispatch_table = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._dispatch_table = {}
+
     def __init__(self, expression, params=None):
         self.expression = expression
         self.body = self.visit(expression)
@@ -144,22 +276,31 @@ class Compiled(object):
     def prepare_params(self, params):
         return params
 
-    def visit(self, expr, **kwargs):
-        visit_name = None
-        if hasattr(expr, '__visit_name__'):
-            visit_name = expr.__visit_name__
-
+    @classmethod
+    def _resolve_visitor(cls, expr):
+        expr_cls = expr.__class__
+        visit_name = getattr(expr_cls, '__visit_name__', None)
+        if visit_name != getattr(expr, '__visit_name__', None):
+            # visit name is computed per instance (property) or
+            # the expression is a class itself (document class)
+            return _visit_dynamic
         if visit_name:
-            visit_func = getattr(self, 'visit_{}'.format(visit_name))
-            return visit_func(expr, **kwargs)
+            if not isinstance(visit_name, str):
+                return _visit_dynamic
+            return getattr(cls, 'visit_{}'.format(visit_name))
+        if issubclass(expr_cls, dict):
+            return _visit_dict
+        if issubclass(expr_cls, (list, tuple)):
+            return _visit_list
+        return _visit_as_is
 
-        if isinstance(expr, dict):
-            return self.visit_dict(expr)
-
-        if isinstance(expr, (list, tuple)):
-            return self.visit_list(expr)
-
-        return expr
+    def visit(self, expr, **kwargs):
+        try:
+            visit_func = self._dispatch_table[expr.__class__]
+        except KeyError:
+            visit_func = self._resolve_visitor(expr)
+            self._dispatch_table[expr.__class__] = visit_func
+        return visit_func(self, expr, **kwargs)
 
     def visit_params(self, params):
         res = {}
@@ -188,19 +329,98 @@ class Compiled(object):
         return self.visit_dict(res)
 
 
+def _make_api_path(*parts):
+    return '/' + '/'.join(
+        quote(str(part), safe=',*') for part in parts if part
+    )
+
+
+def _escape_api_params(params):
+    escaped_params = {}
+    for key, value in params.items():
+        if isinstance(value, bool):
+            value = 'true' if value else 'false'
+        elif isinstance(value, (list, tuple)):
+            value = ','.join(map(str, value))
+        escaped_params[key] = value
+    return escaped_params
+
+
+def _dumps_request_part(value):
+    return json.dumps(
+        value, sort_keys=True, separators=(',', ':'), default=str
+    )
+
+
 class CompiledEndpoint(Compiled):
+    # concurrent identical requests to read-only endpoints can share
+    # a single response (see ``coalesce_requests`` option of a cluster)
+    coalesce = False
+    # cache of the raw responses, see ``SearchQuery.with_result_cache``
+    result_cache = None
+    result_cache_ttl = None
+
+    def get_request_key(self):
+        """Returns a key that identifies the request or ``None`` if
+        the request must not be shared with other callers.
+        """
+        if not self.coalesce or 'scroll' in self.params:
+            return None
+        return (
+            type(self).api_method.__qualname__,
+            _dumps_request_part(self.params),
+            _dumps_request_part(self.body),
+        )
+
     def process_result(self, raw_result):
         raise NotImplementedError
 
+    def api_raw_request(self):
+        """Returns ``(method, path, params, body)`` tuple that is used to make
+        a request bypassing the client when the response should be processed
+        incrementally.
+        """
+        raise NotImplementedError
+
+    def process_stream(self, raw_stream):
+        raise NotImplementedError
+
 
 class CompiledExpression(Compiled):
+    # compiled bodies of the expressions shared between compilations,
+    # see ``SearchQuery.with_compiled_cache``
+    compiled_cache = None
+
     def __init__(self, expr, params=None, doc_classes=None):
         self.doc_classes = doc_classes
+        # with the compiled cache query and aggregation expressions
+        # that occur several times are compiled once
+        self._memo = {}
+        self._compiled_cache_key = (
+            type(self), tuple(doc_classes) if doc_classes else None
+        )
         super(CompiledExpression, self).__init__(expr, params)
 
+    @classmethod
+    def _resolve_visitor(cls, expr):
+        visit_func = super(CompiledExpression, cls)._resolve_visitor(expr)
+        if (
+                visit_func is not _visit_dynamic and
+                isinstance(expr, (QueryExpression, AggExpression))
+        ):
+            return _memoized(visit_func)
+        return visit_func
+
     def visit_literal(self, expr):
         return expr.obj
 
+    def visit_param(self, param):
+        raise CompilationError(
+            'Parameter [{}] can be used only in prepared queries'.format(
+                param.name
+            )
+        )
+
     def visit_field(self, field):
         return field._name
 
@@ -582,12 +802,21 @@ class CompiledExpression(Compiled):
 
 class CompiledSearchQuery(CompiledExpression, CompiledEndpoint):
     features = None
+    coalesce = True
+
+    search_query = None
+    # counters of the optimizer, see ``SearchQuery.with_optimizer``
+    optimization_report = None
 
     def __init__(self, query, params=None):
         if isinstance(query, BaseSearchQuery):
+            self.search_query = query
             expression = query.get_context()
             doc_classes = expression.doc_classes
             self.doc_types = expression.doc_types
+            self.result_cache = expression.result_cache
+            self.result_cache_ttl = expression.result_cache_ttl
+            self.compiled_cache = expression.compiled_cache
         elif query is None:
             expression = None
             doc_classes = None
@@ -624,6 +853,26 @@ class CompiledSearchQuery(CompiledExpression, CompiledEndpoint):
                 self.expression.doc_classes, self.features.requires_doc_type
             ),
             instance_mapper=self.expression.instance_mapper,
+            lazy_hits=self.expression.lazy_hits,
+            compact_documents=self.expression.compact_documents,
+        )
+
+    def api_raw_request(self):
+        params = dict(self.params)
+        path = _make_api_path(
+            params.pop('index', None), params.pop('doc_type', None),
+            '_search'
+        )
+        return 'POST', path, _escape_api_params(params), self.body
+
+    def process_stream(self, raw_stream):
+        return StreamingSearchResult(
+            raw_stream,
+            aggregations=self.expression.aggregations,
+            doc_cls_map=_mk_doc_cls_map(
+                self.expression.doc_classes, self.features.requires_doc_type
+            ),
+            compact_documents=self.expression.compact_documents,
         )
 
     @classmethod
@@ -674,14 +923,31 @@ class CompiledSearchQuery(CompiledExpression, CompiledEndpoint):
         if post_filters:
             return Bool.must(*post_filters)
 
+    def _optimize(self, query_ctx, expr, context):
+        if query_ctx.optimizer is None or expr is None:
+            return expr
+        if self.optimization_report is None:
+            self.optimization_report = OptimizationReport()
+        return query_ctx.optimizer.optimize(
+            expr, context=context, report=self.optimization_report
+        )
+
     def visit_search_query_context(self, query_ctx):
         params = {}
 
         q = self.get_filtered_query(query_ctx, doc_classes=self.doc_classes)
+        # rescorers and min_score depend on the absolute scores
+        q = self._optimize(
+            query_ctx, q,
+            SCORE if query_ctx.min_score is not None or query_ctx.rescores
+            else QUERY
+        )
         if q is not None:
             params['query'] = self.visit(q)
 
-        post_filter = self.get_post_filter(query_ctx)
+        post_filter = self._optimize(
+            query_ctx, self.get_post_filter(query_ctx), FILTER
+        )
         if post_filter:
             params['post_filter'] = self.visit(post_filter)
         if query_ctx.ext:
@@ -699,11 +965,11 @@ class CompiledSearchQuery(CompiledExpression, CompiledEndpoint):
                 query_ctx.aggregations
             )
         if query_ctx.limit is not None:
-            params['size'] = query_ctx.limit
+            params['size'] = self.visit(query_ctx.limit)
         if query_ctx.offset is not None:
-            params['from'] = query_ctx.offset
+            params['from'] = self.visit(query_ctx.offset)
         if query_ctx.min_score is not None:
-            params['min_score'] = query_ctx.min_score
+            params['min_score'] = self.visit(query_ctx.min_score)
         if query_ctx.rescores:
             params['rescore'] = self.visit(query_ctx.rescores)
         if query_ctx.suggest:
@@ -722,10 +988,16 @@ class CompiledSearchQuery(CompiledExpression, CompiledEndpoint):
             self.features.supports_track_total_hits and
             query_ctx.track_total_hits is not None
         ):
-            params['track_total_hits'] = query_ctx.track_total_hits
+            params['track_total_hits'] = self.visit(
+                query_ctx.track_total_hits
+            )
 
         if query_ctx.search_after:
             params['search_after'] = query_ctx.search_after
+        if query_ctx.point_in_time:
+            params['pit'] = query_ctx.point_in_time
+        if query_ctx.scroll_slice:
+            params['slice'] = query_ctx.scroll_slice
 
         self._patch_docvalue_fields(params, self.doc_classes)
         return params
@@ -744,6 +1016,54 @@ class CompiledSearchQuery(CompiledExpression, CompiledEndpoint):
         return search_params
 
 
+class CompiledPreparedSearchQuery(CompiledSearchQuery):
+    """Search query compiled into a body template where every
+    :class:`.Param` is replaced with a :class:`ParamSlot`. Call :meth:`bind`
+    to get a compiled query with the parameter values substituted.
+    """
+
+    def __init__(self, query, params=None):
+        super(CompiledPreparedSearchQuery, self).__init__(query, params)
+        self._slots = _collect_param_slots(self.body)
+        self.param_names = frozenset(_iter_param_slot_names(self._slots))
+
+    def prepare_params(self, params):
+        params = super(CompiledPreparedSearchQuery, self) \
+            .prepare_params(params)
+        if isinstance(self.expression, SearchQueryContext):
+            index = self.expression.index
+            if index and 'index' not in params:
+                params['index'] = index.get_name()
+        return params
+
+    def visit_param(self, param):
+        return ParamSlot(param.name)
+
+    def bind(self, **values):
+        """Returns a copy of the compiled query with bound parameters.
+        Parts of the body without parameters are shared between the template
+        and all bound queries so they must not be modified.
+        """
+        if values.keys() != self.param_names:
+            missing = self.param_names.difference(values)
+            if missing:
+                raise CompilationError(
+                    'Missing values for parameters: {}'.format(
+                        ', '.join(sorted(missing))
+                    )
+                )
+            raise CompilationError(
+                'Unknown parameters: {}'.format(
+                    ', '.join(sorted(set(values) - self.param_names))
+                )
+            )
+        bound = copy.copy(self)
+        if self._slots is not None:
+            bound.body = _bind_param_slots(self.body, self._slots, values)
+        bound.params = dict(self.params)
+        return bound
+
+
 class CompiledExplain(CompiledSearchQuery):
     def __init__(self, query, doc_or_id, params=None, doc_cls=None):
         if isinstance(doc_or_id, Document):
@@ -803,7 +1123,9 @@ class CompiledExplain(CompiledSearchQuery):
     def visit_search_query_context(self, query_ctx):
         body = {}
 
-        q = self.get_filtered_query(query_ctx)
+        q = self._optimize(
+            query_ctx, self.get_filtered_query(query_ctx), SCORE
+        )
         if q is not None:
             body['query'] = self.visit(q)
 
@@ -814,9 +1136,14 @@ class CompiledExplain(CompiledSearchQuery):
 
 
 class CompiledScroll(CompiledEndpoint):
-    def __init__(self, params, doc_cls=None, instance_mapper=None):
+    def __init__(
+            self, params, doc_cls=None, instance_mapper=None,
+            lazy_hits=False, compact_documents=False,
+    ):
         self.doc_cls = doc_cls
         self.instance_mapper = instance_mapper
+        self.lazy_hits = lazy_hits
+        self.compact_documents = compact_documents
         super(CompiledScroll, self).__init__(None, params)
 
     def api_method(self, client):
@@ -829,6 +1156,27 @@ class CompiledScroll(CompiledEndpoint):
                 self.doc_cls, self.features.requires_doc_type
             ),
             instance_mapper=self.instance_mapper,
+            lazy_hits=self.lazy_hits,
+            compact_documents=self.compact_documents,
+        )
+
+    def api_raw_request(self):
+        params = dict(self.params)
+        body = {
+            'scroll_id': params.pop('scroll_id'),
+            'scroll': params.pop('scroll'),
+        }
+        return (
+            'POST', _make_api_path('_search', 'scroll'),
+            _escape_api_params(params), body
+        )
+
+    def process_stream(self, raw_stream):
+        return StreamingSearchResult(
+            raw_stream,
+            doc_cls_map=_mk_doc_cls_map(
+                self.doc_cls, self.features.requires_doc_type
+            ),
         )
 
 
@@ -836,16 +1184,21 @@ class CompiledScalarQuery(CompiledSearchQuery):
     def visit_search_query_context(self, query_ctx):
         params = {}
 
-        q = self.get_filtered_query(query_ctx)
+        q = self._optimize(
+            query_ctx, self.get_filtered_query(query_ctx),
+            FILTER if query_ctx.min_score is None else SCORE
+        )
         if q is not None:
             params['query'] = self.visit(q)
 
-        post_filter = self.get_post_filter(query_ctx)
+        post_filter = self._optimize(
+            query_ctx, self.get_post_filter(query_ctx), FILTER
+        )
         if post_filter:
             params['post_filter'] = self.visit(post_filter)
 
         if query_ctx.min_score is not None:
-            params['min_score'] = query_ctx.min_score
+            params['min_score'] = self.visit(query_ctx.min_score)
         return params
 
 
@@ -875,6 +1228,8 @@ class CompiledExistsQuery(CompiledScalarQuery):
 
 
 class CompiledDeleteByQuery(CompiledScalarQuery):
+    coalesce = False
+
     def api_method(self, client):
         return client.delete_by_query
 
@@ -884,6 +1239,7 @@ class CompiledDeleteByQuery(CompiledScalarQuery):
 
 class CompiledMultiSearch(CompiledEndpoint):
     compiled_search = None
+    coalesce = True
 
     class _MultiQueries(object):
         __visit_name__ = 'multi_queries'
@@ -921,12 +1277,14 @@ class CompiledMultiSearch(CompiledEndpoint):
         return body
 
     def process_result(self, raw_result):
+        results = []
         errors = []
         for raw, query, compiled_query in zip(
                 raw_result['responses'], self.expression, self.compiled_queries
         ):
             result = compiled_query.process_result(raw)
             query._cached_result = result
+            results.append(result)
             if result.error:
                 errors.append(result.error)
 
@@ -937,7 +1295,7 @@ class CompiledMultiSearch(CompiledEndpoint):
                 error_msg = '{} queries were failed'.format(len(errors))
             raise MultiSearchError(error_msg, errors)
 
-        return [q.get_result() for q in self.expression]
+        return results
 
 
 class CompiledPutMapping(CompiledEndpoint):
@@ -1017,6 +1375,8 @@ class CompiledPutMapping(CompiledEndpoint):
                     mapping.setdefault('fields', {}) \
                         .update(self.visit(subfield))
 
+        if isinstance(field_type, Date) and field_type.format:
+            mapping['format'] = field_type.format
         mapping.update(field._mapping_options)
 
         return {
@@ -1174,6 +1534,7 @@ class CompiledGet(CompiledEndpoint):
         ('_parent', 'parent'),
         ('_version', 'version'),
     )
+    coalesce = True
 
     def __init__(self, doc_or_id, params=None, doc_cls=None):
         self.doc_or_id = doc_or_id
@@ -1249,6 +1610,8 @@ class CompiledGet(CompiledEndpoint):
 
 
 class CompiledMultiGet(CompiledEndpoint):
+    coalesce = True
+
     class _DocsOrIds(object):
         __visit_name__ = 'docs_or_ids'
 
@@ -1339,6 +1702,8 @@ class CompiledMultiGet(CompiledEndpoint):
 
 
 class CompiledDelete(CompiledGet):
+    coalesce = False
+
     def api_method(self, client):
         return client.delete
 
@@ -1359,13 +1724,48 @@ class CompiledBulk(CompiledEndpoint):
         def __iter__(self):
             return iter(self.actions)
 
-    def __init__(self, actions, params=None):
+    default_json_dumps = staticmethod(JSONSerializer().dumps)
+
+    def __init__(self, actions, params=None, json_dumps=None):
+        self._json_dumps = json_dumps
         super(CompiledBulk, self).__init__(self._Actions(actions), params)
 
     def api_method(self, client):
         return client.bulk
 
+    @classmethod
+    def write_action(cls, buf, action, json_dumps=None):
+        """Compiles the action and appends its NDJSON lines to the ``buf``
+        bytearray. ``json_dumps`` can return either ``str`` or ``bytes``.
+        """
+        dumps = json_dumps or cls.default_json_dumps
+        data = dumps(cls.compiled_meta(action).body)
+        buf += data.encode('utf-8') if isinstance(data, str) else data
+        buf += b'\n'
+        source = cls.compiled_source(action).body
+        if source is not None:
+            data = dumps(source)
+            buf += data.encode('utf-8') if isinstance(data, str) else data
+            buf += b'\n'
+        return buf
+
+    @classmethod
+    def to_ndjson(cls, actions, json_dumps=None, buf=None):
+        """Returns bulk body as NDJSON bytes. When ``buf`` bytearray is passed
+        it is cleared and reused.
+        """
+        if buf is None:
+            buf = bytearray()
+        else:
+            del buf[:]
+        for action in actions:
+            cls.write_action(buf, action, json_dumps)
+        return bytes(buf)
+
     def visit_actions(self, actions):
+        if self._json_dumps is not None:
+            return self.to_ndjson(actions, self._json_dumps)
+
         body = []
         for action in actions:
             meta = self.compiled_meta(action).body
@@ -1391,6 +1791,13 @@ class CompiledMeta(Compiled):
         'ttl',
         'version',
     )
+    # pairs of meta field names and corresponding document attributes
+    _META_ATTRS = tuple(
+        (field_name, field_name)
+        if field_name.startswith('_')
+        else (field_name, '_{}'.format(field_name))
+        for field_name in META_FIELD_NAMES
+    )
 
     def __init__(self, doc_or_action):
         super(CompiledMeta, self).__init__(doc_or_action)
@@ -1409,14 +1816,18 @@ class CompiledMeta(Compiled):
     def visit_document(self, doc):
         meta = {}
         if isinstance(doc, Document):
+            plan = doc.__class__._get_source_plan()
             self._populate_meta_from_document(doc, meta)
-            doc_type = doc.get_doc_type()
-            if doc_type:
-                meta['_type'] = doc_type
+            if plan.doc_type:
+                meta['_type'] = plan.doc_type
+            emulate_doc_types = plan.doc_type and plan.has_parent
         else:
             self._populate_meta_from_dict(doc, meta)
+            emulate_doc_types = _is_emulate_doc_types_mode(
+                self.features, doc.__class__
+            )
 
-        if _is_emulate_doc_types_mode(self.features, doc.__class__):
+        if emulate_doc_types:
             meta.pop('parent', None)
             meta['_id'] = mk_uid(
                 doc.__doc_type__, meta['_id']
@@ -1429,21 +1840,13 @@ class CompiledMeta(Compiled):
         return meta
 
     def _populate_meta_from_document(self, doc, meta):
-        for field_name in self.META_FIELD_NAMES:
-            if field_name.startswith('_'):
-                doc_field_name = field_name
-            else:
-                doc_field_name = '_{}'.format(field_name)
+        for field_name, doc_field_name in self._META_ATTRS:
             value = getattr(doc, doc_field_name, None)
             if value:
                 meta[field_name] = value
 
     def _populate_meta_from_dict(self, doc, meta):
-        for field_name in self.META_FIELD_NAMES:
-            if field_name.startswith('_'):
-                doc_field_name = field_name
-            else:
-                doc_field_name = '_{}'.format(field_name)
+        for field_name, doc_field_name in self._META_ATTRS:
             value = doc.get(doc_field_name)
             if value:
                 meta[field_name] = value
@@ -1478,50 +1881,46 @@ class CompiledSource(CompiledExpression):
         return source
 
     def visit_document(self, doc):
-        source = {}
         doc_cls = doc.__class__
+        plan = doc_cls._get_source_plan()
+        validate = self._validate
+        source = {}
         for key, value in doc.__dict__.items():
-            # skip mapping fields
-            if key in doc_cls.mapping_fields:
-                continue
-
-            # ignore private attributes
-            if key.startswith('_Document__'):
-                continue
-
-            attr_field = doc_cls.fields.get(key)
-            if not attr_field:
-                continue
-
-            if value is None or value == '' or value == []:
+            source_field = plan.fields.get(key)
+            if source_field is None:
+                # skip mapping fields and private attributes
                 if (
-                        self._validate and
-                        attr_field.get_field().get_mapping_options().get(
-                            'required'
-                        )
+                        not plan.has_dynamic_fields or
+                        key in plan.skip_attr_names or
+                        key.startswith('_Document__')
                 ):
-                    raise ValidationError("'{}' is required".format(
-                        attr_field.get_attr_name()
-                    ))
-            else:
-                value = attr_field.get_type() \
-                    .from_python(value, self.compiler, validate=self._validate)
-            source[attr_field.get_field().get_name()] = value
-
-        for attr_field in doc._fields.values():
-            if not self._validate:
-                continue
+                    continue
+                attr_field = doc_cls.fields.get(key)
+                if not attr_field:
+                    continue
+                source_field = _make_source_field(attr_field)
 
-            field = attr_field.get_field()
-            if (
-                    field.get_mapping_options().get('required') and
-                    field.get_name() not in source
+            if value is None or value == '' or value == []:
+                if validate and source_field.required:
+                    raise ValidationError(
+                        "'{}' is required".format(source_field.attr_name)
+                    )
+            elif source_field.from_python is not None and (
+                    validate or not source_field.validate_only
             ):
-                raise ValidationError(
-                    "'{}' is required".format(attr_field.get_attr_name())
+                value = source_field.from_python(
+                    value, self.compiler, validate=validate
                 )
+            source[source_field.field_name] = value
+
+        if validate:
+            for source_field in plan.required_fields:
+                if source_field.field_name not in source:
+                    raise ValidationError(
+                        "'{}' is required".format(source_field.attr_name)
+                    )
 
-        if _is_emulate_doc_types_mode(self.features, doc):
+        if plan.doc_type and plan.has_parent:
             doc_type_source = {}
             doc_type_source['name'] = doc.__doc_type__
             if doc._parent is not None:
@@ -1545,6 +1944,10 @@ def _featured_compiler(elasticsearch_features):
             compiler = cls
             features = elasticsearch_features
 
+        class _CompiledPreparedSearchQuery(CompiledPreparedSearchQuery):
+            compiler = cls
+            features = elasticsearch_features
+
         class _CompiledScroll(CompiledScroll):
             compiler = cls
             features = elasticsearch_features
@@ -1609,6 +2012,7 @@ def _featured_compiler(elasticsearch_features):
         cls.compiled_expression = _CompiledExpression
         cls.compiled_search_query = _CompiledSearchQuery
         cls.compiled_query = cls.compiled_search_query
+        cls.compiled_prepared_query = _CompiledPreparedSearchQuery
         cls.compiled_scroll = _CompiledScroll
         cls.compiled_count_query = _CompiledCountQuery
         cls.compiled_exists_query = _CompiledExistsQuery
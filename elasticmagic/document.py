@@ -1,4 +1,8 @@
-from .types import Type, String, Integer, Float, Date
+from collections import namedtuple
+from itertools import chain
+
+from .types import Type, String, Integer, Float, Date, Completion
+from .types import GeoPoint, Ip, _Float, _Int
 from .attribute import AttributedField, DynamicAttributedField
 from .attribute import _attributed_field_factory
 from .expression import Field, MappingField
@@ -30,6 +34,99 @@ def get_doc_type_for_hit(hit):
     return hit.get('_type', '_doc')
 
 
+def _get_custom_doc_type_meta(hit, fields, custom_doc_type):
+    doc_type = custom_doc_type[0]
+    doc_id = hit.get('_id')
+    if doc_id is not None:
+        _, _, doc_id = doc_id.rpartition(DOC_TYPE_ID_DELIMITER)
+
+    custom_parent_id = fields.get(DOC_TYPE_PARENT_FIELD)
+    if not custom_parent_id:
+        parent_field_prefix = '%s#' % DOC_TYPE_JOIN_FIELD
+        for field_name, field_value in fields.items():
+            if not field_name.startswith(parent_field_prefix):
+                continue
+            if field_name == '%s%s' % (parent_field_prefix, doc_type):
+                continue
+            custom_parent_id = field_value
+            break
+
+    parent_id = None
+    if custom_parent_id:
+        _, _, parent_id = custom_parent_id[0].rpartition(
+            DOC_TYPE_ID_DELIMITER
+        )
+    return doc_type, doc_id, parent_id
+
+
+HitDecoder = namedtuple(
+    'HitDecoder', ['mapping_fields', 'source_fields', 'convert_unmapped']
+)
+
+
+def _make_to_python(field_type):
+    """Returns function that converts a raw value for the field type or
+    ``None`` if the value should be taken as is.
+    """
+    to_python = field_type.to_python
+    to_python_func = getattr(to_python, '__func__', None)
+    if to_python_func is Completion.to_python:
+        return None
+    if to_python_func is Type.to_python:
+        python_type = field_type.python_type
+        if python_type is None:
+            return None
+
+        def convert(value):
+            if value is None:
+                return None
+            return python_type(value)
+        return convert
+    return to_python
+
+
+SourceField = namedtuple(
+    'SourceField',
+    ['attr_name', 'field_name', 'from_python', 'validate_only', 'required']
+)
+
+SourcePlan = namedtuple(
+    'SourcePlan',
+    [
+        'fields', 'required_fields', 'skip_attr_names',
+        'has_dynamic_fields', 'doc_type', 'has_parent',
+    ]
+)
+
+# these types convert values only when validation is enabled
+_VALIDATE_ONLY_FROM_PYTHON = frozenset([
+    _Int.from_python, _Float.from_python, Date.from_python,
+    Ip.from_python, GeoPoint.from_python,
+])
+
+
+def _make_source_field(attr_field):
+    field = attr_field.get_field()
+    field_type = attr_field.get_type()
+    from_python = field_type.from_python
+    from_python_func = getattr(from_python, '__func__', None)
+    if from_python_func is Type.from_python:
+        from_python = None
+    return SourceField(
+        attr_field.get_attr_name(),
+        field.get_name(),
+        from_python,
+        from_python_func in _VALIDATE_ONLY_FROM_PYTHON,
+        bool(field.get_mapping_options().get('required')),
+    )
+
+
+def _find_attr_owner(cls, name):
+    for klass in cls.__mro__:
+        if name in klass.__dict__:
+            return klass
+
+
 class DocumentMeta(type):
     def __new__(meta, name, bases, dct):
         cls = type.__new__(meta, name, bases, dct)
@@ -99,11 +196,24 @@ class DocumentMeta(type):
                 cls._user_fields[name] = attr_field
             cls._fields[name] = attr_field
             cls._field_name_map[field._name] = attr_field
+            cls._reset_cached_attrs()
 
             value = attr_field
 
         super(DocumentMeta, cls).__setattr__(name, value)
 
+    def _reset_cached_attrs(cls):
+        # subclasses inherit source processing and compact classes
+        doc_classes = [cls]
+        while doc_classes:
+            doc_cls = doc_classes.pop()
+            for cached_attr_name in (
+                    '_hit_decoder', '_compact_doc_cls', '_source_plan'
+            ):
+                if cached_attr_name in doc_cls.__dict__:
+                    type.__delattr__(doc_cls, cached_attr_name)
+            doc_classes.extend(doc_cls.__subclasses__())
+
     @property
     def fields(cls):
         return cls._fields
@@ -123,6 +233,101 @@ class DocumentMeta(type):
     def wildcard(cls, name):
         return DynamicAttributedField(cls, name, Field(name))
 
+    def _get_hit_decoder(cls):
+        decoder = cls.__dict__.get('_hit_decoder')
+        if decoder is None:
+            decoder = cls._build_hit_decoder()
+            type.__setattr__(cls, '_hit_decoder', decoder)
+        return decoder
+
+    def _build_hit_decoder(cls):
+        mapping_fields = tuple(
+            (attr_field._attr_name, attr_field._field._name)
+            for attr_field in cls._mapping_fields
+        )
+
+        process_owner = _find_attr_owner(cls, '_process_source_key_value')
+        if process_owner not in (Document, DynamicDocument):
+            # source processing is customized, so we cannot use
+            # precompiled converters
+            return HitDecoder(mapping_fields, None, None)
+
+        source_fields = {
+            field_name: (
+                attr_field._attr_name,
+                cls._make_source_converter(attr_field.get_type())
+            )
+            for field_name, attr_field in cls._field_name_map.items()
+        }
+        return HitDecoder(
+            mapping_fields, source_fields, cls._make_source_converter(None)
+        )
+
+    def _make_source_converter(cls, field_type):
+        if field_type is None:
+            return None
+        return _make_to_python(field_type)
+
+    def _get_source_plan(cls):
+        plan = cls.__dict__.get('_source_plan')
+        if plan is None:
+            plan = cls._build_source_plan()
+            type.__setattr__(cls, '_source_plan', plan)
+        return plan
+
+    def _build_source_plan(cls):
+        fields = {
+            attr_field.get_attr_name(): _make_source_field(attr_field)
+            for attr_field in cls._user_fields
+        }
+        required_fields = tuple(
+            source_field for source_field in map(
+                _make_source_field, cls._fields
+            )
+            if source_field.required
+        )
+        skip_attr_names = frozenset(
+            attr_field.get_attr_name() for attr_field in cls._mapping_fields
+        )
+        return SourcePlan(
+            fields, required_fields, skip_attr_names,
+            bool(cls._dynamic_defaults), cls.get_doc_type(),
+            cls.has_parent_doc_cls(),
+        )
+
+    def _get_compact_doc_cls(cls):
+        compact_doc_cls = cls.__dict__.get('_compact_doc_cls')
+        if compact_doc_cls is None:
+            compact_doc_cls = cls._build_compact_doc_cls()
+            type.__setattr__(cls, '_compact_doc_cls', compact_doc_cls)
+        return compact_doc_cls
+
+    def _build_compact_doc_cls(cls):
+        # compact classes repeat the hierarchy of the document classes
+        base_compact_doc_cls = CompactDocument
+        for base in cls.__bases__:
+            if isinstance(base, DocumentMeta) and base is not Document:
+                base_compact_doc_cls = base._get_compact_doc_cls()
+                break
+        field_attr_names = frozenset(
+            [attr_field._attr_name
+             for attr_field in cls._field_name_map.values()] +
+            ['_index', '_type', '_id', '_score', '_parent']
+        )
+        return type(
+            'Compact{}'.format(cls.__name__),
+            (base_compact_doc_cls,),
+            {
+                '__slots__': tuple(sorted(
+                    field_attr_names - base_compact_doc_cls._field_attr_names
+                )),
+                '__module__': cls.__module__,
+                '__doc_cls__': cls,
+                '_field_name_map': cls._field_name_map,
+                '_field_attr_names': field_attr_names,
+            }
+        )
+
     def __getattr__(cls, name):
         return getattr(cls.fields, name)
 
@@ -158,6 +363,8 @@ class Document(metaclass=DocumentMeta):
         self.__explanation = None
         self._index = self._type = self._id = self._score = None
         if _hit:
+            decoder = self.__class__._get_hit_decoder()
+            doc_dict = self.__dict__
             self._score = _hit.get('_score')
             source = _hit.get('_source')
             fields = _hit.get('fields')
@@ -169,47 +376,36 @@ class Document(metaclass=DocumentMeta):
             else:
                 custom_doc_type = None
 
-            for attr_field in self._mapping_fields:
-                setattr(
-                    self,
-                    attr_field._attr_name,
-                    _hit.get(attr_field._field._name)
-                )
+            for attr_name, hit_key in decoder.mapping_fields:
+                doc_dict[attr_name] = _hit.get(hit_key)
 
             if custom_doc_type:
-                doc_type = custom_doc_type[0]
-                doc_id = _hit.get('_id')
-                if doc_id is not None:
-                    _, _, self._id = doc_id.rpartition(DOC_TYPE_ID_DELIMITER)
-                else:
-                    self._id = None
-                self._type = doc_type
-
-                custom_parent_id = fields.get(DOC_TYPE_PARENT_FIELD)
-                if not custom_parent_id:
-                    parent_field_prefix = '%s#' % DOC_TYPE_JOIN_FIELD
-                    for field_name, field_value in fields.items():
-                        if not field_name.startswith(parent_field_prefix):
-                            continue
-                        if field_name == '%s%s' % (
-                                parent_field_prefix, doc_type
-                        ):
-                            continue
-                        custom_parent_id = field_value
-                        break
-
-                if custom_parent_id:
-                    parent_id = custom_parent_id[0]
-                    _, _, self._parent = parent_id.rpartition(
-                        DOC_TYPE_ID_DELIMITER
-                    )
+                self._type, self._id, parent_id = _get_custom_doc_type_meta(
+                    _hit, fields, custom_doc_type
+                )
+                if parent_id:
+                    self._parent = parent_id
 
-            if source:
+            source_fields = decoder.source_fields
+            if source and source_fields is None:
                 for hit_key, hit_value in source.items():
                     setattr(
                         self,
                         *self._process_source_key_value(hit_key, hit_value)
                     )
+            elif source:
+                convert_unmapped = decoder.convert_unmapped
+                for hit_key, hit_value in source.items():
+                    source_field = source_fields.get(hit_key)
+                    if source_field is None:
+                        if convert_unmapped is not None:
+                            hit_value = convert_unmapped(hit_value)
+                        setattr(self, hit_key, hit_value)
+                        continue
+                    attr_name, convert = source_field
+                    if convert is not None:
+                        hit_value = convert(hit_value)
+                    doc_dict[attr_name] = hit_value
 
             if fields:
                 # we cannot construct document from fields
@@ -311,6 +507,206 @@ class Document(metaclass=DocumentMeta):
             return self.__dict__['instance']
 
 
+class CompactDocument(object):
+    """Read-only document that keeps its attributes in slots.
+
+    Compact documents are built from hits when a search query is marked with
+    :meth:`~elasticmagic.search.SearchQuery.with_compact_documents`. They
+    provide the same attribute access as usual documents but do not have
+    ``__dict__``, so they consume much less memory. Source keys that are not
+    mapped to any document field are stored in a separate dictionary.
+
+    Compact documents are not instances of their document class, which is
+    available as ``doc.__doc_cls__``. Classes of the compact documents repeat
+    the hierarchy of the document classes, so
+    ``isinstance(doc, ProductDocument._get_compact_doc_cls())`` is true for
+    the compact documents of ``ProductDocument`` and its subclasses.
+    """
+
+    __slots__ = (
+        '__hit_fields', '__highlight', '__matched_queries', '__explanation',
+        '__sort_values', '__extra', '__result', '__instance',
+    )
+
+    __doc_cls__ = None
+    _field_name_map = {}
+    _field_attr_names = frozenset()
+
+    _process_fields = Document._process_fields
+
+    def __init__(self, _hit, _result=None):
+        set_attr = object.__setattr__
+        doc_cls = self.__doc_cls__
+        decoder = doc_cls._get_hit_decoder()
+        extra = None
+        set_attr(self, '_CompactDocument__extra', extra)
+
+        fields = _hit.get('fields')
+        source = _hit.get('_source')
+
+        set_attr(self, '_score', _hit.get('_score'))
+        for attr_name, hit_key in decoder.mapping_fields:
+            hit_value = _hit.get(hit_key)
+            if hit_value is not None:
+                set_attr(self, attr_name, hit_value)
+
+        if fields:
+            custom_doc_type = fields.get(
+                DOC_TYPE_NAME_FIELD, fields.get(DOC_TYPE_JOIN_FIELD)
+            )
+            if custom_doc_type:
+                doc_type, doc_id, parent_id = _get_custom_doc_type_meta(
+                    _hit, fields, custom_doc_type
+                )
+                set_attr(self, '_type', doc_type)
+                set_attr(self, '_id', doc_id)
+                if parent_id:
+                    set_attr(self, '_parent', parent_id)
+
+        source_fields = decoder.source_fields
+        if source:
+            if source_fields is None:
+                process_source_key_value = doc_cls._process_source_key_value
+                source_items = (
+                    process_source_key_value(self, hit_key, hit_value)
+                    for hit_key, hit_value in source.items()
+                )
+                convert_unmapped = None
+            else:
+                source_items = source.items()
+                convert_unmapped = decoder.convert_unmapped
+            field_attr_names = self._field_attr_names
+            for hit_key, hit_value in source_items:
+                source_field = source_fields and source_fields.get(hit_key)
+                if source_field:
+                    attr_name, convert = source_field
+                    if convert is not None:
+                        hit_value = convert(hit_value)
+                    set_attr(self, attr_name, hit_value)
+                elif hit_key in field_attr_names:
+                    set_attr(self, hit_key, hit_value)
+                else:
+                    if convert_unmapped is not None:
+                        hit_value = convert_unmapped(hit_value)
+                    if extra is None:
+                        extra = {}
+                    extra[hit_key] = hit_value
+
+        set_attr(self, '_CompactDocument__extra', extra)
+        set_attr(
+            self, '_CompactDocument__hit_fields',
+            self._process_fields(fields) if fields else None
+        )
+        set_attr(
+            self, '_CompactDocument__highlight', _hit.get('highlight')
+        )
+        set_attr(
+            self, '_CompactDocument__matched_queries',
+            _hit.get('matched_queries')
+        )
+        set_attr(
+            self, '_CompactDocument__explanation', _hit.get('_explanation')
+        )
+        set_attr(self, '_CompactDocument__sort_values', _hit.get('sort'))
+        set_attr(self, '_CompactDocument__result', _result)
+
+    def __getattr__(self, name):
+        if name.startswith('_CompactDocument__'):
+            raise AttributeError(name)
+        extra = self.__extra
+        if extra and name in extra:
+            return extra[name]
+        if name in self._field_attr_names:
+            return None
+        raise AttributeError(
+            "'{}' object has no attribute '{}'".format(
+                self.__class__.__name__, name
+            )
+        )
+
+    def __setattr__(self, name, value):
+        raise AttributeError(
+            "'{}' object is read-only".format(self.__class__.__name__)
+        )
+
+    def __delattr__(self, name):
+        raise AttributeError(
+            "'{}' object is read-only".format(self.__class__.__name__)
+        )
+
+    @classmethod
+    def get_doc_type(cls):
+        return cls.__doc_cls__.get_doc_type()
+
+    def get_highlight(self):
+        return self.__highlight or {}
+
+    def get_matched_queries(self):
+        return self.__matched_queries or []
+
+    def get_fields(self):
+        return self.__hit_fields or {}
+
+    def get_sort_values(self):
+        return self.__sort_values or []
+
+    def get_hit_fields(self):
+        return self.get_fields()
+
+    def get_explanation(self):
+        return self.__explanation or {}
+
+    def __reduce__(self):
+        # compact classes are generated so pickle cannot find them by name,
+        # they are restored from the document class
+        get_attr = object.__getattribute__
+        state = {}
+        for attr_name in chain(
+                self._field_attr_names, _COMPACT_DOCUMENT_STATE
+        ):
+            try:
+                state[attr_name] = get_attr(self, attr_name)
+            except AttributeError:
+                pass
+        return _restore_compact_document, (self.__doc_cls__, state)
+
+    def _set_instance(self, instance):
+        object.__setattr__(self, '_CompactDocument__instance', instance)
+
+    @property
+    def instance(self):
+        try:
+            return self.__instance
+        except AttributeError:
+            pass
+        if self.__result:
+            self.__result._populate_instances(self.__doc_cls__)
+            return self.__instance
+
+
+_COMPACT_DOCUMENT_STATE = (
+    '_CompactDocument__hit_fields', '_CompactDocument__highlight',
+    '_CompactDocument__matched_queries', '_CompactDocument__explanation',
+    '_CompactDocument__sort_values', '_CompactDocument__extra',
+)
+
+
+def _restore_compact_document(doc_cls, state):
+    compact_doc_cls = doc_cls._get_compact_doc_cls()
+    doc = compact_doc_cls.__new__(compact_doc_cls)
+    set_attr = object.__setattr__
+    set_attr(doc, '_CompactDocument__result', None)
+    for attr_name, value in state.items():
+        set_attr(doc, attr_name, value)
+    return doc
+
+
+def _to_dynamic_document(value):
+    if isinstance(value, dict):
+        return DynamicDocument(**value)
+    return value
+
+
 class DynamicDocumentMeta(DocumentMeta):
     def _get_dynamic_defaults(cls):
         dynamic_defaults = \
@@ -320,6 +716,13 @@ class DynamicDocumentMeta(DocumentMeta):
                 DynamicAttributedField, cls, Field('*'))
         return dynamic_defaults
 
+    def _make_source_converter(cls, field_type):
+        convert = super(DynamicDocumentMeta, cls) \
+            ._make_source_converter(field_type)
+        if convert is None:
+            return _to_dynamic_document
+        return lambda value: _to_dynamic_document(convert(value))
+
     def __getattr__(cls, name):
         if name.startswith('__') and name.endswith('__'):
             raise AttributeError(
@@ -4,14 +4,31 @@ import operator
 from collections.abc import Mapping
 from itertools import count
 
-from .util import clean_params, collect_doc_classes
+from .util import _get_object_fingerprint, clean_params, collect_doc_classes
 from .types import instantiate, Type
 
 
 class Expression(object):
+    # attributes that do not affect the compiled expression
+    _fingerprint_exclude = ()
+
     def _collect_doc_classes(self):
         return set()
 
+    def fingerprint(self):
+        """Returns a structural fingerprint of the expression. Expressions
+        that compile into the same body have equal fingerprints, so it can be
+        used as a cache key instead of the compiled body.
+
+        The fingerprint is computed once, expressions must not be modified
+        after that.
+        """
+        fingerprint = self.__dict__.get('_fingerprint')
+        if fingerprint is None:
+            fingerprint = self.__dict__['_fingerprint'] = \
+                _get_object_fingerprint(self, self._fingerprint_exclude)
+        return fingerprint
+
     def compile(self, compiler):
         return compiler.compiled_expression(self)
 
@@ -28,6 +45,17 @@ class Literal(Expression):
         self.obj = obj
 
 
+class Param(Expression):
+    """Named placeholder for a value that is bound after compilation.
+    Can only be used in prepared queries, see
+    :meth:`.SearchQuery.prepare`.
+    """
+    __visit_name__ = 'param'
+
+    def __init__(self, name):
+        self.name = name
+
+
 class Params(Expression, Mapping):
     __visit_name__ = 'params'
 
@@ -123,7 +151,10 @@ class Terms(FieldExpression):
             field, minimum_should_match=minimum_should_match, boost=boost,
             **kwargs
         )
-        self.terms = list(terms)
+        if isinstance(terms, Param):
+            self.terms = terms
+        else:
+            self.terms = list(terms)
 
 
 class Match(FieldQueryExpression):
@@ -538,6 +569,7 @@ class Field(Expression, FieldOperators):
     __visit_name__ = 'field'
 
     _counter = count()
+    _fingerprint_exclude = ('_count',)
 
     def __init__(self, *args, **kwargs):
         self._name = None
@@ -567,6 +599,7 @@ class Field(Expression, FieldOperators):
         self._fields = kwargs.pop('fields', {})
         self._count = kwargs.pop('_counter', next(self._counter))
         self._mapping_options = kwargs
+        self._type = self._type.with_mapping_options(kwargs)
 
     def clone(self, cls=None):
         cls = cls or self.__class__
@@ -0,0 +1,86 @@
+import asyncio
+
+from elasticmagic.compiler import MultiSearchError
+
+# search parameters that can be passed in a multi search header
+MULTI_SEARCH_PARAMS = frozenset([
+    'index', 'doc_type', 'routing', 'preference', 'search_type',
+    'request_cache', 'allow_partial_search_results',
+])
+
+
+class AsyncSearchBatcher(object):
+    """Merges searches that were issued within ``window`` seconds into
+    a single multi search request. A batch is sent earlier when it reaches
+    ``max_batch_size`` queries.
+
+    Usually it is enabled by ``search_batch_window`` argument of
+    the :class:`~elasticmagic.ext.asyncio.AsyncCluster`. If the query of
+    a batch fails :class:`~elasticmagic.compiler.MultiSearchError` is
+    raised only for this query.
+    """
+
+    def __init__(self, cluster, window=0.002, max_batch_size=100):
+        self._cluster = cluster
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.batches = 0
+        self.batched_queries = 0
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+
+    def can_batch(self, search_query):
+        return (
+            search_query._result_cache is None and
+            MULTI_SEARCH_PARAMS.issuperset(search_query._search_params)
+        )
+
+    async def search(self, search_query):
+        """Returns a search result of the query after the batch of
+        the query is sent.
+        """
+        future = asyncio.get_event_loop().create_future()
+        self._pending.append((search_query, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_event_loop().call_later(
+                self.window, self._flush
+            )
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch = [(q, f) for q, f in self._pending if not f.done()]
+        self._pending = []
+        if not batch:
+            return
+        task = asyncio.ensure_future(self._send(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch):
+        self.batches += 1
+        self.batched_queries += len(batch)
+        try:
+            results = await self._cluster.multi_search(
+                [q for q, _ in batch], raise_on_error=False
+            )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if result.error:
+                future.set_exception(
+                    MultiSearchError('1 query was failed', [result.error])
+                )
+            else:
+                future.set_result(result)
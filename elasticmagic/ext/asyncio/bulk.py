@@ -0,0 +1,144 @@
+import asyncio
+
+from elasticsearch import TransportError
+
+from ...bulk import BaseBulkIndexer
+
+_END = object()
+
+
+class AsyncBulkIndexer(BaseBulkIndexer):
+    """Asynchronous version of the :class:`.bulk.BulkIndexer`.
+
+    Actions are read from a sync or async iterable into a queue bounded by
+    ``max_queued_actions``. Batches of ``chunk_size`` actions are compiled
+    and serialized in an executor when there are at least
+    ``executor_threshold`` actions in a batch, so big batches do not block
+    the event loop. Up to ``concurrency`` bulk requests are kept in flight.
+
+    .. code-block:: python
+
+       indexer = cluster.bulk_indexer(index='products', concurrency=4)
+       async for action_result in indexer.send(actions):
+           if action_result.error:
+               log_error(action_result)
+    """
+
+    _sleep = staticmethod(asyncio.sleep)
+
+    def __init__(
+            self, cluster, concurrency=4, max_queued_actions=None,
+            executor_threshold=100, executor=None, **kwargs
+    ):
+        super(AsyncBulkIndexer, self).__init__(cluster, **kwargs)
+        self.concurrency = concurrency
+        if max_queued_actions is None:
+            max_queued_actions = self.chunk_size * 2
+        self.max_queued_actions = max_queued_actions
+        self.executor_threshold = executor_threshold
+        self._executor = executor
+
+    async def send(self, actions):
+        """Sends actions and yields :class:`.result.ActionResult` for every
+        action. Results of a chunk are yielded when the chunk is completed.
+        """
+        compiled_bulk = (await self._cluster.get_compiler()).compiled_bulk
+        queue = asyncio.Queue(maxsize=self.max_queued_actions)
+        producer = asyncio.ensure_future(self._produce(actions, queue))
+        in_flight = set()
+        try:
+            async for batch in self._iter_batches(queue):
+                serialized_actions = await self._serialize_batch(
+                    compiled_bulk, batch
+                )
+                for chunk in self._iter_chunks(serialized_actions):
+                    if len(in_flight) >= self.concurrency:
+                        done, in_flight = await asyncio.wait(
+                            in_flight, return_when=asyncio.FIRST_COMPLETED
+                        )
+                        for task in done:
+                            for action_result in self._complete_chunk(
+                                    task.result()
+                            ):
+                                yield action_result
+                    in_flight.add(
+                        asyncio.ensure_future(self._send_chunk(chunk))
+                    )
+            while in_flight:
+                done, in_flight = await asyncio.wait(
+                    in_flight, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    for action_result in self._complete_chunk(task.result()):
+                        yield action_result
+            # reraises an error of the actions iterable
+            await producer
+        finally:
+            self._finish()
+            tasks = [producer] + list(in_flight)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _produce(self, actions, queue):
+        try:
+            if hasattr(actions, '__aiter__'):
+                async for action in actions:
+                    await queue.put(action)
+            else:
+                for action in actions:
+                    await queue.put(action)
+        except asyncio.CancelledError:
+            # the consumer has stopped and does not read the queue anymore
+            raise
+        except Exception:
+            await queue.put(_END)
+            raise
+        await queue.put(_END)
+
+    async def _iter_batches(self, queue):
+        batch = []
+        while True:
+            action = await queue.get()
+            if action is _END:
+                break
+            batch.append(action)
+            if len(batch) >= self.chunk_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    async def _serialize_batch(self, compiled_bulk, batch):
+        if len(batch) < self.executor_threshold:
+            return self._serialize_actions(compiled_bulk, batch)
+        return await asyncio.get_event_loop().run_in_executor(
+            self._executor, self._serialize_actions, compiled_bulk, batch
+        )
+
+    async def _send_chunk(self, chunk):
+        client = self._cluster.get_client()
+        results = [None] * len(chunk)
+        pending = list(range(len(chunk)))
+        retries = 0
+        sent_bytes = 0
+        attempt = 0
+        while True:
+            body = b''.join(chunk[ix] for ix in pending)
+            sent_bytes += len(body)
+            try:
+                raw_result = await client.bulk(body=body, **self._params)
+            except TransportError as e:
+                if not self._should_retry_request(e, attempt):
+                    raise
+                retry_items = pending
+            else:
+                retry_items = self._process_response(
+                    chunk, pending, raw_result, results, attempt
+                )
+            if not retry_items:
+                return results, retries, sent_bytes
+            retries += len(retry_items)
+            await self._sleep(self._get_backoff(attempt))
+            attempt += 1
+            pending = retry_items
@@ -1,22 +1,93 @@
+import asyncio
+import copy
+
 from elasticmagic.compiler import get_compiler_by_es_version
 
 from ...cluster import BaseCluster
+from .batch import AsyncSearchBatcher
+from .bulk import AsyncBulkIndexer
 from .index import AsyncIndex
 from .search import AsyncSearchQuery
 
 
+class AsyncSingleFlight(object):
+    """Lets concurrent coroutines with the same key share a single call.
+    ``shared`` counts calls that were served by another call. Such calls
+    get a deep copy of the result so it can be modified by every caller.
+    """
+    def __init__(self):
+        self.shared = 0
+        self._calls = {}
+
+    async def do(self, key, fn, *args, **kwargs):
+        future = self._calls.get(key)
+        if future is not None:
+            self.shared += 1
+            # cancellation of a caller does not cancel the shared call
+            return copy.deepcopy(await asyncio.shield(future))
+        future = self._calls[key] = asyncio.ensure_future(fn(*args, **kwargs))
+        future.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(future)
+
+
 class AsyncCluster(BaseCluster):
     _index_cls = AsyncIndex
     _search_query_cls = AsyncSearchQuery
+    _single_flight_cls = AsyncSingleFlight
+
+    def __init__(
+            self, client, *args, search_batch_window=None,
+            search_batch_size=100, **kwargs
+    ):
+        """When ``search_batch_window`` is set results of the search queries
+        requested within that number of seconds are fetched by a single
+        multi search request of at most ``search_batch_size`` queries
+        (see :class:`~elasticmagic.ext.asyncio.batch.AsyncSearchBatcher`).
+        """
+        super(AsyncCluster, self).__init__(client, *args, **kwargs)
+        self._search_batcher = None
+        if search_batch_window is not None:
+            self._search_batcher = AsyncSearchBatcher(
+                self, window=search_batch_window,
+                max_batch_size=search_batch_size,
+            )
 
     async def _do_request(self, compiler, *args, **kwargs):
-        compiled_query = compiler(*args, **kwargs)
+        return await self._do_compiled_request(compiler(*args, **kwargs))
+
+    async def _do_compiled_request(self, compiled_query):
         api_method = compiled_query.api_method(self._client)
-        raw_res = await self._do_api_call(
-            api_method, compiled_query.params, compiled_query.body
+        request_key = self._get_request_key(compiled_query)
+        raw_res = await self._run_result_cache_call(
+            compiled_query, self._get_cached_response,
+            compiled_query, request_key
+        )
+        if raw_res is not None:
+            return compiled_query.process_result(raw_res)
+        if request_key is None or self._single_flight is None:
+            raw_res = await self._do_api_call(
+                api_method, compiled_query.params, compiled_query.body
+            )
+        else:
+            raw_res = await self._single_flight.do(
+                request_key, self._do_api_call,
+                api_method, dict(compiled_query.params), compiled_query.body
+            )
+        await self._run_result_cache_call(
+            compiled_query, self._cache_response,
+            compiled_query, request_key, raw_res
         )
         return compiled_query.process_result(raw_res)
 
+    async def _run_result_cache_call(self, compiled_query, fn, *args):
+        result_cache = compiled_query.result_cache
+        if result_cache is not None and result_cache.blocking:
+            # external storages must not block the event loop
+            return await asyncio.get_event_loop().run_in_executor(
+                None, fn, *args
+            )
+        return fn(*args)
+
     async def _do_api_call(self, api_method, api_kwargs, body):
         if body is not None:
             api_kwargs['body'] = body
@@ -96,13 +167,29 @@ class AsyncCluster(BaseCluster):
 
     async def scroll(
             self, scroll_id, scroll, doc_cls=None, instance_mapper=None,
-            **kwargs
+            lazy_hits=False, compact_documents=False, **kwargs
     ):
         return await self._do_request(
             (await self.get_compiler()).compiled_scroll,
             self._scroll_params(locals()),
             doc_cls=doc_cls,
             instance_mapper=instance_mapper,
+            lazy_hits=lazy_hits,
+            compact_documents=compact_documents,
+        )
+
+    async def open_point_in_time(self, index, keep_alive, **kwargs):
+        params = self._preprocess_params(locals())
+        return self._open_point_in_time_result(
+            await self._client.open_point_in_time(**params)
+        )
+
+    async def close_point_in_time(self, pit_id, **kwargs):
+        params = self._preprocess_params(locals(), 'pit_id')
+        return self._close_point_in_time_result(
+            await self._client.close_point_in_time(
+                body={'id': pit_id}, **params
+            )
         )
 
     async def clear_scroll(self, scroll_id, **kwargs):
@@ -178,9 +265,16 @@ class AsyncCluster(BaseCluster):
     ):
         return await self._do_request(
             (await self.get_compiler()).compiled_bulk,
-            actions, self._bulk_params(locals())
+            actions, self._bulk_params(locals()),
+            json_dumps=self._bulk_json_dumps,
         )
 
+    def bulk_indexer(self, **kwargs):
+        """Returns :class:`.bulk.AsyncBulkIndexer` that sends a stream of
+        actions to this cluster keeping several bulk requests in flight.
+        """
+        return AsyncBulkIndexer(self, **kwargs)
+
     async def refresh(self, index=None, **kwargs):
         params = self._preprocess_params(locals())
         return self._refresh_result(
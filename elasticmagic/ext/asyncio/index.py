@@ -1,4 +1,5 @@
 from ...index import BaseIndex
+from .search import AsyncSlicedScrollIterator
 
 
 class AsyncIndex(BaseIndex):
@@ -92,9 +93,29 @@ class AsyncIndex(BaseIndex):
             **kwargs
         )
 
+    def parallel_scan(
+            self, q, slices=4, size=1000, scroll='1m',
+            max_buffered_pages=None,
+    ):
+        """Asynchronous version of the :meth:`.Index.parallel_scan`. Every
+        slice is scrolled in a separate task.
+        """
+        return AsyncSlicedScrollIterator(
+            q.with_index(self), slices, size=size, scroll=scroll,
+            max_buffered_pages=max_buffered_pages,
+        )
+
     async def clear_scroll(self, scroll_id, **kwargs):
         return await self._cluster.clear_scroll(scroll_id, **kwargs)
 
+    async def open_point_in_time(self, keep_alive, **kwargs):
+        return await self._cluster.open_point_in_time(
+            self._name, keep_alive, **kwargs
+        )
+
+    async def close_point_in_time(self, pit_id, **kwargs):
+        return await self._cluster.close_point_in_time(pit_id, **kwargs)
+
     async def put_mapping(
             self, doc_cls_or_mapping, doc_type=None, allow_no_indices=None,
             expand_wildcards=None, ignore_conflicts=None,
@@ -153,6 +174,9 @@ class AsyncIndex(BaseIndex):
             **kwargs
         )
 
+    def bulk_indexer(self, **kwargs):
+        return self._cluster.bulk_indexer(index=self._name, **kwargs)
+
     async def refresh(self, **kwargs):
         return await self._cluster.refresh(index=self._name, **kwargs)
 
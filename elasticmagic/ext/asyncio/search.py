@@ -1,4 +1,9 @@
+import asyncio
+
 from ...search import BaseSearchQuery
+from ...search import BaseSearchQueryIterator
+from ...search import BaseSlicedScrollIterator
+from ...search import PreparedSearchQuery
 
 
 class AsyncSearchQuery(BaseSearchQuery):
@@ -15,11 +20,25 @@ class AsyncSearchQuery(BaseSearchQuery):
     async def get_query_compiler(self):
         return (await self.get_compiler()).compiled_query
 
+    async def prepare(self, compiler=None, key=None):
+        """Asynchronous version of the :meth:`.SearchQuery.prepare`
+        """
+        compiler = compiler or await self.get_compiler()
+        return AsyncPreparedSearchQuery(
+            self, self._get_prepared_query(compiler, key=key)
+        )
+
     async def get_result(self):
         if self._cached_result is not None:
             return self._cached_result
 
-        self._cached_result = await self._index_or_cluster.search(self)
+        search_batcher = getattr(
+            self._get_cluster(), '_search_batcher', None
+        )
+        if search_batcher is not None and search_batcher.can_batch(self):
+            self._cached_result = await search_batcher.search(self)
+        else:
+            self._cached_result = await self._index_or_cluster.search(self)
         return self._cached_result
 
     async def count(self):
@@ -53,6 +72,36 @@ class AsyncSearchQuery(BaseSearchQuery):
             **kwargs
         )
 
+    def iter_all(
+            self, size=1000, scroll='1m', point_in_time=False,
+            keep_alive='1m', prefetch=True,
+    ):
+        """Asynchronous version of the :meth:`.SearchQuery.iter_all`. The next
+        page is fetched in a separate task.
+
+        .. code-block:: python
+
+           async with search_query.iter_all(size=500) as docs:
+               async for doc in docs:
+                   process(doc)
+        """
+        return AsyncSearchQueryIterator(
+            self, size=size, scroll=scroll, point_in_time=point_in_time,
+            keep_alive=keep_alive, prefetch=prefetch,
+        )
+
+    def iter_columns(
+            self, fields=None, size=1000, scroll='1m', point_in_time=False,
+            keep_alive='1m', prefetch=True,
+    ):
+        """Asynchronous version of the :meth:`.SearchQuery.iter_columns`.
+        """
+        return AsyncSearchQueryIterator(
+            self.with_lazy_hits(), size=size, scroll=scroll,
+            point_in_time=point_in_time, keep_alive=keep_alive,
+            prefetch=prefetch,
+        ).iter_columns(fields)
+
     async def _iter_result_async(self):
         return self._iter_result(await self.get_result())
 
@@ -68,3 +117,181 @@ class AsyncSearchQuery(BaseSearchQuery):
 
     def __getitem__(self, k):
         return self._getitem_async(k)
+
+
+class AsyncPreparedSearchQuery(PreparedSearchQuery):
+    """Asynchronous version of the :class:`.PreparedSearchQuery`
+    """
+
+    async def get_result(self, **values):
+        return await self._search_query._get_cluster() \
+            ._do_compiled_request(self.bind(**values))
+
+
+class AsyncSearchQueryIterator(BaseSearchQueryIterator):
+    """Asynchronous version of the :class:`.SearchQueryIterator`
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(AsyncSearchQueryIterator, self).__init__(*args, **kwargs)
+        self._docs = self._iter_docs()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self._docs.__anext__()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._docs.aclose()
+
+    async def _iter_docs(self):
+        pages = self._iter_pages()
+        try:
+            async for result in pages:
+                for doc in self._search_query._iter_result(result):
+                    yield doc
+        finally:
+            await pages.aclose()
+
+    async def iter_columns(self, fields=None):
+        pages = self._iter_pages()
+        try:
+            async for result in pages:
+                yield result.to_columns(fields)
+        finally:
+            await pages.aclose()
+
+    async def _fetch_first_page(self):
+        search_query = self._search_query
+        if self._use_point_in_time:
+            cluster = search_query._get_cluster()
+            self._pit_id = (
+                await cluster.open_point_in_time(
+                    self._get_index_name(), self._keep_alive
+                )
+            ).id
+            self._page_query = self._make_page_query()
+            return await cluster.search(self._page_query)
+        self._page_query = self._make_page_query()
+        return await search_query._index_or_cluster.search(
+            self._page_query, scroll=self._scroll
+        )
+
+    async def _fetch_next_page(self, result):
+        if self._use_point_in_time:
+            return await self._search_query._get_cluster().search(
+                self._make_next_page_query(result)
+            )
+        return await self._search_query._get_cluster().scroll(
+            result.scroll_id, self._scroll, **self._get_scroll_params()
+        )
+
+    async def _iter_pages(self):
+        next_page = None
+        try:
+            result = await self._fetch_first_page()
+            while True:
+                self._process_page(result)
+                if self._is_last_page(result):
+                    if result.hits:
+                        yield result
+                    break
+                if self._prefetch:
+                    next_page = asyncio.ensure_future(
+                        self._fetch_next_page(result)
+                    )
+                yield result
+                if next_page:
+                    result = await next_page
+                    next_page = None
+                else:
+                    result = await self._fetch_next_page(result)
+        finally:
+            self._finish()
+            if next_page:
+                # the next page holds the actual scroll id
+                try:
+                    self._update_cursor(await next_page)
+                except Exception:
+                    pass
+            await self._release()
+
+    async def _release(self):
+        cluster = self._search_query._get_cluster()
+        if self._scroll_id:
+            await cluster.clear_scroll(self._scroll_id)
+            self._scroll_id = None
+        if self._pit_id:
+            await cluster.close_point_in_time(self._pit_id)
+            self._pit_id = None
+
+
+class AsyncSlicedScrollIterator(BaseSlicedScrollIterator):
+    """Asynchronous version of the :class:`.SlicedScrollIterator`. Every
+    slice is scrolled in a separate task.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(AsyncSlicedScrollIterator, self).__init__(*args, **kwargs)
+        self._docs = self._iter_docs()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self._docs.__anext__()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._docs.aclose()
+
+    async def _scroll_slice(self, slice_iterator, pages_queue):
+        pages = slice_iterator._iter_pages()
+        try:
+            async for result in pages:
+                await pages_queue.put((result, None))
+        except Exception as e:
+            await pages_queue.put((None, e))
+        finally:
+            await pages.aclose()
+        await pages_queue.put((None, None))
+
+    async def _iter_docs(self):
+        pages_queue = asyncio.Queue(maxsize=self._max_buffered_pages)
+        tasks = [
+            asyncio.ensure_future(
+                self._scroll_slice(slice_iterator, pages_queue)
+            )
+            for slice_iterator in self._make_slice_iterators(
+                AsyncSearchQueryIterator
+            )
+        ]
+        try:
+            running_slices = len(tasks)
+            while running_slices:
+                result, error = await pages_queue.get()
+                if error is not None:
+                    raise error
+                if result is None:
+                    running_slices -= 1
+                    continue
+                self._count_page(result)
+                for doc in self._search_query._iter_result(result):
+                    yield doc
+        finally:
+            self._finish()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
@@ -121,13 +121,16 @@ class QueryFilter(metaclass=QueryFilterMeta):
     def apply(self, search_query, params):
         self._params = self._codec.decode(params, self.get_types())
 
-        # First filter query with all filters
-        for f in self._filters:
-            search_query = f._apply_filter(search_query, self._params)
-
-        # then add aggregations
-        for f in self._filters:
-            search_query = f._apply_agg(search_query)
+        # filters modify own copy of the query in place
+        search_query = search_query.clone()
+        with search_query.mutate():
+            # First filter query with all filters
+            for f in self._filters:
+                search_query = f._apply_filter(search_query, self._params)
+
+            # then add aggregations
+            for f in self._filters:
+                search_query = f._apply_agg(search_query)
 
         return search_query
 
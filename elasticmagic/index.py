@@ -3,6 +3,7 @@ from __future__ import absolute_import
 from abc import ABCMeta
 
 from .document import DynamicDocument
+from .search import SlicedScrollIterator
 from .util import to_camel_case
 
 
@@ -91,6 +92,19 @@ class Index(BaseIndex):
             **kwargs
         )
 
+    def stream_search(
+            self, q, doc_type=None, routing=None, preference=None,
+            timeout=None, search_type=None, query_cache=None,
+            terminate_after=None, scroll=None, stats=None, **kwargs
+    ):
+        return self._cluster.stream_search(
+            q, index=self._name, doc_type=doc_type,
+            routing=routing, preference=preference, timeout=timeout,
+            search_type=search_type, query_cache=query_cache,
+            terminate_after=terminate_after, scroll=scroll, stats=stats,
+            **kwargs
+        )
+
     def explain(self, q, doc_or_id, doc_cls=None, routing=None, **kwargs):
         return self._cluster.explain(
             q, doc_or_id, index=self._name, doc_cls=doc_cls, routing=routing,
@@ -137,9 +151,35 @@ class Index(BaseIndex):
             **kwargs
         )
 
+    def stream_scroll(self, scroll_id, scroll, doc_cls=None, **kwargs):
+        return self._cluster.stream_scroll(
+            scroll_id, scroll, doc_cls=doc_cls, **kwargs
+        )
+
+    def parallel_scan(
+            self, q, slices=4, size=1000, scroll='1m',
+            max_buffered_pages=None,
+    ):
+        """Iterates over all documents matched the search query using sliced
+        scroll. Every slice is scrolled in a separate thread. Returns
+        :class:`.search.SlicedScrollIterator`.
+        """
+        return SlicedScrollIterator(
+            q.with_index(self), slices, size=size, scroll=scroll,
+            max_buffered_pages=max_buffered_pages,
+        )
+
     def clear_scroll(self, scroll_id, **kwargs):
         return self._cluster.clear_scroll(scroll_id, **kwargs)
 
+    def open_point_in_time(self, keep_alive, **kwargs):
+        return self._cluster.open_point_in_time(
+            self._name, keep_alive, **kwargs
+        )
+
+    def close_point_in_time(self, pit_id, **kwargs):
+        return self._cluster.close_point_in_time(pit_id, **kwargs)
+
     def put_mapping(
             self, doc_cls_or_mapping, doc_type=None, allow_no_indices=None,
             expand_wildcards=None, ignore_conflicts=None,
@@ -203,6 +243,9 @@ class Index(BaseIndex):
             **kwargs
         )
 
+    def bulk_indexer(self, **kwargs):
+        return self._cluster.bulk_indexer(index=self._name, **kwargs)
+
     def refresh(self, **kwargs):
         return self._cluster.refresh(index=self._name, **kwargs)
 
@@ -0,0 +1,127 @@
+import inspect
+import threading
+
+from .document import CompactDocument
+from .util import LRUCache
+
+_MISSING = object()
+
+
+def _set_instances(targets, instances):
+    for key, target in targets:
+        instance = instances.get(key)
+        if isinstance(target, CompactDocument):
+            target._set_instance(instance)
+        else:
+            target.__dict__['instance'] = instance
+
+
+def populate_instances(instance_mapper, targets):
+    """Calls the instance mapper with keys of the ``targets`` and sets
+    an ``instance`` for every target. ``targets`` is a list of
+    ``(key, document_or_bucket)`` pairs.
+    """
+    instances = instance_mapper([key for key, _ in targets]) \
+        if instance_mapper else {}
+    if inspect.isawaitable(instances):
+        if hasattr(instances, 'close'):
+            instances.close()
+        raise TypeError(
+            'Instance mapper is asynchronous, '
+            'call `await result.populate_instances()` first'
+        )
+    _set_instances(targets, instances)
+
+
+async def populate_instances_async(instance_mapper, targets):
+    """Same as :func:`populate_instances` but also supports asynchronous
+    instance mappers.
+    """
+    instances = instance_mapper([key for key, _ in targets])
+    if inspect.isawaitable(instances):
+        instances = await instances
+    _set_instances(targets, instances)
+
+
+class CachedInstanceMapper(object):
+    """Wraps an instance mapper and caches its results between queries.
+
+    Only ids that are missing in the cache are passed to the wrapped mapper.
+    Ids that the wrapped mapper does not return are cached as missing too.
+    The wrapped mapper can be asynchronous.
+    Use a separate cached mapper for every document class:
+
+    .. code-block:: python
+
+       sq = sq.with_instance_mapper({
+           ProductDocument: CachedInstanceMapper(
+               get_products_by_ids, maxsize=10000, ttl=60
+           ),
+           SellerDocument: CachedInstanceMapper(get_sellers_by_ids, ttl=300),
+       })
+
+    :param instance_mapper: callable that takes a list of ids and returns
+       a dictionary of the instances by id or an awaitable of it
+    :param maxsize: maximum number of cached instances
+    :param ttl: time in seconds after which a cached instance expires,
+       by default instances never expire
+    :param cache: object with ``get_many`` and ``set_many`` methods,
+       :class:`~elasticmagic.util.LRUCache` is used by default
+    """
+
+    def __init__(
+            self, instance_mapper, maxsize=1024, ttl=None, cache=None
+    ):
+        self.instance_mapper = instance_mapper
+        if cache is None:
+            cache = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        if not total:
+            return 0.0
+        return self.hits / total
+
+    def _get_cached(self, ids):
+        ids = list(dict.fromkeys(ids))
+        instances = self.cache.get_many(ids)
+        missing_ids = [_id for _id in ids if _id not in instances]
+        with self._stats_lock:
+            self.hits += len(instances)
+            self.misses += len(missing_ids)
+        instances = {
+            _id: instance for _id, instance in instances.items()
+            if instance is not _MISSING
+        }
+        return instances, missing_ids
+
+    def _update_cache(self, instances, missing_ids, new_instances):
+        cached_instances = dict.fromkeys(missing_ids, _MISSING)
+        cached_instances.update(new_instances)
+        self.cache.set_many(cached_instances)
+        instances.update(new_instances)
+        return instances
+
+    async def _update_cache_async(self, instances, missing_ids, new_instances):
+        return self._update_cache(
+            instances, missing_ids, await new_instances
+        )
+
+    def __call__(self, ids):
+        instances, missing_ids = self._get_cached(ids)
+        if not missing_ids:
+            return instances
+        new_instances = self.instance_mapper(missing_ids)
+        if inspect.isawaitable(new_instances):
+            return self._update_cache_async(
+                instances, missing_ids, new_instances
+            )
+        return self._update_cache(instances, missing_ids, new_instances)
+
+    def clear(self):
+        self.cache.clear()
@@ -0,0 +1,476 @@
+import threading
+
+from .attribute import AttributedField
+from .expression import Bool
+from .expression import ConstantScore
+from .expression import Exists
+from .expression import Expression
+from .expression import Field
+from .expression import Ids
+from .expression import Param
+from .expression import Range
+from .expression import Term
+from .expression import Terms
+from .util import get_fingerprint
+
+__all__ = [
+    'QueryOptimizer', 'OptimizationReport', 'QUERY', 'SCORE', 'FILTER',
+]
+
+# contexts of the optimized expressions:
+# every hit matches the expression and only relative scores are used
+QUERY = 'query'
+# scores of the expression are used as is
+SCORE = 'score'
+# the expression does not affect scores
+FILTER = 'filter'
+
+_BOOL_CLAUSES = ('must', 'filter', 'should', 'must_not')
+_CONJUNCTION_CLAUSES = frozenset(['must', 'filter', 'must_not'])
+# queries that give the same score to every matched document
+_CONSTANT_SCORE_QUERIES = (ConstantScore, Exists, Ids, Range, Terms)
+_LOWER_BOUNDS = frozenset(['gt', 'gte'])
+_UPPER_BOUNDS = frozenset(['lt', 'lte'])
+_MERGEABLE_RANGE_PARAMS = frozenset([
+    'gt', 'gte', 'lt', 'lte', 'format', 'time_zone',
+])
+
+
+def _get_clauses(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
+
+
+def _count_clauses(expr):
+    if isinstance(expr, Bool):
+        return 1 + sum(
+            _count_clauses(clause)
+            for clause_name in _BOOL_CLAUSES
+            for clause in _get_clauses(expr.params.get(clause_name))
+        )
+    if isinstance(expr, ConstantScore):
+        return 1 + sum(
+            map(_count_clauses, _get_clauses(expr.params.get('filter')))
+        )
+    return 1
+
+
+def _is_filter_bool(expr):
+    return isinstance(expr, Bool) and \
+        set(expr.params).issubset(('filter', 'must_not'))
+
+
+def _can_flatten(expr, keep_required):
+    """Checks that the ``bool`` query in ``must`` or ``filter`` can be
+    replaced with its clauses.
+    """
+    return (
+        isinstance(expr, Bool) and
+        _CONJUNCTION_CLAUSES.issuperset(expr.params) and
+        (not keep_required or 'must' in expr.params or 'filter' in expr.params)
+    )
+
+
+def _get_field_name(field):
+    if isinstance(field, AttributedField):
+        return field.get_field_name()
+    if isinstance(field, Field):
+        return field.get_name()
+    return field
+
+
+def _get_terms(expr):
+    """Returns ``(field_key, values)`` for term and terms queries that can
+    be merged or ``None``.
+    """
+    if isinstance(expr, Term):
+        values = [expr.query]
+    elif isinstance(expr, Terms):
+        values = expr.terms
+    else:
+        return None
+    if expr.params or isinstance(values, Param) or any(
+            isinstance(v, Expression) for v in values
+    ):
+        return None
+    if _get_field_name(expr.field) == '_id':
+        # _id queries are compiled differently depending on document types
+        return None
+    return get_fingerprint(expr.field), values
+
+
+def _unique(clauses):
+    seen = set()
+    unique_clauses = []
+    for clause in clauses:
+        fingerprint = get_fingerprint(clause)
+        if fingerprint not in seen:
+            seen.add(fingerprint)
+            unique_clauses.append(clause)
+    return unique_clauses
+
+
+class OptimizationReport(object):
+    """Counters of the rewrites made by :class:`QueryOptimizer`.
+
+    ``clauses_before`` and ``clauses_after`` are numbers of expressions in
+    the optimized trees, their difference is available as ``reduction``.
+    """
+
+    counters = (
+        'clauses_before', 'clauses_after', 'flattened', 'unwrapped',
+        'deduplicated', 'merged', 'moved_to_filter',
+    )
+
+    def __init__(self):
+        for name in self.counters:
+            setattr(self, name, 0)
+
+    @property
+    def reduction(self):
+        return self.clauses_before - self.clauses_after
+
+    def update(self, report):
+        for name in self.counters:
+            setattr(self, name, getattr(self, name) + getattr(report, name))
+
+    def __repr__(self):
+        return '<{} {}>'.format(
+            self.__class__.__name__,
+            ' '.join(
+                '{}={}'.format(name, getattr(self, name))
+                for name in self.counters
+            )
+        )
+
+
+class QueryOptimizer(object):
+    """Rewrites ``bool``, ``constant_score``, ``terms`` and ``range``
+    queries into smaller equivalent ones before compilation:
+
+    - nested ``bool`` queries are flattened into the parent and
+      ``bool`` queries with a single clause are unwrapped;
+    - duplicate ``filter`` and ``must_not`` clauses are removed;
+    - ``term`` and ``terms`` queries on the same field are merged in
+      ``must_not`` and in ``should`` of non-scoring ``bool`` queries;
+    - clauses that give a constant score (``range``, ``terms``, ``exists``,
+      ``ids``, ``constant_score``) are moved from ``must`` into ``filter``
+      when only relative scores are used, this shifts scores of all hits
+      by the same value;
+    - ``constant_score`` in a non-scoring context is replaced with its
+      filter.
+
+    Usually it is enabled by :meth:`.SearchQuery.with_optimizer`. Counters
+    of all optimized queries are accumulated in the ``report`` attribute.
+
+    :param merge_ranges: merge ``range`` filters on the same field into
+       a single one. Only enable it when the fields hold single values:
+       a document with several values can match both ranges but not the
+       merged range.
+    """
+
+    def __init__(self, merge_ranges=False):
+        self.merge_ranges = merge_ranges
+        self.report = OptimizationReport()
+        self._report_lock = threading.Lock()
+
+    def fingerprint(self):
+        return '{}(merge_ranges={!r})'.format(
+            self.__class__.__name__, self.merge_ranges
+        )
+
+    def optimize(self, expr, context=QUERY, report=None):
+        """Returns the optimized expression. Unchanged subtrees are returned
+        as is.
+
+        :param context: :data:`QUERY` for the main query, :data:`SCORE` when
+           absolute scores are used (for instance with ``min_score``),
+           :data:`FILTER` for non-scoring queries
+        :param report: :class:`OptimizationReport` to add counters to
+        """
+        run_report = OptimizationReport()
+        run_report.clauses_before = _count_clauses(expr)
+        optimized_expr = self._optimize(expr, context, run_report)
+        run_report.clauses_after = _count_clauses(optimized_expr)
+        with self._report_lock:
+            self.report.update(run_report)
+        if report is not None:
+            report.update(run_report)
+        return optimized_expr
+
+    def _optimize(self, expr, context, report):
+        if isinstance(expr, Bool):
+            return self._optimize_bool(expr, context, report)
+        if isinstance(expr, ConstantScore):
+            return self._optimize_constant_score(expr, context, report)
+        return expr
+
+    def _optimize_constant_score(self, expr, context, report):
+        filter_expr = expr.params.get('filter')
+        if 'query' in expr.params or not isinstance(filter_expr, Expression):
+            return expr
+        optimized_filter = self._optimize(filter_expr, FILTER, report)
+        if context == FILTER:
+            report.unwrapped += 1
+            return optimized_filter
+        if optimized_filter is filter_expr:
+            return expr
+        params = dict(expr.params)
+        params['filter'] = optimized_filter
+        return ConstantScore(**params)
+
+    def _optimize_bool(self, expr, context, report):
+        params = expr.params
+        extra_params = {
+            k: v for k, v in params.items() if k not in _BOOL_CLAUSES
+        }
+        if context == FILTER:
+            must_context = should_context = FILTER
+        elif context == QUERY:
+            # should clauses change scores only of the documents they match
+            must_context, should_context = QUERY, SCORE
+        else:
+            must_context = should_context = SCORE
+        original_clauses = {
+            clause_name: _get_clauses(params.get(clause_name))
+            for clause_name in _BOOL_CLAUSES
+        }
+        clauses = {
+            'must': [
+                self._optimize(c, must_context, report)
+                for c in original_clauses['must']
+            ],
+            'filter': [
+                self._optimize(c, FILTER, report)
+                for c in original_clauses['filter']
+            ],
+            'must_not': [
+                self._optimize(c, FILTER, report)
+                for c in original_clauses['must_not']
+            ],
+            'should': [
+                self._optimize(c, should_context, report)
+                for c in original_clauses['should']
+            ],
+        }
+        # should clauses are treated as a disjunction of filters
+        is_disjunction = (
+            context == FILTER and
+            params.get('minimum_should_match') in (None, 1)
+        )
+
+        # without must and filter clauses should clauses become required
+        keep_required = bool(clauses['should']) and \
+            'minimum_should_match' not in params
+        self._flatten_must(clauses, keep_required, report)
+        self._move_to_filter(clauses, context, report)
+        self._flatten_filter(clauses, keep_required, report)
+        self._flatten_must_not(clauses, keep_required, report)
+        if is_disjunction:
+            self._flatten_should(clauses, report)
+
+        for clause_name in ('filter', 'must_not') + (
+                ('should',) if is_disjunction else ()
+        ):
+            unique_clauses = _unique(clauses[clause_name])
+            report.deduplicated += \
+                len(clauses[clause_name]) - len(unique_clauses)
+            clauses[clause_name] = unique_clauses
+
+        clauses['must_not'] = self._merge_terms(clauses['must_not'], report)
+        if is_disjunction:
+            clauses['should'] = self._merge_terms(clauses['should'], report)
+        if self.merge_ranges:
+            clauses['filter'] = self._merge_ranges(clauses['filter'], report)
+
+        non_empty = [n for n in _BOOL_CLAUSES if clauses[n]]
+        if (
+                not extra_params and len(non_empty) == 1 and
+                len(clauses[non_empty[0]]) == 1 and (
+                    non_empty[0] in ('must', 'should') or
+                    non_empty[0] == 'filter' and context == FILTER
+                )
+        ):
+            report.unwrapped += 1
+            return clauses[non_empty[0]][0]
+
+        if all(
+                len(clauses[n]) == len(original_clauses[n]) and
+                all(a is b for a, b in zip(clauses[n], original_clauses[n]))
+                for n in _BOOL_CLAUSES
+        ):
+            return expr
+
+        bool_params = dict(extra_params)
+        for clause_name in non_empty:
+            clause_list = clauses[clause_name]
+            bool_params[clause_name] = \
+                clause_list[0] if len(clause_list) == 1 else clause_list
+        return Bool(**bool_params)
+
+    @staticmethod
+    def _flatten_must(clauses, keep_required, report):
+        must = []
+        for clause in clauses['must']:
+            if _can_flatten(clause, keep_required):
+                report.flattened += 1
+                for clause_name in _CONJUNCTION_CLAUSES:
+                    sub_clauses = _get_clauses(clause.params.get(clause_name))
+                    if clause_name == 'must':
+                        must.extend(sub_clauses)
+                    else:
+                        clauses[clause_name].extend(sub_clauses)
+            else:
+                must.append(clause)
+        clauses['must'] = must
+
+    @staticmethod
+    def _move_to_filter(clauses, context, report):
+        if context == FILTER:
+            moved = clauses['must']
+            scoring = []
+        elif context == QUERY:
+            moved, scoring = [], []
+            for clause in clauses['must']:
+                if (
+                        isinstance(clause, _CONSTANT_SCORE_QUERIES) or
+                        _is_filter_bool(clause)
+                ):
+                    moved.append(clause)
+                else:
+                    scoring.append(clause)
+        else:
+            return
+        report.moved_to_filter += len(moved)
+        clauses['must'] = scoring
+        clauses['filter'] = moved + clauses['filter']
+
+    @staticmethod
+    def _flatten_filter(clauses, keep_required, report):
+        filters = []
+        for clause in clauses['filter']:
+            if _can_flatten(clause, keep_required):
+                report.flattened += 1
+                filters.extend(_get_clauses(clause.params.get('must')))
+                filters.extend(_get_clauses(clause.params.get('filter')))
+                clauses['must_not'].extend(
+                    _get_clauses(clause.params.get('must_not'))
+                )
+            else:
+                filters.append(clause)
+        clauses['filter'] = filters
+
+    @staticmethod
+    def _flatten_must_not(clauses, keep_required, report):
+        # a filter clause would make optional should clauses required
+        can_add_filter = not keep_required or bool(
+            clauses['must'] or clauses['filter']
+        )
+        must_not = []
+        for clause in clauses['must_not']:
+            if not isinstance(clause, Bool):
+                must_not.append(clause)
+                continue
+            clause_names = set(clause.params)
+            sub_clauses = [
+                sub_clause
+                for clause_name in _BOOL_CLAUSES
+                for sub_clause in _get_clauses(clause.params.get(clause_name))
+            ]
+            if clause_names == {'should'}:
+                # not (a or b) is (not a) and (not b)
+                report.flattened += 1
+                must_not.extend(sub_clauses)
+            elif (
+                    can_add_filter and
+                    len(sub_clauses) == 1 and
+                    clause_names == {'must_not'}
+            ):
+                # not (not a) is a
+                report.flattened += 1
+                clauses['filter'].extend(sub_clauses)
+            elif (
+                    len(sub_clauses) == 1 and
+                    clause_names.issubset(('must', 'filter'))
+            ):
+                report.flattened += 1
+                must_not.extend(sub_clauses)
+            else:
+                must_not.append(clause)
+        clauses['must_not'] = must_not
+
+    @staticmethod
+    def _flatten_should(clauses, report):
+        should = []
+        for clause in clauses['should']:
+            if isinstance(clause, Bool) and set(clause.params) == {'should'}:
+                report.flattened += 1
+                should.extend(_get_clauses(clause.params['should']))
+            else:
+                should.append(clause)
+        clauses['should'] = should
+
+    @staticmethod
+    def _merge_terms(clauses, report):
+        merged_clauses = []
+        merged_values = {}
+        for clause in clauses:
+            terms = _get_terms(clause)
+            if terms is None:
+                merged_clauses.append(clause)
+                continue
+            field_key, values = terms
+            if field_key not in merged_values:
+                merged_values[field_key] = (len(merged_clauses), list(values))
+                merged_clauses.append(clause)
+                continue
+            report.merged += 1
+            ix, field_values = merged_values[field_key]
+            field_values.extend(values)
+            merged_clauses[ix] = Terms(
+                clause.field, _unique(field_values)
+            )
+        return merged_clauses
+
+    @staticmethod
+    def _merge_ranges(clauses, report):
+        merged_clauses = []
+        merged_ranges = {}
+        for clause in clauses:
+            if (
+                    not isinstance(clause, Range) or clause.range_params or
+                    not _MERGEABLE_RANGE_PARAMS.issuperset(clause.params)
+            ):
+                merged_clauses.append(clause)
+                continue
+            bounds = {
+                k: v for k, v in clause.params.items()
+                if k in _LOWER_BOUNDS or k in _UPPER_BOUNDS
+            }
+            range_key = (
+                get_fingerprint(clause.field),
+                clause.params.get('format'),
+                clause.params.get('time_zone'),
+            )
+            if range_key in merged_ranges:
+                ix, merged_bounds = merged_ranges[range_key]
+                if not (
+                        _LOWER_BOUNDS.intersection(bounds) and
+                        _LOWER_BOUNDS.intersection(merged_bounds) or
+                        _UPPER_BOUNDS.intersection(bounds) and
+                        _UPPER_BOUNDS.intersection(merged_bounds)
+                ):
+                    report.merged += 1
+                    merged_bounds.update(bounds)
+                    merged_clauses[ix] = Range(
+                        clause.field,
+                        format=range_key[1], time_zone=range_key[2],
+                        **merged_bounds
+                    )
+                    continue
+            merged_ranges[range_key] = (len(merged_clauses), bounds)
+            merged_clauses.append(clause)
+        return merged_clauses
@@ -1,5 +1,13 @@
+import asyncio
+from collections.abc import Sequence
+
+from .columns import HitColumnsBuilder
 from .document import DynamicDocument
 from .document import get_doc_type_for_hit
+from .mapper import populate_instances
+from .mapper import populate_instances_async
+from .stream import DEFAULT_CHUNK_SIZE
+from .stream import JsonStreamReader
 
 
 class Result(object):
@@ -7,10 +15,41 @@ class Result(object):
         self.raw = raw_result
 
 
+class LazyHits(Sequence):
+    """Sequence of hits where every document is created on the first access.
+    """
+    def __init__(self, raw_hits, build_hit):
+        self._raw_hits = raw_hits
+        self._build_hit = build_hit
+        self._docs = [None] * len(raw_hits)
+
+    def __len__(self):
+        return len(self._raw_hits)
+
+    def __getitem__(self, ix):
+        if isinstance(ix, slice):
+            return [self[i] for i in range(*ix.indices(len(self)))]
+        doc = self._docs[ix]
+        if doc is None:
+            doc = self._docs[ix] = self._build_hit(self._raw_hits[ix])
+        return doc
+
+    def __iter__(self):
+        for ix in range(len(self._raw_hits)):
+            yield self[ix]
+
+    def __repr__(self):
+        return '<{} hits={} materialized={}>'.format(
+            self.__class__.__name__,
+            len(self),
+            len(self._docs) - self._docs.count(None),
+        )
+
+
 class SearchResult(Result):
     def __init__(
             self, raw_result, aggregations=None, doc_cls_map=None,
-            instance_mapper=None,
+            instance_mapper=None, lazy_hits=False, compact_documents=False,
     ):
         super(SearchResult, self).__init__(raw_result)
 
@@ -18,6 +57,7 @@ class SearchResult(Result):
 
         self._doc_cls_map = doc_cls_map or {}
         doc_classes = list(self._doc_cls_map.values())
+        self._compact_documents = compact_documents
 
         self._mapper_registry = {}
         if isinstance(instance_mapper, dict):
@@ -38,11 +78,11 @@ class SearchResult(Result):
         else:
             self.total = total
         self.max_score = hits.get('max_score')
-        self.hits = []
-        for hit in hits.get('hits', []):
-            doc_type = get_doc_type_for_hit(hit)
-            doc_cls = self._doc_cls_map.get(doc_type, DynamicDocument)
-            self.hits.append(doc_cls(_hit=hit, _result=self))
+        raw_hits = self._raw_hits = hits.get('hits', [])
+        if lazy_hits:
+            self.hits = LazyHits(raw_hits, self._build_hit)
+        else:
+            self.hits = [self._build_hit(hit) for hit in raw_hits]
 
         self.aggregations = {}
         for agg_name, agg_expr in self._query_aggs.items():
@@ -54,6 +94,7 @@ class SearchResult(Result):
             self.aggregations[agg_name] = agg_result
 
         self.scroll_id = raw_result.get('_scroll_id')
+        self.pit_id = raw_result.get('pit_id')
 
     def __iter__(self):
         return iter(self.hits)
@@ -64,13 +105,190 @@ class SearchResult(Result):
     def get_aggregation(self, name):
         return self.aggregations.get(name)
 
+    def to_columns(self, fields=None):
+        """Writes raw hits into typed column buffers without creating
+        documents. Returns :class:`~elasticmagic.columns.HitColumns`.
+
+        :param fields: list of attributed fields or field names, by default
+           ``_id`` and all fields of the document classes are used
+
+        .. code-block:: python
+
+           columns = sq.with_lazy_hits().get_result().to_columns(
+               [ProductDocument.price, ProductDocument.created_at]
+           )
+           prices = columns['price'].to_numpy()
+        """
+        return HitColumnsBuilder(
+            fields, self._doc_cls_map.values()
+        ).build(self._raw_hits)
+
+    def _build_hit(self, hit):
+        doc_type = get_doc_type_for_hit(hit)
+        doc_cls = self._doc_cls_map.get(doc_type, DynamicDocument)
+        if self._compact_documents:
+            doc_cls = doc_cls._get_compact_doc_cls()
+        return doc_cls(_hit=hit, _result=self)
+
+    def _get_instance_targets(self, doc_cls):
+        if self._compact_documents:
+            doc_cls = doc_cls._get_compact_doc_cls()
+        return [
+            (doc._id, doc) for doc in self.hits if isinstance(doc, doc_cls)
+        ]
+
     def _populate_instances(self, doc_cls):
-        docs = [doc for doc in self.hits if isinstance(doc, doc_cls)]
-        instances = self._instance_mappers.get(doc_cls)(
-            [doc._id for doc in docs]
+        populate_instances(
+            self._instance_mappers.get(doc_cls),
+            self._get_instance_targets(doc_cls)
         )
-        for doc in docs:
-            doc.__dict__['instance'] = instances.get(doc._id)
+
+    def _collect_agg_instance_targets(self):
+        targets = {}
+        seen = set()
+        while True:
+            pending = [
+                (instance_mapper, agg_result)
+                for instance_mapper, agg_results
+                in list(self._mapper_registry.items())
+                for agg_result in agg_results
+                if (id(instance_mapper), id(agg_result)) not in seen
+            ]
+            if not pending:
+                return targets
+            for instance_mapper, agg_result in pending:
+                seen.add((id(instance_mapper), id(agg_result)))
+                # building buckets of a columnar aggregation can register
+                # results of its sub aggregations
+                targets.setdefault(instance_mapper, []).extend(
+                    agg_result._get_instance_targets(instance_mapper)
+                )
+
+    async def populate_instances(self):
+        """Populates instances of all the hits and aggregation buckets
+        running instance mappers concurrently. Instance mappers can be
+        asynchronous:
+
+        .. code-block:: python
+
+           async def get_products_by_ids(ids):
+               ...
+
+           result = await sq.with_instance_mapper(get_products_by_ids) \\
+               .get_result()
+           await result.populate_instances()
+           products = [doc.instance for doc in result]
+        """
+        populators = []
+        for doc_cls, instance_mapper in self._instance_mappers.items():
+            if instance_mapper:
+                populators.append(populate_instances_async(
+                    instance_mapper, self._get_instance_targets(doc_cls)
+                ))
+        for instance_mapper, targets in \
+                self._collect_agg_instance_targets().items():
+            populators.append(
+                populate_instances_async(instance_mapper, targets)
+            )
+        await asyncio.gather(*populators)
+
+
+class StreamingSearchResult(Result):
+    """Search result that parses a raw response incrementally.
+
+    Iterating over the result yields documents one by one, hits are not
+    stored in the result. The ``total``, ``max_score``, ``scroll_id`` and
+    ``aggregations`` attributes are populated as the corresponding parts of
+    the response are parsed, so they are guaranteed to be available only
+    after the iteration is finished (see :meth:`consume`). Aggregations are
+    always built at the end.
+
+    Documents are not bound to the result so instance mappers are not
+    supported.
+    """
+
+    def __init__(
+            self, raw_stream, aggregations=None, doc_cls_map=None,
+            compact_documents=False, chunk_size=DEFAULT_CHUNK_SIZE,
+    ):
+        super(StreamingSearchResult, self).__init__({})
+
+        self._query_aggs = aggregations or {}
+        self._doc_cls_map = doc_cls_map or {}
+        self._compact_documents = compact_documents
+
+        self.error = None
+        self.took = None
+        self.timed_out = None
+        self.total = None
+        self.max_score = None
+        self.scroll_id = None
+        self.aggregations = {}
+
+        self._reader = JsonStreamReader(raw_stream, chunk_size=chunk_size)
+        self._hits = self._iter_hits()
+
+    def __iter__(self):
+        return self._hits
+
+    def consume(self):
+        """Skips all remaining hits so the whole response is parsed."""
+        for _ in self._hits:
+            pass
+        return self
+
+    def get_aggregation(self, name):
+        return self.aggregations.get(name)
+
+    def _build_hit(self, hit):
+        doc_type = get_doc_type_for_hit(hit)
+        doc_cls = self._doc_cls_map.get(doc_type, DynamicDocument)
+        if self._compact_documents:
+            doc_cls = doc_cls._get_compact_doc_cls()
+        return doc_cls(_hit=hit)
+
+    def _iter_hits(self):
+        reader = self._reader
+        for key in reader.iter_object():
+            if key == 'hits':
+                for hits_key in reader.iter_object():
+                    if hits_key == 'hits':
+                        for _ in reader.iter_array():
+                            yield self._build_hit(reader.read_value())
+                    else:
+                        self._process_hits_value(
+                            hits_key, reader.read_value()
+                        )
+            else:
+                value = self.raw[key] = reader.read_value()
+                self._process_value(key, value)
+
+        raw_aggs = self.raw.get('aggregations', {})
+        mapper_registry = {}
+        for agg_name, agg_expr in self._query_aggs.items():
+            self.aggregations[agg_name] = agg_expr.build_agg_result(
+                raw_aggs.get(agg_name, {}), self._doc_cls_map,
+                mapper_registry=mapper_registry
+            )
+
+    def _process_hits_value(self, key, value):
+        if key == 'total':
+            if isinstance(value, dict):
+                self.total = value['value']
+            else:
+                self.total = value
+        elif key == 'max_score':
+            self.max_score = value
+
+    def _process_value(self, key, value):
+        if key == 'error':
+            self.error = value
+        elif key == 'took':
+            self.took = value
+        elif key == 'timed_out':
+            self.timed_out = value
+        elif key == '_scroll_id':
+            self.scroll_id = value
 
 
 class CountResult(Result):
@@ -200,5 +418,18 @@ class ClearScrollResult(Result):
         self.num_freed = raw_result.get('num_freed')
 
 
+class OpenPointInTimeResult(Result):
+    def __init__(self, raw_result):
+        super(OpenPointInTimeResult, self).__init__(raw_result)
+        self.id = raw_result.get('id')
+
+
+class ClosePointInTimeResult(Result):
+    def __init__(self, raw_result):
+        super(ClosePointInTimeResult, self).__init__(raw_result)
+        self.succeeded = raw_result.get('succeeded')
+        self.num_freed = raw_result.get('num_freed')
+
+
 class PutMappingResult(Result):
     pass
@@ -4,17 +4,29 @@
    from elasticmagic.compiler import Compiler_6_0
    from elasticmagic.compiler import Compiler_7_0
 """
+import queue
+import threading
+import time
 import warnings
 from abc import ABCMeta
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from collections import namedtuple, OrderedDict
 from collections.abc import Iterable
 
+from .cache import CompiledExpressionCache
+from .cache import LRUResultCache
+from .optimizer import QueryOptimizer
 from .util import _with_clone
+from .util import LRUCache
+from .util import PersistentTuple
+from .util import _hash_fingerprints, get_fingerprint
 from .util import merge_params, collect_doc_classes
 from .expression import Params, Source, Highlight, Rescore, Script
 
 __all__ = [
     'BaseSearchQuery', 'SearchQuery', 'SearchQueryContext',
+    'PreparedSearchQuery', 'SearchQueryIterator', 'SlicedScrollIterator',
     'FunctionScoreSettings', 'GENERAL_FUNCTION_SCORE', 'BOOST_FUNCTION_SCORE'
 ]
 
@@ -49,12 +61,14 @@ class BaseSearchQuery(metaclass=ABCMeta):
     _q = None
     _source = None
     _fields = ()
-    _filters = ()
-    _filters_meta = ()
-    _post_filters = ()
-    _post_filters_meta = ()
-    _order_by = ()
-    _aggregations = Params()
+    # sequences that are extended by generative methods share items
+    # with the sequences of the query they were cloned from
+    _filters = PersistentTuple()
+    _filters_meta = PersistentTuple()
+    _post_filters = PersistentTuple()
+    _post_filters_meta = PersistentTuple()
+    _order_by = PersistentTuple()
+    _aggregation_items = PersistentTuple()
     _ext = Params()
     _function_scores = OrderedDict([
         (
@@ -69,13 +83,15 @@ class BaseSearchQuery(metaclass=ABCMeta):
     _limit = None
     _offset = None
     _min_score = None
-    _rescores = ()
+    _rescores = PersistentTuple()
     _suggest = Params()
     _highlight = Params()
-    _docvalue_fields = ()
+    _docvalue_fields = PersistentTuple()
     _script_fields = Params()
     _track_total_hits = None
     _search_after = None
+    _point_in_time = None
+    _scroll_slice = None
 
     _cluster = None
     _index = None
@@ -86,8 +102,20 @@ class BaseSearchQuery(metaclass=ABCMeta):
 
     _instance_mapper = None
     _iter_instances = False
+    _lazy_hits = False
+    _compact_documents = False
+    _result_cache = None
+    _result_cache_ttl = None
+    _compiled_cache = None
+    _optimizer = None
 
     _cached_result = None
+    _mutable = False
+
+    _prepared_query_cache = LRUCache(maxsize=256)
+    _default_result_cache = LRUResultCache()
+    _default_compiled_cache = CompiledExpressionCache()
+    _default_optimizer = QueryOptimizer()
 
     def __init__(
             self, q=None,
@@ -131,10 +159,59 @@ class BaseSearchQuery(metaclass=ABCMeta):
         q = cls.__new__(cls)
         q.__dict__ = {
             k: v for k, v in self.__dict__.items()
-            if not k.startswith('_cached_')
+            if not k.startswith('_cached_') and k != '_mutable'
         }
         return q
 
+    @classmethod
+    def builder(cls, *args, **kwargs):
+        """Creates a mutable search query. Its generative methods modify
+        the query in place and return it instead of a copy. Call
+        :meth:`freeze` when the query is built:
+
+        .. code-block:: python
+
+           sq = SearchQuery.builder(index=index)
+           for status in statuses:
+               sq.filter(PostDocument.status != status)
+           sq = sq.limit(10).freeze()
+
+        Mutable queries must not be shared between threads.
+        """
+        search_query = cls(*args, **kwargs)
+        search_query._mutable = True
+        return search_query
+
+    def freeze(self):
+        """Makes a mutable search query immutable again and returns it."""
+        self.__dict__.pop('_mutable', None)
+        return self
+
+    @contextmanager
+    def mutate(self):
+        """Context manager that makes the query mutable inside the block.
+        Use it for a query that is not shared with other code:
+
+        .. code-block:: python
+
+           sq = search_query.clone()
+           with sq.mutate():
+               sq.filter(PostDocument.rank > 3)
+               sq.order_by(PostDocument.rank.desc())
+        """
+        if self._mutable:
+            yield self
+            return
+        self._mutable = True
+        try:
+            yield self
+        finally:
+            self.freeze()
+
+    def _before_mutation(self):
+        for key in [k for k in self.__dict__ if k.startswith('_cached_')]:
+            del self.__dict__[key]
+
     @_with_clone
     def source(self, *fields, **kwargs):
         """Controls which fields of the document's ``_source`` field
@@ -211,6 +288,21 @@ class BaseSearchQuery(metaclass=ABCMeta):
         else:
             self._search_after = sort_values
 
+    @_with_clone
+    def point_in_time(self, pit_id, keep_alive=None):
+        """Searches over the `point in time <https://www.elastic.co/guide/en/elasticsearch/reference/current/point-in-time-api.html>`_.
+        Pass ``None`` to reset point in time.
+
+        Search query with point in time must be executed without index.
+        """  # noqa:E501
+        if pit_id is None:
+            if '_point_in_time' in self.__dict__:
+                del self._point_in_time
+        else:
+            self._point_in_time = {'id': pit_id}
+            if keep_alive is not None:
+                self._point_in_time['keep_alive'] = keep_alive
+
     @_with_clone
     def docvalue_fields(self, *fields):
         """Allows to load doc values fields.
@@ -439,10 +531,27 @@ class BaseSearchQuery(metaclass=ABCMeta):
                            'profit': {'sum': {'field': 'profit'}}}}}}
         """  # noqa:E501
         if len(args) == 1 and args[0] is None:
-            if '_aggregations' in self.__dict__:
-                del self._aggregations
+            if '_aggregation_items' in self.__dict__:
+                del self._aggregation_items
         else:
-            self._aggregations = merge_params(self._aggregations, args, kwargs)
+            items = []
+            for aggs in args:
+                items.extend(aggs.items())
+            items.extend(kwargs.items())
+            self._aggregation_items = self._aggregation_items + items
+
+    @property
+    def _aggregations(self):
+        aggregations = self.__dict__.get('_cached_aggregations')
+        if aggregations is None:
+            aggs = {}
+            for agg_name, agg in self._aggregation_items:
+                if agg is None:
+                    aggs.pop(agg_name, None)
+                else:
+                    aggs[agg_name] = agg
+            aggregations = self._cached_aggregations = Params(aggs)
+        return aggregations
 
     def aggs(self, *args, **kwargs):
         """A shortcut for the :meth:`.aggregations` method
@@ -694,6 +803,131 @@ class BaseSearchQuery(metaclass=ABCMeta):
     def with_instance_mapper(self, instance_mapper):
         self._instance_mapper = instance_mapper
 
+    @_with_clone
+    def with_lazy_hits(self, lazy_hits=True):
+        """Creates documents of the search result only when the corresponding
+        hit is accessed. Useful when only a few hits or only total and
+        aggregations are used.
+        """
+        self._lazy_hits = lazy_hits
+
+    @_with_clone
+    def with_compact_documents(self, compact_documents=True):
+        """Builds hits of the search result as read-only compact documents
+        (see :class:`~elasticmagic.document.CompactDocument`). They have the
+        same attribute access but use ``__slots__`` instead of ``__dict__``
+        so big result pages take much less memory.
+        """
+        self._compact_documents = compact_documents
+
+    @_with_clone
+    def with_result_cache(self, ttl=None, cache=None, enabled=True):
+        """Caches responses of the query between search query objects.
+        Responses are stored by the compiled request so identical queries
+        share a cached response while every query gets its own result.
+
+        :param ttl: time in seconds to keep the response, by default
+           the response is kept until it is evicted
+        :param cache: :class:`~elasticmagic.cache.BaseResultCache` instance,
+           shared in-process :class:`~elasticmagic.cache.LRUResultCache`
+           is used by default
+        :param enabled: pass ``False`` to disable caching
+
+        .. code-block:: python
+
+           facets_query = search_query.limit(0).with_result_cache(ttl=60)
+        """
+        if enabled:
+            if cache is None:
+                cache = self._default_result_cache
+            self._result_cache = cache
+            self._result_cache_ttl = ttl
+        else:
+            self.__dict__.pop('_result_cache', None)
+            self.__dict__.pop('_result_cache_ttl', None)
+
+    @_with_clone
+    def with_compiled_cache(self, cache=None, enabled=True):
+        """Caches compiled query and aggregation expressions between
+        compilations so fragments that are reused by many queries
+        are compiled once:
+
+        .. code-block:: python
+
+           visible_filter = PostDocument.status.in_([1, 2])
+           base_query = search_query.filter(visible_filter) \\
+               .with_compiled_cache()
+
+        Repeated expressions share their compiled bodies, so the result of
+        :meth:`to_dict` must not be modified.
+
+        :param cache: :class:`~elasticmagic.cache.CompiledExpressionCache`
+           instance, shared in-process cache that keeps expressions by
+           identity is used by default
+        :param enabled: pass ``False`` to disable caching
+        """
+        if enabled:
+            if cache is None:
+                cache = self._default_compiled_cache
+            self._compiled_cache = cache
+        else:
+            self.__dict__.pop('_compiled_cache', None)
+
+    @_with_clone
+    def with_optimizer(self, optimizer=None, enabled=True):
+        """Optimizes the query and the post filter before compilation:
+        flattens nested ``bool`` queries, removes duplicate filters, merges
+        ``terms`` queries and moves clauses that do not affect relative
+        scores into the filter context. See
+        :class:`~elasticmagic.optimizer.QueryOptimizer` for details.
+
+        Counters of the rewrites are available as ``optimization_report``
+        of the compiled query:
+
+        .. testcode:: with_optimizer
+
+           search_query = SearchQuery().filter(
+               PostDocument.status != 0,
+               PostDocument.status != 1,
+           )
+
+        .. testcode:: with_optimizer
+
+           compiled_query = Compiler_7_0.compiled_query(
+               search_query.with_optimizer()
+           )
+           assert compiled_query.body == {
+               'query': {
+                   'bool': {
+                       'must_not': {'terms': {'status': [0, 1]}}
+                   }
+               }
+           }
+           assert compiled_query.optimization_report.reduction == 3
+
+        :param optimizer: :class:`~elasticmagic.optimizer.QueryOptimizer`
+           instance, shared default optimizer is used by default
+        :param enabled: pass ``False`` to disable optimization
+        """
+        if enabled:
+            if optimizer is None:
+                optimizer = self._default_optimizer
+            self._optimizer = optimizer
+        else:
+            self.__dict__.pop('_optimizer', None)
+
+    @_with_clone
+    def with_scroll_slice(self, slice_id, max_slices):
+        """Splits scroll into ``max_slices`` independent slices and makes the
+        query to return only documents of the ``slice_id`` slice. Pass
+        ``None`` to disable slicing.
+        """
+        if slice_id is None:
+            if '_scroll_slice' in self.__dict__:
+                del self._scroll_slice
+        else:
+            self._scroll_slice = {'id': slice_id, 'max': max_slices}
+
     @_with_clone
     def with_track_total_hits(self, track_total_hits):
         self._track_total_hits = track_total_hits
@@ -735,9 +969,12 @@ class BaseSearchQuery(metaclass=ABCMeta):
                 self._search_params = search_params
 
     def _collect_doc_classes(self):
+        collect = collect_doc_classes
+        if self._compiled_cache is not None:
+            collect = self._compiled_cache.collect_doc_classes
         return set().union(
             *map(
-                collect_doc_classes,
+                collect,
                 [
                     self._q,
                     self._source,
@@ -756,12 +993,77 @@ class BaseSearchQuery(metaclass=ABCMeta):
             )
         )
 
+    def fingerprint(self):
+        """Returns a structural fingerprint of the query. Queries that
+        make the same request have equal fingerprints. Options that are only
+        used to process the result, like instance mappers, are ignored.
+
+        Clones share fingerprints of the expressions with the original query
+        so only the changed parts are hashed again.
+        """
+        fingerprint = self.__dict__.get('_cached_fingerprint')
+        if fingerprint is None:
+            fingerprint = self._cached_fingerprint = _hash_fingerprints(
+                *map(
+                    get_fingerprint,
+                    [
+                        type(self),
+                        self._q,
+                        self._source,
+                        self._fields,
+                        self._filters,
+                        self._post_filters,
+                        self._order_by,
+                        self._aggregation_items,
+                        self._ext,
+                        self._function_scores,
+                        self._limit,
+                        self._offset,
+                        self._min_score,
+                        self._rescores,
+                        self._suggest,
+                        self._highlight,
+                        self._docvalue_fields,
+                        self._script_fields,
+                        self._track_total_hits,
+                        self._search_after,
+                        self._point_in_time,
+                        self._scroll_slice,
+                        self._index.get_name() if self._index else None,
+                        self._doc_cls,
+                        self._doc_type,
+                        self._search_params,
+                        self._optimizer,
+                    ]
+                )
+            )
+        return fingerprint
+
     @property
     def _index_or_cluster(self):
         if not self._index and not self._cluster:
             raise ValueError('Search query is not bound to index or cluster')
         return self._index or self._cluster
 
+    def _get_cluster(self):
+        if self._index:
+            return self._index.get_cluster()
+        if not self._cluster:
+            raise ValueError('Search query is not bound to index or cluster')
+        return self._cluster
+
+    def _get_prepared_query(self, compiler, key=None):
+        compiled_prepared_query = compiler.compiled_prepared_query
+        cache_key = (
+            compiled_prepared_query,
+            self.fingerprint() if key is None else key
+        )
+        compiled_query = self._prepared_query_cache.get(cache_key)
+        if compiled_query is None:
+            compiled_query = compiled_prepared_query(self)
+            self._prepared_query_cache.set(cache_key, compiled_query)
+        return compiled_query
+
     def get_compiler_context(self):
         return SearchQueryContext(self)
 
@@ -847,6 +1149,35 @@ class SearchQuery(BaseSearchQuery):
         compiler = compiler or self.get_compiler()
         return compiler.compiled_query(self).body
 
+    def prepare(self, compiler=None, key=None):
+        """Compiles the query containing :class:`.Param` placeholders once and
+        returns :class:`PreparedSearchQuery` object. Values of the parameters
+        are substituted into the compiled body on every execution.
+
+        Compiled templates are kept in the LRU cache, by default the
+        :meth:`fingerprint` of the query is used as a cache key so equal
+        queries share the template. Pass ``key`` argument to use your own key.
+
+        .. testcode:: prepare
+
+           from elasticmagic import Param
+
+           search_query = SearchQuery().filter(
+               PostDocument.user_id == Param('user_id')
+           )
+           prepared_query = search_query.prepare(Compiler_7_0)
+
+        .. testcode:: prepare
+
+           assert prepared_query.to_dict(user_id=123) == {
+               'query': {'bool': {'filter': {'term': {'user_id': 123}}}}
+           }
+        """
+        compiler = compiler or self.get_compiler()
+        return PreparedSearchQuery(
+            self, self._get_prepared_query(compiler, key=key)
+        )
+
     def get_result(self):
         """Executes current query and returns processed :class:`SearchResult`
         object. Caches result so subsequent calls with the same search query
@@ -925,6 +1256,48 @@ class SearchQuery(BaseSearchQuery):
             **kwargs
         )
 
+    def iter_all(
+            self, size=1000, scroll='1m', point_in_time=False,
+            keep_alive='1m', prefetch=True,
+    ):
+        """Iterates over all documents matched the query fetching them page by
+        page. Uses scroll api by default, pass ``point_in_time=True`` to use
+        ``search_after`` with a point in time instead (the query must be bound
+        to an index). The next page is fetched in a background thread while
+        the current one is being consumed unless ``prefetch`` is ``False``.
+
+        Returns :class:`SearchQueryIterator` that also collects statistics.
+        The scroll or point in time is released when the iteration is finished
+        or the iterator is closed, so it is better to use it as a context
+        manager.
+
+        .. code-block:: python
+
+           with search_query.iter_all(size=500) as docs:
+               for doc in docs:
+                   process(doc)
+           print(docs.pages_per_sec)
+        """
+        return SearchQueryIterator(
+            self, size=size, scroll=scroll, point_in_time=point_in_time,
+            keep_alive=keep_alive, prefetch=prefetch,
+        )
+
+    def iter_columns(
+            self, fields=None, size=1000, scroll='1m', point_in_time=False,
+            keep_alive='1m', prefetch=True,
+    ):
+        """Same as :meth:`iter_all` but yields
+        :class:`~elasticmagic.columns.HitColumns` for every page instead of
+        documents (see :meth:`SearchResult.to_columns`). Documents are not
+        created at all.
+        """
+        return SearchQueryIterator(
+            self.with_lazy_hits(), size=size, scroll=scroll,
+            point_in_time=point_in_time, keep_alive=keep_alive,
+            prefetch=prefetch,
+        ).iter_columns(fields)
+
     def __iter__(self):
         return self._iter_result(self.get_result())
 
@@ -936,6 +1309,370 @@ class SearchQuery(BaseSearchQuery):
             return list(clone)[0]
 
 
+class BaseSearchQueryIterator(object):
+    def __init__(
+            self, search_query, size=1000, scroll='1m', point_in_time=False,
+            keep_alive='1m', prefetch=True,
+    ):
+        self._search_query = search_query
+        self._size = size
+        self._scroll = scroll
+        self._use_point_in_time = point_in_time
+        self._keep_alive = keep_alive
+        self._prefetch = prefetch
+
+        self._scroll_id = None
+        self._pit_id = None
+        self._page_query = None
+
+        self.pages = 0
+        self.hits = 0
+        self._started_at = None
+        self._finished_at = None
+
+    @property
+    def elapsed(self):
+        """Seconds since the first request."""
+        if self._started_at is None:
+            return 0.0
+        return (self._finished_at or time.monotonic()) - self._started_at
+
+    @property
+    def pages_per_sec(self):
+        elapsed = self.elapsed
+        return self.pages / elapsed if elapsed else 0.0
+
+    @property
+    def hits_per_sec(self):
+        elapsed = self.elapsed
+        return self.hits / elapsed if elapsed else 0.0
+
+    def _get_index_name(self):
+        index = self._search_query._index
+        if index is None:
+            raise ValueError(
+                'Search query must be bound to an index '
+                'to use point in time'
+            )
+        return index.get_name()
+
+    def _make_page_query(self):
+        page_query = self._search_query.limit(self._size)
+        if self._use_point_in_time:
+            return page_query.point_in_time(self._pit_id, self._keep_alive)
+        if not page_query._order_by:
+            page_query = page_query.order_by('_doc')
+        return page_query
+
+    def _make_next_page_query(self, result):
+        page_query = self._page_query.clone()
+        page_query.search_after(*result.hits[-1].get_sort_values())
+        return page_query.point_in_time(
+            result.pit_id or self._pit_id, self._keep_alive
+        )
+
+    def _get_scroll_params(self):
+        context = self._search_query.get_context()
+        return dict(
+            doc_cls=context.doc_classes,
+            instance_mapper=context.instance_mapper,
+            lazy_hits=context.lazy_hits,
+            compact_documents=context.compact_documents,
+        )
+
+    def _update_cursor(self, result):
+        if result.scroll_id:
+            self._scroll_id = result.scroll_id
+        if result.pit_id:
+            self._pit_id = result.pit_id
+
+    def _count_page(self, result):
+        if self._started_at is None:
+            self._started_at = time.monotonic()
+        if result.hits:
+            self.pages += 1
+            self.hits += len(result.hits)
+
+    def _process_page(self, result):
+        self._count_page(result)
+        self._update_cursor(result)
+
+    def _is_last_page(self, result):
+        if self._use_point_in_time:
+            return len(result.hits) < self._size
+        return not result.hits
+
+    def _finish(self):
+        if self._finished_at is None and self._started_at is not None:
+            self._finished_at = time.monotonic()
+
+    def __repr__(self):
+        return '<{} pages={} hits={} pages_per_sec={:.2f}>'.format(
+            self.__class__.__name__, self.pages, self.hits,
+            self.pages_per_sec
+        )
+
+
+class SearchQueryIterator(BaseSearchQueryIterator):
+    """Iterator over all documents of the search query returned by
+    :meth:`SearchQuery.iter_all`. Has ``pages``, ``hits``, ``elapsed``,
+    ``pages_per_sec`` and ``hits_per_sec`` attributes.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(SearchQueryIterator, self).__init__(*args, **kwargs)
+        self._docs = self._iter_docs()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._docs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self._docs.close()
+
+    def _iter_docs(self):
+        pages = self._iter_pages()
+        try:
+            for result in pages:
+                for doc in self._search_query._iter_result(result):
+                    yield doc
+        finally:
+            pages.close()
+
+    def iter_columns(self, fields=None):
+        """Yields :class:`~elasticmagic.columns.HitColumns` for every page.
+        """
+        pages = self._iter_pages()
+        try:
+            for result in pages:
+                yield result.to_columns(fields)
+        finally:
+            pages.close()
+
+    def _fetch_first_page(self):
+        search_query = self._search_query
+        if self._use_point_in_time:
+            cluster = search_query._get_cluster()
+            self._pit_id = cluster.open_point_in_time(
+                self._get_index_name(), self._keep_alive
+            ).id
+            self._page_query = self._make_page_query()
+            return cluster.search(self._page_query)
+        self._page_query = self._make_page_query()
+        return search_query._index_or_cluster.search(
+            self._page_query, scroll=self._scroll
+        )
+
+    def _fetch_next_page(self, result):
+        if self._use_point_in_time:
+            return self._search_query._get_cluster().search(
+                self._make_next_page_query(result)
+            )
+        return self._search_query._get_cluster().scroll(
+            result.scroll_id, self._scroll, **self._get_scroll_params()
+        )
+
+    def _iter_pages(self):
+        executor = None
+        next_page = None
+        try:
+            result = self._fetch_first_page()
+            if self._prefetch:
+                executor = ThreadPoolExecutor(max_workers=1)
+            while True:
+                self._process_page(result)
+                if self._is_last_page(result):
+                    if result.hits:
+                        yield result
+                    break
+                if executor:
+                    next_page = executor.submit(
+                        self._fetch_next_page, result
+                    )
+                yield result
+                if next_page:
+                    result = next_page.result()
+                    next_page = None
+                else:
+                    result = self._fetch_next_page(result)
+        finally:
+            self._finish()
+            if next_page:
+                # the next page holds the actual scroll id
+                try:
+                    self._update_cursor(next_page.result())
+                except Exception:
+                    pass
+            if executor:
+                executor.shutdown()
+            self._release()
+
+    def _release(self):
+        cluster = self._search_query._get_cluster()
+        if self._scroll_id:
+            cluster.clear_scroll(self._scroll_id)
+            self._scroll_id = None
+        if self._pit_id:
+            cluster.close_point_in_time(self._pit_id)
+            self._pit_id = None
+
+
+class BaseSlicedScrollIterator(BaseSearchQueryIterator):
+    def __init__(
+            self, search_query, slices, size=1000, scroll='1m',
+            max_buffered_pages=None,
+    ):
+        super(BaseSlicedScrollIterator, self).__init__(
+            search_query, size=size, scroll=scroll, prefetch=False
+        )
+        self.slices = slices
+        self._max_buffered_pages = max_buffered_pages or slices
+
+    def _make_slice_iterators(self, iterator_cls):
+        if self.slices == 1:
+            # elasticsearch requires at least 2 slices
+            slice_queries = [self._search_query]
+        else:
+            slice_queries = [
+                self._search_query.with_scroll_slice(slice_id, self.slices)
+                for slice_id in range(self.slices)
+            ]
+        return [
+            iterator_cls(
+                slice_query,
+                size=self._size, scroll=self._scroll, prefetch=False,
+            )
+            for slice_query in slice_queries
+        ]
+
+
+class SlicedScrollIterator(BaseSlicedScrollIterator):
+    """Iterator over all documents of the search query that scrolls slices
+    of the query concurrently in a thread pool. Documents of different slices
+    are mixed. At most ``max_buffered_pages`` pages are kept waiting for
+    consumption, slices are paused until the buffer has free space.
+
+    Returned by :meth:`.Index.parallel_scan`.
+    """
+
+    _QUEUE_TIMEOUT = 0.1
+
+    def __init__(self, *args, **kwargs):
+        super(SlicedScrollIterator, self).__init__(*args, **kwargs)
+        self._pages_queue = queue.Queue(maxsize=self._max_buffered_pages)
+        self._stopped = threading.Event()
+        self._docs = self._iter_docs()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._docs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self._docs.close()
+
+    def _put(self, item):
+        while not self._stopped.is_set():
+            try:
+                self._pages_queue.put(item, timeout=self._QUEUE_TIMEOUT)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _scroll_slice(self, slice_iterator):
+        pages = slice_iterator._iter_pages()
+        try:
+            for result in pages:
+                if not self._put((result, None)):
+                    break
+        except Exception as e:
+            self._put((None, e))
+        finally:
+            pages.close()
+            self._put((None, None))
+
+    def _iter_docs(self):
+        slice_iterators = self._make_slice_iterators(SearchQueryIterator)
+        executor = ThreadPoolExecutor(max_workers=self.slices)
+        try:
+            for slice_iterator in slice_iterators:
+                executor.submit(self._scroll_slice, slice_iterator)
+            running_slices = self.slices
+            while running_slices:
+                result, error = self._pages_queue.get()
+                if error is not None:
+                    raise error
+                if result is None:
+                    running_slices -= 1
+                    continue
+                self._count_page(result)
+                for doc in self._search_query._iter_result(result):
+                    yield doc
+        finally:
+            self._finish()
+            self._stopped.set()
+            executor.shutdown()
+
+
+class PreparedSearchQuery(object):
+    """Search query compiled with :class:`.Param` placeholders.
+
+    Usually it is created by :meth:`SearchQuery.prepare` method.
+    """
+
+    def __init__(self, search_query, compiled_query):
+        self._search_query = search_query
+        self._compiled_query = compiled_query
+        self._context = None
+
+    @property
+    def param_names(self):
+        return self._compiled_query.param_names
+
+    def bind(self, **values):
+        """Returns compiled query with substituted parameter values.
+        """
+        bound = self._compiled_query.bind(**values)
+        if self._compiled_query.search_query is not self._search_query:
+            # template was compiled from an equal query but results must be
+            # processed with the options of this one
+            if self._context is None:
+                self._context = self._search_query.get_context()
+            bound.expression = self._context
+            bound.search_query = self._search_query
+            bound.doc_classes = self._context.doc_classes
+            bound.doc_types = self._context.doc_types
+            bound.result_cache = self._context.result_cache
+            bound.result_cache_ttl = self._context.result_cache_ttl
+        return bound
+
+    def to_dict(self, **values):
+        return self.bind(**values).body
+
+    def get_result(self, **values):
+        """Executes the query with given parameter values and returns
+        :class:`SearchResult` object.
+        """
+        return self._search_query._get_cluster() \
+            ._do_compiled_request(self.bind(**values))
+
+
 class SearchQueryContext(object):
     __visit_name__ = 'search_query_context'
 
@@ -943,22 +1680,26 @@ class SearchQueryContext(object):
         self.q = search_query._q
         self.source = search_query._source
         self.fields = search_query._fields
-        self.filters = search_query._filters
-        self.filters_meta = search_query._filters_meta
-        self.post_filters = search_query._post_filters
-        self.post_filters_meta = search_query._post_filters_meta
-        self.order_by = search_query._order_by
+        self.filters = tuple(search_query._filters)
+        self.filters_meta = tuple(search_query._filters_meta)
+        self.post_filters = tuple(search_query._post_filters)
+        self.post_filters_meta = tuple(
+            search_query._post_filters_meta
+        )
+        self.order_by = tuple(search_query._order_by)
         self.aggregations = search_query._aggregations
         self.ext = search_query._ext
         self.function_scores = search_query._function_scores
         self.limit = search_query._limit
         self.offset = search_query._offset
         self.min_score = search_query._min_score
-        self.rescores = search_query._rescores
+        self.rescores = tuple(search_query._rescores)
         self.suggest = search_query._suggest
         self.highlight = search_query._highlight
         self.track_total_hits = search_query._track_total_hits
         self.search_after = search_query._search_after
+        self.point_in_time = search_query._point_in_time
+        self.scroll_slice = search_query._scroll_slice
 
         self.cluster = search_query._cluster
         self.index = search_query._index
@@ -983,13 +1724,19 @@ class SearchQueryContext(object):
             doc_types, self.doc_classes
         )
 
-        self.docvalue_fields = search_query._docvalue_fields
+        self.docvalue_fields = tuple(search_query._docvalue_fields)
         self.script_fields = search_query._script_fields
 
         self.search_params = search_query._search_params
 
         self.instance_mapper = search_query._instance_mapper
         self.iter_instances = search_query._iter_instances
+        self.lazy_hits = search_query._lazy_hits
+        self.compact_documents = search_query._compact_documents
+        self.result_cache = search_query._result_cache
+        self.result_cache_ttl = search_query._result_cache_ttl
+        self.compiled_cache = search_query._compiled_cache
+        self.optimizer = search_query._optimizer
 
     @staticmethod
     def _get_unique_doc_types(doc_types=None, doc_classes=None):
@@ -0,0 +1,133 @@
+import codecs
+import json
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+_WHITESPACES = ' \t\n\r'
+
+
+def _iter_chunks(source, chunk_size):
+    if isinstance(source, (str, bytes)):
+        for start in range(0, len(source), chunk_size):
+            yield source[start:start + chunk_size]
+    elif hasattr(source, 'read'):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    else:
+        for chunk in source:
+            yield chunk
+
+
+class JsonStreamReader(object):
+    """Incremental JSON reader.
+
+    Allows to walk through a big JSON document without parsing it entirely.
+    Containers can be entered with :meth:`iter_object` and
+    :meth:`iter_array`, any other value is parsed with :meth:`read_value`.
+
+    :param source: a ``str``/``bytes`` object, a file-like object with
+       ``read`` method or an iterable of ``str``/``bytes`` chunks
+    """
+
+    def __init__(self, source, chunk_size=DEFAULT_CHUNK_SIZE):
+        self._chunks = _iter_chunks(source, chunk_size)
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json_decoder = json.JSONDecoder()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+
+    def _read_more(self, min_size=1):
+        if self._eof:
+            return False
+        if self._pos:
+            self._buf = self._buf[self._pos:]
+            self._pos = 0
+        read_size = 0
+        for chunk in self._chunks:
+            if isinstance(chunk, bytes):
+                chunk = self._text_decoder.decode(chunk)
+            self._buf += chunk
+            read_size += len(chunk)
+            if read_size >= min_size:
+                return True
+        self._buf += self._text_decoder.decode(b'', final=True)
+        self._eof = True
+        return read_size > 0
+
+    def _peek(self):
+        while True:
+            buf = self._buf
+            pos = self._pos
+            buf_len = len(buf)
+            while pos < buf_len and buf[pos] in _WHITESPACES:
+                pos += 1
+            self._pos = pos
+            if pos < buf_len:
+                return buf[pos]
+            if not self._read_more():
+                return None
+
+    def _expect(self, chars):
+        c = self._peek()
+        if c is None or c not in chars:
+            raise ValueError(
+                'Expected one of {!r} at position {} but found {!r}'.format(
+                    chars, self._pos, c
+                )
+            )
+        self._pos += 1
+        return c
+
+    def read_value(self):
+        """Parses the next JSON value entirely."""
+        self._peek()
+        while True:
+            try:
+                value, end = self._json_decoder.raw_decode(
+                    self._buf, self._pos
+                )
+            except ValueError:
+                # read at least as much as we already have to not reparse
+                # a big value too many times
+                if not self._read_more(len(self._buf) - self._pos):
+                    raise
+                continue
+            if end == len(self._buf) and self._read_more():
+                # a number can be split between chunks
+                continue
+            self._pos = end
+            return value
+
+    def iter_object(self):
+        """Iterates over keys of the next JSON object. A value of every key
+        must be consumed before advancing to the next one.
+        """
+        self._expect('{')
+        if self._peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            key = self.read_value()
+            self._expect(':')
+            yield key
+            if self._expect(',}') == '}':
+                return
+
+    def iter_array(self):
+        """Iterates over items of the next JSON array yielding their indexes.
+        Every item must be consumed before advancing to the next one.
+        """
+        self._expect('[')
+        if self._peek() == ']':
+            self._pos += 1
+            return
+        ix = 0
+        while True:
+            yield ix
+            ix += 1
+            if self._expect(',]') == ']':
+                return
@@ -37,6 +37,10 @@ class Type(object):
     def from_python(self, value, compiler, validate=False):
         return value
 
+    def with_mapping_options(self, mapping_options):
+        """Returns the type configured by the field mapping options."""
+        return self
+
 
 class String(Type):
     __visit_name__ = 'string'
@@ -129,17 +133,90 @@ class Double(_Float):
     __visit_name__ = 'double'
 
 
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def _parse_epoch_millis(value):
+    return _EPOCH + datetime.timedelta(milliseconds=int(value))
+
+
+def _parse_epoch_second(value):
+    return _EPOCH + datetime.timedelta(seconds=float(value))
+
+
+def _parse_iso_datetime(value):
+    if value[-1:] in ('Z', 'z'):
+        value = value[:-1] + '+00:00'
+    return datetime.datetime.fromisoformat(value)
+
+
+DATE_FORMAT_PARSERS = {
+    'epoch_millis': _parse_epoch_millis,
+    'epoch_second': _parse_epoch_second,
+    'date_optional_time': _parse_iso_datetime,
+    'strict_date_optional_time': _parse_iso_datetime,
+    'strict_date_optional_time_nanos': _parse_iso_datetime,
+    'date_time': _parse_iso_datetime,
+    'strict_date_time': _parse_iso_datetime,
+    'date_time_no_millis': _parse_iso_datetime,
+    'strict_date_time_no_millis': _parse_iso_datetime,
+    'date': _parse_iso_datetime,
+    'strict_date': _parse_iso_datetime,
+    'date_hour_minute_second': _parse_iso_datetime,
+    'strict_date_hour_minute_second': _parse_iso_datetime,
+    'date_hour_minute_second_millis': _parse_iso_datetime,
+    'strict_date_hour_minute_second_millis': _parse_iso_datetime,
+}
+
+
 class Date(Type):
+    """Date type.
+
+    Numbers are decoded as epoch milliseconds (or epoch seconds when the
+    ``format`` contains only ``epoch_second``). Strings are parsed
+    according to the elasticsearch ``format`` using
+    :meth:`datetime.datetime.fromisoformat` for ISO-8601 formats, any other
+    string is parsed with :func:`dateutil.parser.parse`.
+
+    The ``format`` can also be passed as a mapping option of the field:
+    ``Field(Date, format='epoch_millis')``.
+    """
     __visit_name__ = 'date'
 
     python_type = datetime.datetime
 
-    # def __init__(self, format=None):
-    #     self.format = format
+    def __init__(self, format=None):
+        super(Date, self).__init__()
+        self.format = format
+        self._string_parsers = []
+        self._parse_number = _parse_epoch_millis
+        for format_name in (format or '').split('||'):
+            parser = DATE_FORMAT_PARSERS.get(format_name.strip())
+            if parser and parser not in self._string_parsers:
+                self._string_parsers.append(parser)
+        if not self._string_parsers:
+            self._string_parsers.append(_parse_iso_datetime)
+        if self._string_parsers == [_parse_epoch_second]:
+            self._parse_number = _parse_epoch_second
+
+    def with_mapping_options(self, mapping_options):
+        format = mapping_options.get('format')
+        if format and format != self.format:
+            return self.__class__(format=format)
+        return self
 
     def to_python(self, value):
         if value is None:
             return None
+        if isinstance(value, datetime.datetime):
+            return value
+        if isinstance(value, (int, float)):
+            return self._parse_number(value)
+        for parse in self._string_parsers:
+            try:
+                return parse(value)
+            except (ValueError, TypeError, OverflowError):
+                pass
         return dateutil.parser.parse(value)
 
     def from_python(self, value, compiler, validate=True):
@@ -1,12 +1,26 @@
-from collections.abc import Iterable, Mapping
+import copy
+import datetime
+import decimal
+import hashlib
+import threading
+import time
+import types
+import weakref
+from collections import OrderedDict
+from collections.abc import Iterable, Mapping, Sequence
 from functools import wraps
-from itertools import chain
+from itertools import chain, count
 
 
 def _with_clone(fn):
     @wraps(fn)
     def wrapper(self, *args, **kwargs):
-        clone = self.clone()
+        if getattr(self, '_mutable', False):
+            # builder mode: modify the object in place
+            self._before_mutation()
+            clone = self
+        else:
+            clone = self.clone()
         res = fn(clone, *args, **kwargs)
         if res is not None:
             return res
@@ -67,3 +81,325 @@ def merge_params(params, args, kwargs):
         new.update(a)
     new.update(kwargs)
     return type(params)(params, **new)
+
+
+def _hash_fingerprints(*parts):
+    return hashlib.blake2b(
+        '\x1f'.join(parts).encode('utf-8'), digest_size=16
+    ).hexdigest()
+
+
+_LITERAL_TYPES = (
+    bool, int, float, str, bytes, decimal.Decimal,
+    datetime.date, datetime.time, datetime.timedelta,
+)
+
+
+_EMPTY_SEQUENCE_FINGERPRINT = _hash_fingerprints('sequence')
+
+_identity_tokens = weakref.WeakKeyDictionary()
+_strong_identity_tokens = {}
+_identity_tokens_counter = count()
+_identity_tokens_lock = threading.Lock()
+
+
+def _get_identity_token(obj):
+    """Returns a number that identifies the object. Unlike :func:`id`
+    the numbers are never reused after the object is garbage collected.
+    """
+    with _identity_tokens_lock:
+        try:
+            token = _identity_tokens.get(obj)
+            if token is None:
+                token = _identity_tokens[obj] = next(_identity_tokens_counter)
+        except TypeError:
+            # the object does not support weak references so it is kept
+            # alive to not reuse its id
+            obj_id = id(obj)
+            if obj_id not in _strong_identity_tokens:
+                _strong_identity_tokens[obj_id] = (
+                    obj, next(_identity_tokens_counter)
+                )
+            token = _strong_identity_tokens[obj_id][1]
+    return token
+
+
+def _get_object_fingerprint(obj, exclude=()):
+    cls = type(obj)
+    parts = [cls.__module__, cls.__qualname__]
+    for key, value in sorted(obj.__dict__.items()):
+        if key == '_fingerprint' or key in exclude:
+            continue
+        parts.append(key)
+        parts.append(get_fingerprint(value))
+    return _hash_fingerprints(*parts)
+
+
+def get_fingerprint(value):
+    """Returns a structural fingerprint of the value: a string that is
+    equal for equal expressions, literals and containers. Fingerprints of
+    expressions are hex digests that are computed once and cached. Classes
+    and functions are compared by identity, so fingerprints are only valid
+    within the process.
+    """
+    if value is None or isinstance(value, _LITERAL_TYPES):
+        return '{}:{!r}'.format(type(value).__name__, value)
+    if isinstance(value, types.MethodType):
+        return '{}:{}'.format(
+            get_fingerprint(value.__func__), get_fingerprint(value.__self__)
+        )
+    if isinstance(value, type) or callable(value) and hasattr(
+            value, '__qualname__'
+    ):
+        # classes and functions made by the same factory have equal names
+        return '{}.{}@{}'.format(
+            value.__module__, value.__qualname__, _get_identity_token(value)
+        )
+    fingerprint = getattr(value, 'fingerprint', None)
+    if callable(fingerprint):
+        return fingerprint()
+    if isinstance(value, Mapping):
+        return '{{{}}}'.format(','.join(
+            '{}:{}'.format(get_fingerprint(k), get_fingerprint(v))
+            for k, v in value.items()
+        ))
+    if isinstance(value, (list, tuple)):
+        return '[{}]'.format(','.join(map(get_fingerprint, value)))
+    if isinstance(value, (set, frozenset)):
+        return '{{{}}}'.format(','.join(sorted(map(get_fingerprint, value))))
+    if hasattr(value, '__dict__'):
+        return _get_object_fingerprint(value)
+    return '{}:{!r}'.format(type(value).__name__, value)
+
+
+class PersistentTuple(Sequence):
+    """Immutable sequence that shares items with the sequence it was made
+    from. Adding items does not copy existing ones, the items are joined
+    into a tuple only when the sequence is read.
+    """
+    __slots__ = ('_parent', '_items', '_len', '_tuple', '_fingerprint')
+
+    def __init__(self, items=(), _parent=None):
+        self._parent = _parent
+        self._items = tuple(items)
+        self._len = len(self._items)
+        self._fingerprint = None
+        if _parent is None:
+            self._tuple = self._items
+        else:
+            self._len += _parent._len
+            self._tuple = None
+
+    def __add__(self, items):
+        if not items:
+            return self
+        if not self._len:
+            return PersistentTuple(items)
+        return PersistentTuple(items, self)
+
+    def to_tuple(self):
+        if self._tuple is None:
+            chunks = []
+            node = self
+            while node._tuple is None:
+                chunks.append(node._items)
+                node = node._parent
+            chunks.append(node._tuple)
+            self._tuple = tuple(chain.from_iterable(reversed(chunks)))
+        return self._tuple
+
+    def _collect_doc_classes(self):
+        return collect_doc_classes(self.to_tuple())
+
+    def fingerprint(self):
+        """Returns a fingerprint of the sequence that does not depend on
+        how the items were added. Only added items are hashed, the rest is
+        taken from the fingerprint of the parent.
+        """
+        if self._fingerprint is None:
+            nodes = []
+            node = self
+            while node is not None and node._fingerprint is None:
+                nodes.append(node)
+                node = node._parent
+            if node is None:
+                fingerprint = _EMPTY_SEQUENCE_FINGERPRINT
+            else:
+                fingerprint = node._fingerprint
+            for node in reversed(nodes):
+                for item in node._items:
+                    fingerprint = _hash_fingerprints(
+                        fingerprint, get_fingerprint(item)
+                    )
+                node._fingerprint = fingerprint
+        return self._fingerprint
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        return iter(self.to_tuple())
+
+    def __getitem__(self, ix):
+        return self.to_tuple()[ix]
+
+    def __eq__(self, other):
+        if isinstance(other, PersistentTuple):
+            other = other.to_tuple()
+        return self.to_tuple() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.to_tuple())
+
+    def __repr__(self):
+        return '{}({!r})'.format(self.__class__.__name__, self.to_tuple())
+
+
+class LRUCache(object):
+    """Thread-safe mapping that keeps at most ``maxsize`` recently used items.
+
+    When ``ttl`` is set items expire in ``ttl`` seconds after they were set.
+    When ``maxbytes`` is set the least recently used items are also evicted
+    while the total size of the items computed by ``sizeof`` exceeds it.
+    """
+    def __init__(
+            self, maxsize=128, ttl=None, timer=time.monotonic,
+            maxbytes=None, sizeof=None,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.size_bytes = 0
+        self._sizeof = sizeof
+        self._timer = timer
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        value, expires_at, _ = self._data[key]
+        if expires_at is not None and expires_at <= self._timer():
+            self._delete(key)
+            raise KeyError(key)
+        self._data.move_to_end(key)
+        return value
+
+    def _delete(self, key):
+        _, _, size = self._data.pop(key)
+        self.size_bytes -= size
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                return self._get(key)
+            except KeyError:
+                return default
+
+    def get_many(self, keys):
+        """Returns a dictionary with the found items."""
+        found = {}
+        with self._lock:
+            for key in keys:
+                try:
+                    found[key] = self._get(key)
+                except KeyError:
+                    pass
+        return found
+
+    def set(self, key, value, ttl=None):
+        self.set_many({key: value}, ttl=ttl)
+
+    def set_many(self, items, ttl=None):
+        """Stores the items. ``ttl`` overrides the default time to live."""
+        if ttl is None:
+            ttl = self.ttl
+        with self._lock:
+            expires_at = None
+            if ttl is not None:
+                expires_at = self._timer() + ttl
+            for key, value in items.items():
+                size = self._sizeof(value) if self._sizeof else 0
+                if key in self._data:
+                    self._delete(key)
+                if self.maxbytes is not None and size > self.maxbytes:
+                    continue
+                self._data[key] = (value, expires_at, size)
+                self.size_bytes += size
+            while (
+                    len(self._data) > self.maxsize or
+                    self.maxbytes is not None and
+                    self.size_bytes > self.maxbytes
+            ):
+                self._delete(next(iter(self._data)))
+
+    def pop(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._get(key)
+            except KeyError:
+                return default
+            self._delete(key)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size_bytes = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            try:
+                self._get(key)
+            except KeyError:
+                return False
+            return True
+
+    def __len__(self):
+        return len(self._data)
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """Lets concurrent calls with the same key share a single call.
+    ``shared`` counts calls that were served by another call. Such calls
+    get a deep copy of the result so it can be modified by every caller.
+    """
+    def __init__(self):
+        self.shared = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.shared += 1
+                is_leader = False
+            else:
+                call = self._calls[key] = _Call()
+                is_leader = True
+
+        if not is_leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
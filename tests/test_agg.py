@@ -5,7 +5,7 @@ from elasticmagic import agg, Params, Term, Document, DynamicDocument
 from elasticmagic.compiler import Compiler_6_0
 from elasticmagic.compiler import Compiler_7_0
 from elasticmagic.expression import Field, Script
-from elasticmagic.types import Integer, Boolean, List
+from elasticmagic.types import Integer, Boolean, Float, List
 
 import pytest
 
@@ -1315,3 +1315,105 @@ def test_bucket_selector(compiler):
     assert len(r.buckets) == 2
     assert r.buckets[0].get_aggregation('sales_bucket_filter') is None
     assert r.buckets[1].get_aggregation('sales_bucket_filter') is None
+
+
+def test_columnar_buckets(compiler):
+    f = DynamicDocument.fields
+
+    a = agg.Terms(
+        f.status, type=Integer, columnar=True,
+        aggs={
+            'avg_price': agg.Avg(f.price),
+            'max_price': agg.Max(f.price),
+            'top': agg.TopHits(size=1),
+        },
+    )
+    assert compiler.compiled_expression(a).body == {
+        'terms': {'field': 'status'},
+        'aggregations': {
+            'avg_price': {'avg': {'field': 'price'}},
+            'max_price': {'max': {'field': 'price'}},
+            'top': {'top_hits': {'size': 1}},
+        }
+    }
+    a = a.clone()
+    raw_top = {'hits': {'total': 1, 'max_score': 1, 'hits': []}}
+    result = a.build_agg_result({
+        'buckets': [
+            {
+                'key': 1, 'doc_count': 10,
+                'avg_price': {'value': 5.5},
+                'max_price': {'value': 9},
+                'top': raw_top,
+            },
+            {
+                'key': 2, 'doc_count': 3,
+                'avg_price': {'value': None},
+                'max_price': {'value': None},
+                'top': raw_top,
+            },
+        ]
+    })
+    assert result._buckets is None
+
+    columns = result.columns
+    assert len(columns) == 2
+    assert columns.keys.typecode == 'q'
+    assert list(columns.keys) == [1, 2]
+    assert list(columns.doc_counts) == [10, 3]
+    assert sorted(columns.metrics) == ['avg_price', 'max_price']
+    assert columns.get_metric('avg_price')[0] == 5.5
+    assert math.isnan(columns.get_metric('avg_price')[1])
+    assert columns.get_metric('max_price')[0] == 9.0
+    assert columns.get_metric('top') is None
+    assert result._buckets is None
+
+    assert result.get_bucket(2).doc_count == 3
+    assert [b.key for b in result] == [1, 2]
+    assert result.buckets[0].get_aggregation('avg_price').value == 5.5
+
+
+def test_columnar_buckets_untyped_keys():
+    f = DynamicDocument.fields
+
+    a = agg.Terms(f.tags, columnar=True)
+    result = a.build_agg_result({
+        'buckets': [
+            {'key': 'red', 'doc_count': 4},
+            {'key': 'green', 'doc_count': 1},
+        ]
+    })
+    assert result.columns.keys == ['red', 'green']
+    assert result.columns.doc_counts.typecode == 'q'
+
+    # columns are available without columnar mode as well
+    a = agg.Histogram(f.price, interval=10, type=Float)
+    result = a.build_agg_result({
+        'buckets': [
+            {'key': 0.0, 'doc_count': 4},
+            {'key': 10.0, 'doc_count': 1},
+        ]
+    })
+    assert result.columns.keys.typecode == 'd'
+    assert list(result.columns.keys) == [0.0, 10.0]
+    assert len(result.buckets) == 2
+
+
+def test_columnar_buckets_to_numpy():
+    np = pytest.importorskip('numpy')
+    f = DynamicDocument.fields
+
+    a = agg.Terms(
+        f.status, type=Integer, columnar=True,
+        aggs={'avg_price': agg.Avg(f.price)},
+    )
+    result = a.build_agg_result({
+        'buckets': [
+            {'key': 1, 'doc_count': 10, 'avg_price': {'value': 5.5}},
+            {'key': 2, 'doc_count': 3, 'avg_price': {'value': 1.5}},
+        ]
+    })
+    columns = result.columns.to_numpy()
+    assert columns['key'].tolist() == [1, 2]
+    assert columns['doc_count'].sum() == 13
+    assert np.allclose(columns['avg_price'], [5.5, 1.5])
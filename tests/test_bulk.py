@@ -0,0 +1,323 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock
+
+from elasticsearch import TransportError
+
+import pytest
+
+from elasticmagic import Cluster, Document, Field, Index
+from elasticmagic import actions
+from elasticmagic.bulk import BulkIndexer
+from elasticmagic.compiler import Compiler_7_0
+from elasticmagic.ext.asyncio import AsyncCluster
+from elasticmagic.types import Integer, String
+
+
+class ProductDocument(Document):
+    __doc_type__ = 'product'
+
+    name = Field(String)
+    status = Field(Integer)
+
+
+class FakeBulkClient(object):
+    """Parses NDJSON bulk bodies and answers with given statuses."""
+
+    def __init__(self, statuses=None):
+        self.statuses = statuses or {}
+        self.bodies = []
+        self.params = []
+
+    def bulk(self, body, **params):
+        self.bodies.append(body)
+        self.params.append(params)
+        lines = [json.loads(line) for line in body.decode().splitlines()]
+        items = []
+        for line in lines:
+            action_name = next(iter(line), None)
+            if action_name not in ('index', 'create', 'update', 'delete'):
+                continue
+            meta = line[action_name]
+            statuses = self.statuses.get(str(meta['_id']))
+            status = statuses.pop(0) if statuses else 201
+            items.append({
+                action_name: dict(
+                    meta, _index='test', _id=str(meta['_id']), status=status,
+                    **({'error': {'type': 'rejected'}}
+                       if status >= 400 else {})
+                )
+            })
+        return {
+            'took': 1,
+            'errors': any(
+                next(iter(item.values()))['status'] >= 400 for item in items
+            ),
+            'items': items,
+        }
+
+
+class FakeAsyncBulkClient(FakeBulkClient):
+    def __init__(self, *args, **kwargs):
+        super(FakeAsyncBulkClient, self).__init__(*args, **kwargs)
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def bulk(self, body, **params):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0)
+            return super(FakeAsyncBulkClient, self).bulk(body, **params)
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.fixture
+def bulk_client():
+    return FakeBulkClient()
+
+
+@pytest.fixture
+def bulk_cluster(bulk_client):
+    return Cluster(
+        bulk_client, autodetect_es_version=False, compiler=Compiler_7_0
+    )
+
+
+@pytest.fixture
+def async_bulk_client():
+    return FakeAsyncBulkClient()
+
+
+@pytest.fixture
+def async_bulk_cluster(async_bulk_client):
+    return AsyncCluster(
+        async_bulk_client, autodetect_es_version=False, compiler=Compiler_7_0
+    )
+
+
+def gen_actions(n):
+    for i in range(1, n + 1):
+        yield actions.Index(
+            ProductDocument(_id=i, name='Product #{}'.format(i), status=i)
+        )
+
+
+def test_bulk_indexer_chunks(bulk_cluster, bulk_client):
+    indexer = Index(bulk_cluster, 'test').bulk_indexer(
+        chunk_size=3, refresh=True
+    )
+    results = list(indexer.send(gen_actions(7)))
+
+    assert [r._id for r in results] == [str(i) for i in range(1, 8)]
+    assert all(r.status == 201 for r in results)
+    assert len(bulk_client.bodies) == 3
+    assert bulk_client.params[0] == {'index': 'test', 'refresh': True}
+    assert bulk_client.bodies[0].decode().splitlines()[:2] == [
+        '{"index":{"_id":1}}',
+        '{"name":"Product #1","status":1}',
+    ]
+    assert indexer.actions == 7
+    assert indexer.chunks == 3
+    assert indexer.errors == 0
+    assert indexer.retries == 0
+    assert indexer.bytes == sum(len(body) for body in bulk_client.bodies)
+    assert indexer.actions_per_sec > 0
+    assert indexer.bytes_per_sec > 0
+
+
+def test_bulk_indexer_chunks_by_bytes(bulk_cluster, bulk_client):
+    indexer = bulk_cluster.bulk_indexer(max_chunk_bytes=110)
+    results = list(indexer.send(gen_actions(5)))
+
+    assert len(results) == 5
+    assert len(bulk_client.bodies) == 3
+    assert all(len(body) <= 110 for body in bulk_client.bodies)
+
+    bulk_client.bodies = []
+    # action that does not fit into a chunk is sent alone
+    list(bulk_cluster.bulk_indexer(max_chunk_bytes=10).send(gen_actions(2)))
+    assert len(bulk_client.bodies) == 2
+
+
+def test_bulk_indexer_retries_rejected_items(bulk_cluster, bulk_client):
+    bulk_client.statuses = {'2': [429, 429], '3': [429, 429, 429, 429]}
+    indexer = BulkIndexer(
+        bulk_cluster, max_retries=3, initial_backoff=0.5, max_backoff=1.5,
+    )
+    indexer._sleep = Mock()
+    results = list(indexer.send(gen_actions(4)))
+
+    assert [(r._id, r.status) for r in results] == [
+        ('1', 201), ('2', 201), ('3', 429), ('4', 201)
+    ]
+    assert results[2].error.type == 'rejected'
+    assert [call[0][0] for call in indexer._sleep.call_args_list] == [
+        0.5, 1.0, 1.5
+    ]
+    assert len(bulk_client.bodies) == 4
+    assert bulk_client.bodies[1].decode().count('"index"') == 2
+    assert bulk_client.bodies[3].decode().count('"index"') == 1
+    assert indexer.actions == 4
+    assert indexer.errors == 1
+    assert indexer.retries == 5
+
+
+def test_bulk_indexer_missing_items(bulk_cluster, bulk_client):
+    bulk = bulk_client.bulk
+
+    def truncated_bulk(body, **params):
+        raw_result = bulk(body, **params)
+        # the last action is always missing in the response
+        raw_result['items'] = raw_result['items'][:-1]
+        return raw_result
+
+    bulk_client.bulk = truncated_bulk
+    indexer = BulkIndexer(
+        bulk_cluster, index='test', max_retries=1, initial_backoff=0.5,
+    )
+    indexer._sleep = Mock()
+    results = list(indexer.send(gen_actions(3)))
+
+    assert [(r._id, r.status) for r in results] == [
+        ('1', 201), ('2', 201), ('3', None)
+    ]
+    assert results[2].name == 'index'
+    assert results[2]._index == 'test'
+    assert results[2].error.type == 'missing_item'
+    assert indexer._sleep.call_count == 1
+    assert indexer.retries == 1
+    assert indexer.errors == 1
+
+
+def test_bulk_indexer_retries_rejected_request(bulk_cluster, bulk_client):
+    bulk = bulk_client.bulk
+    calls = []
+
+    def bulk_with_rejection(**kwargs):
+        calls.append(kwargs)
+        if len(calls) == 1:
+            raise TransportError(429, 'es_rejected_execution_exception', {})
+        return bulk(**kwargs)
+
+    bulk_client.bulk = bulk_with_rejection
+    indexer = bulk_cluster.bulk_indexer()
+    indexer._sleep = Mock()
+    assert len(list(indexer.send(gen_actions(2)))) == 2
+    assert len(calls) == 2
+    assert calls[0] == calls[1]
+    assert indexer.retries == 2
+
+    def bulk_with_error(**kwargs):
+        raise TransportError(400, 'bad request', {})
+
+    bulk_client.bulk = bulk_with_error
+    with pytest.raises(TransportError):
+        list(bulk_cluster.bulk_indexer().send(gen_actions(2)))
+
+
+def test_bulk_indexer_serializes_in_threads(bulk_cluster):
+    indexer = bulk_cluster.bulk_indexer()
+    compiled_bulk = bulk_cluster.get_compiler().compiled_bulk
+    batches = [list(gen_actions(200)) for _ in range(8)]
+    expected = indexer._serialize_actions(compiled_bulk, batches[0])
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(
+            lambda batch: indexer._serialize_actions(compiled_bulk, batch),
+            batches
+        ))
+    assert all(serialized == expected for serialized in results)
+
+
+def test_bulk_indexer_concurrency(bulk_cluster, bulk_client):
+    indexer = bulk_cluster.bulk_indexer(chunk_size=2, concurrency=3)
+    results = list(indexer.send(gen_actions(11)))
+
+    assert sorted(int(r._id) for r in results) == list(range(1, 12))
+    assert len(bulk_client.bodies) == 6
+    assert indexer.chunks == 6
+    assert indexer.actions == 11
+
+
+@pytest.mark.asyncio
+async def test_async_bulk_indexer(async_bulk_cluster, async_bulk_client):
+    indexer = async_bulk_cluster['test'].bulk_indexer(
+        chunk_size=2, concurrency=3, executor_threshold=2, refresh=True
+    )
+    results = [r async for r in indexer.send(gen_actions(11))]
+
+    assert sorted(int(r._id) for r in results) == list(range(1, 12))
+    assert all(r.status == 201 for r in results)
+    assert len(async_bulk_client.bodies) == 6
+    assert async_bulk_client.params[0] == {'index': 'test', 'refresh': True}
+    assert 1 < async_bulk_client.max_in_flight <= 3
+    assert indexer.chunks == 6
+    assert indexer.actions == 11
+    assert indexer.bytes == sum(
+        len(body) for body in async_bulk_client.bodies
+    )
+
+
+@pytest.mark.asyncio
+async def test_async_bulk_indexer_async_actions(
+        async_bulk_cluster, async_bulk_client
+):
+    async def async_gen_actions(n):
+        for action in gen_actions(n):
+            await asyncio.sleep(0)
+            yield action
+
+    async_bulk_client.statuses = {'2': [429]}
+    indexer = async_bulk_cluster.bulk_indexer(
+        chunk_size=3, max_queued_actions=1
+    )
+    indexer._sleep = Mock(side_effect=lambda delay: asyncio.sleep(0))
+    results = [r async for r in indexer.send(async_gen_actions(5))]
+
+    assert sorted((r._id, r.status) for r in results) == [
+        ('1', 201), ('2', 201), ('3', 201), ('4', 201), ('5', 201)
+    ]
+    assert indexer._sleep.call_count == 1
+    assert indexer.retries == 1
+
+
+@pytest.mark.asyncio
+async def test_async_bulk_indexer_actions_error(async_bulk_cluster):
+    def gen_broken_actions():
+        yield from gen_actions(3)
+        raise ValueError('broken')
+
+    indexer = async_bulk_cluster.bulk_indexer(chunk_size=2)
+    with pytest.raises(ValueError):
+        [r async for r in indexer.send(gen_broken_actions())]
+    assert indexer.actions == 3
+
+
+@pytest.mark.asyncio
+async def test_async_bulk_indexer_request_error(
+        async_bulk_cluster, async_bulk_client
+):
+    async def bulk(body, **params):
+        await asyncio.sleep(0)
+        raise TransportError(500, 'internal_server_error')
+
+    async_bulk_client.bulk = bulk
+    indexer = async_bulk_cluster.bulk_indexer(chunk_size=10)
+
+    async def send():
+        return [r async for r in indexer.send(gen_actions(10000))]
+
+    with pytest.raises(TransportError):
+        await asyncio.wait_for(send(), timeout=5)
+
+
+@pytest.mark.asyncio
+async def test_async_bulk_indexer_early_exit(async_bulk_cluster):
+    indexer = async_bulk_cluster.bulk_indexer(chunk_size=10)
+    action_results = indexer.send(gen_actions(10000))
+    assert (await action_results.__anext__()).status == 201
+    await asyncio.wait_for(action_results.aclose(), timeout=5)
+    assert indexer.actions == 10
@@ -1,10 +1,25 @@
+import asyncio
+import io
+import json
+import threading
+import time
 import warnings
 from unittest.mock import Mock
 
+from elasticsearch.connection import Urllib3HttpConnection
+from elasticsearch.serializer import JSONSerializer
+from urllib3 import HTTPConnectionPool, HTTPResponse
+from urllib3.exceptions import NewConnectionError
+
 from elasticmagic import (
     actions, agg, Cluster, DynamicDocument, Index, SearchQuery
 )
 from elasticmagic import MultiSearchError
+from elasticmagic.cache import BaseResultCache, LRUResultCache
+from elasticmagic.compiler import Compiler_6_0
+from elasticmagic.ext.asyncio import AsyncCluster, AsyncIndex
+
+import pytest
 
 from .base import BaseTestCase
 
@@ -267,6 +282,140 @@ class ClusterTest(BaseTestCase):
         self.assertEqual(len(result.hits), 2)
         self.assertEqual(result.scroll_id, 'c2NhbjsxNjsxNTM4NDo1ajYydHRRZVNDeXBrS2RNODVYUkt')
 
+    def test_stream_scroll(self):
+        self.client.transport.serializer = JSONSerializer()
+        raw_result = json.dumps({
+            "_scroll_id": "c2NhbjsxNjsxNTM4NDo1ajYydHRRZVNDeXBrS2RNODVYUkt",
+            "took": 570,
+            "timed_out": False,
+            "hits": {
+                "total": 93570,
+                "max_score": 0,
+                "hits": [
+                    {
+                        "_index": "test",
+                        "_type": "product",
+                        "_id": "55377178",
+                        "_score": 0,
+                        "_source": {
+                            "name": "Super iPhone case"
+                        }
+                    },
+                    {
+                        "_index": "test",
+                        "_type": "product",
+                        "_id": "55377196",
+                        "_score": 0,
+                        "_source": {
+                            "name": "Endorphone case for iPhone 5/5s"
+                        }
+                    }
+                ]
+            }
+        })
+        connection = self.client.transport.get_connection()
+        connection.perform_request = Mock(
+            return_value=(200, {}, raw_result)
+        )
+        ProductDoc = self.index['product']
+        result = self.cluster.stream_scroll(
+            scroll_id='c2NhbjsxNjsxNDk2MTg6TndpSEZscTBSUnlVc2I4NkcwNUQwUTsx',
+            scroll='30m',
+            doc_cls=ProductDoc,
+        )
+        connection.perform_request.assert_called_with(
+            'POST', '/_search/scroll', {},
+            json.dumps({
+                'scroll_id':
+                'c2NhbjsxNjsxNDk2MTg6TndpSEZscTBSUnlVc2I4NkcwNUQwUTsx',
+                'scroll': '30m',
+            }, separators=(',', ':')).encode('utf-8')
+        )
+        self.assertIsNone(result.scroll_id)
+        self.assertIsNone(result.total)
+        docs = list(result)
+        self.assertEqual(
+            result.scroll_id,
+            'c2NhbjsxNjsxNTM4NDo1ajYydHRRZVNDeXBrS2RNODVYUkt'
+        )
+        self.assertEqual(len(docs), 2)
+        self.assertIsInstance(docs[0], ProductDoc)
+        self.assertEqual(docs[0]._id, '55377178')
+        self.assertEqual(docs[0].name, 'Super iPhone case')
+        self.assertEqual(docs[1]._id, '55377196')
+        self.assertEqual(result.total, 93570)
+        self.assertEqual(result.took, 570)
+        self.assertEqual(list(result), [])
+
+    def test_stream_search(self):
+        self.client.transport.serializer = JSONSerializer()
+        connection = self.client.transport.get_connection()
+        connection.perform_request = Mock(
+            return_value=(200, {}, json.dumps({
+                'hits': {
+                    'total': {'value': 1, 'relation': 'eq'},
+                    'hits': [{'_id': '1', '_type': 'car', '_source': {}}],
+                },
+                'aggregations': {
+                    'types': {'buckets': [{'key': 'sedan', 'doc_count': 1}]}
+                },
+            }).encode('utf-8'))
+        )
+        sq = (
+            self.index.search_query(doc_cls=self.index['car'])
+            .aggs(types=agg.Terms(self.index['car'].type))
+            .with_routing(123)
+            .with_search_params(request_cache=True)
+        )
+        result = self.cluster.stream_search(sq, index='test', scroll='1m')
+        connection.perform_request.assert_called_with(
+            'POST', '/test/_search',
+            {'routing': 123, 'request_cache': 'true', 'scroll': '1m'},
+            json.dumps(sq.to_dict(compiler=Compiler_6_0),
+                       separators=(',', ':')).encode('utf-8')
+        )
+        self.assertEqual(result.consume().total, 1)
+        self.assertEqual(
+            result.get_aggregation('types').buckets[0].key, 'sedan'
+        )
+
+    def test_stream_search_reads_socket(self):
+        self.client.transport.serializer = JSONSerializer()
+        self.client.transport.max_retries = 1
+        self.client.transport.retry_on_status = (503,)
+        raw_body = io.BytesIO(json.dumps({
+            'hits': {
+                'total': {'value': 1, 'relation': 'eq'},
+                'hits': [{'_id': '1', '_type': 'car', '_source': {}}],
+            },
+        }).encode('utf-8'))
+        failed_connection = Urllib3HttpConnection(host='es1')
+        failed_connection.pool = Mock(spec=HTTPConnectionPool)
+        failed_connection.pool.urlopen.side_effect = NewConnectionError(
+            None, 'refused'
+        )
+        connection = Urllib3HttpConnection(host='es2')
+        connection.pool = Mock(spec=HTTPConnectionPool)
+        connection.pool.urlopen.return_value = HTTPResponse(
+            raw_body, status=200, preload_content=False
+        )
+        self.client.transport.get_connection.side_effect = [
+            failed_connection, connection
+        ]
+
+        sq = self.index.search_query(doc_cls=self.index['car'])
+        result = self.cluster.stream_search(sq, index='test')
+        self.client.transport.mark_dead.assert_called_once_with(
+            failed_connection
+        )
+        self.client.transport.connection_pool.mark_live \
+            .assert_called_once_with(connection)
+        _, kwargs = connection.pool.urlopen.call_args
+        self.assertIs(kwargs['preload_content'], False)
+        self.assertEqual(raw_body.tell(), 0)
+        self.assertEqual(result.consume().total, 1)
+        self.assertEqual(raw_body.read(), b'')
+
     def test_get(self):
         self.client.get = Mock(
             return_value={
@@ -542,6 +691,73 @@ class ClusterTest(BaseTestCase):
         self.assertEqual(result.items[4].status, 200)
         self.assertEqual(bool(result.items[4].error), False)
 
+    def test_bulk_ndjson(self):
+        self.client.bulk = Mock(
+            return_value={
+                "took": 1,
+                "errors": False,
+                "items": [
+                    {
+                        "index": {
+                            "_index": "test",
+                            "_type": "car",
+                            "_id": "1",
+                            "status": 201
+                        }
+                    },
+                    {
+                        "delete": {
+                            "_index": "test",
+                            "_type": "car",
+                            "_id": "2",
+                            "status": 200
+                        }
+                    }
+                ]
+            }
+        )
+        dumped = []
+
+        def json_dumps(obj):
+            dumped.append(obj)
+            return json.dumps(obj, sort_keys=True).encode()
+
+        cluster = Cluster(
+            self.client, autodetect_es_version=False, compiler=Compiler_6_0,
+            bulk_json_dumps=json_dumps,
+        )
+        result = cluster.bulk(
+            [
+                actions.Index(
+                    self.index['car'](_id='1', name='Ёлка'), index=self.index
+                ),
+                actions.Delete(self.index['car'](_id='2'), index=self.index),
+            ],
+            refresh=True,
+        )
+        self.client.bulk.assert_called_with(
+            body=(
+                '{"index": {"_id": "1", "_index": "test", "_type": "car"}}\n'
+                '{"name": "\\u0401\\u043b\\u043a\\u0430"}\n'
+                '{"delete": {"_id": "2", "_index": "test", "_type": "car"}}\n'
+            ).encode(),
+            refresh=True,
+        )
+        self.assertEqual(len(dumped), 3)
+        self.assertEqual(len(result.items), 2)
+        self.assertEqual(result.items[1].status, 200)
+
+        buf = bytearray(b'garbage')
+        body = cluster.get_compiler().compiled_bulk.to_ndjson(
+            [actions.Delete(self.index['car'](_id='3'), index=self.index)],
+            buf=buf,
+        )
+        self.assertEqual(
+            body,
+            b'{"delete":{"_id":"3","_type":"car","_index":"test"}}\n'
+        )
+        self.assertEqual(bytes(buf), body)
+
     def test_custom_index_class(self):
         class NoSourceIndex(Index):
             def search_query(self, *args, **kwargs):
@@ -561,3 +777,225 @@ class ClusterTest(BaseTestCase):
             cluster['test'].search_query().source(None),
             {}
         )
+
+    def test_coalesce_requests(self):
+        release = threading.Event()
+        calls = []
+
+        def search(**kwargs):
+            calls.append(kwargs)
+            release.wait(5)
+            return {'hits': {'total': 1, 'hits': [{'_id': '1'}]}}
+
+        self.client.search = Mock(side_effect=search)
+        self.client.count = Mock(return_value={'count': 1})
+        cluster = Cluster(
+            self.client, autodetect_es_version=False, compiler=Compiler_6_0,
+            coalesce_requests=True,
+        )
+
+        def make_query():
+            return cluster['test'].search_query(
+                self.index['product'].status == 0
+            )
+
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(make_query().get_result())
+            )
+            for _ in range(3)
+        ]
+        for thread in threads:
+            thread.start()
+        deadline = time.monotonic() + 5
+        while (
+                cluster.coalesced_requests < 2 and
+                time.monotonic() < deadline
+        ):
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cluster.coalesced_requests, 2)
+        self.assertEqual(len(results), 3)
+        self.assertEqual([r.hits[0]._id for r in results], ['1', '1', '1'])
+        self.assertIsNot(results[0].hits[0], results[1].hits[0])
+        # every caller gets its own response
+        self.assertEqual(
+            len({id(r.raw['hits']['hits']) for r in results}), 3
+        )
+
+        # the request is sent again when there is no in-flight request
+        sq = make_query()
+        sq.get_result()
+        self.assertEqual(len(calls), 2)
+        # scroll requests are never shared
+        compiled_query = cluster.get_compiler().compiled_search_query(
+            sq, {'scroll': '1m'}
+        )
+        self.assertIsNone(compiled_query.get_request_key())
+        self.assertIsNone(
+            cluster.get_compiler().compiled_bulk([]).get_request_key()
+        )
+        self.assertNotEqual(
+            cluster.get_compiler().compiled_count_query(sq)
+            .get_request_key(),
+            cluster.get_compiler().compiled_search_query(sq)
+            .get_request_key(),
+        )
+
+
+@pytest.mark.asyncio
+async def test_async_coalesce_requests():
+    release = asyncio.Event()
+    client = Mock()
+    calls = []
+
+    async def search(**kwargs):
+        calls.append(kwargs)
+        await release.wait()
+        return {'hits': {'total': 1, 'hits': [{'_id': '1'}]}}
+
+    client.search = search
+    cluster = AsyncCluster(
+        client, autodetect_es_version=False, compiler=Compiler_6_0,
+        coalesce_requests=True,
+    )
+
+    def make_query():
+        return cluster['test'].search_query().limit(1)
+
+    tasks = [
+        asyncio.ensure_future(make_query().get_result()) for _ in range(3)
+    ]
+    await asyncio.sleep(0)
+    # cancellation of a caller does not affect other callers
+    tasks[0].cancel()
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*tasks[1:])
+
+    assert len(calls) == 1
+    assert calls[0]['body'] == {'size': 1}
+    assert cluster.coalesced_requests == 2
+    assert [r.hits[0]._id for r in results] == ['1', '1']
+    assert results[0].raw['hits'] is not results[1].raw['hits']
+    assert tasks[0].cancelled()
+
+    await make_query().get_result()
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_async_search_batching():
+    client = Mock()
+    msearch_calls = []
+
+    async def msearch(body, **kwargs):
+        msearch_calls.append(body)
+        responses = []
+        for header, query_body in zip(body[::2], body[1::2]):
+            if query_body.get('size') == 13:
+                responses.append({'error': {'type': 'parse_exception'}})
+            else:
+                responses.append({
+                    'hits': {
+                        'total': 1,
+                        'hits': [{'_id': str(query_body.get('size'))}]
+                    }
+                })
+        return {'responses': responses}
+
+    async def search(**kwargs):
+        return {'hits': {'total': 0, 'hits': []}}
+
+    client.msearch = msearch
+    client.search = Mock(side_effect=search)
+    cluster = AsyncCluster(
+        client, autodetect_es_version=False, compiler=Compiler_6_0,
+        search_batch_window=0.01, search_batch_size=3,
+    )
+    index = cluster['test']
+
+    results = await asyncio.gather(
+        *[index.search_query().limit(i).get_result() for i in range(1, 5)],
+        return_exceptions=True
+    )
+    assert [r.hits[0]._id for r in results] == ['1', '2', '3', '4']
+    assert [len(body) for body in msearch_calls] == [6, 2]
+    assert msearch_calls[0][0] == {'index': 'test'}
+    assert cluster._search_batcher.batches == 2
+    assert cluster._search_batcher.batched_queries == 4
+
+    sq = index.search_query().limit(13)
+    results = await asyncio.gather(
+        sq.get_result(), index.search_query().limit(5).get_result(),
+        return_exceptions=True
+    )
+    assert isinstance(results[0], MultiSearchError)
+    assert results[0].args[1] == [{'type': 'parse_exception'}]
+    assert results[1].hits[0]._id == '5'
+
+    # queries with parameters that are not supported by multi search
+    await index.search_query().limit(1).with_scroll('1m').get_result()
+    assert client.search.call_count == 1
+    assert len(msearch_calls) == 3
+
+
+def test_async_cluster_positional_args():
+    class ProductIndex(AsyncIndex):
+        pass
+
+    cluster = AsyncCluster(
+        Mock(), ProductIndex, False,
+        autodetect_es_version=False, compiler=Compiler_6_0,
+    )
+    assert isinstance(cluster['test'], ProductIndex)
+    assert cluster._multi_search_raise_on_error is False
+    assert cluster._search_batcher is None
+
+
+@pytest.mark.asyncio
+async def test_async_result_cache_in_executor():
+    threads = []
+
+    class DictResultCache(BaseResultCache):
+        def __init__(self):
+            super(DictResultCache, self).__init__()
+            self.data = {}
+
+        def _get(self, key):
+            threads.append(threading.get_ident())
+            return self.data.get(key)
+
+        def _set(self, key, raw_result, ttl):
+            threads.append(threading.get_ident())
+            self.data[key] = raw_result
+
+    async def search(**kwargs):
+        return {'hits': {'total': 1, 'hits': [{'_id': '1'}]}}
+
+    client = Mock()
+    client.search = Mock(side_effect=search)
+    cluster = AsyncCluster(
+        client, autodetect_es_version=False, compiler=Compiler_6_0,
+    )
+
+    cache = DictResultCache()
+    for _ in range(2):
+        result = await cluster['test'].search_query() \
+            .with_result_cache(cache=cache) \
+            .get_result()
+        assert result.hits[0]._id == '1'
+    assert client.search.call_count == 1
+    assert len(threads) == 3
+    assert threading.get_ident() not in threads
+
+    lru_cache = LRUResultCache()
+    await cluster['test'].search_query() \
+        .with_result_cache(cache=lru_cache) \
+        .get_result()
+    assert len(lru_cache) == 1
@@ -0,0 +1,148 @@
+from elasticmagic import Bool, Document, Field, Params, SearchQuery
+from elasticmagic.agg import Terms
+from elasticmagic.cache import CompiledExpressionCache
+from elasticmagic.compiler import Compiler_6_0
+from elasticmagic.compiler import Compiler_7_0
+from elasticmagic.expression import Expression
+from elasticmagic.types import Integer
+
+
+class ProductDocument(Document):
+    __doc_type__ = 'product'
+
+    status = Field(Integer)
+
+
+def test_dispatch_table_per_compiled_class():
+    compiled_expression_6 = Compiler_6_0.compiled_expression
+    compiled_expression_7 = Compiler_7_0.compiled_expression
+    assert (
+        compiled_expression_6._dispatch_table is not
+        compiled_expression_7._dispatch_table
+    )
+    assert (
+        compiled_expression_7._dispatch_table is not
+        Compiler_7_0.compiled_search_query._dispatch_table
+    )
+
+    expr = Bool(must=[ProductDocument.status == 1], filter={'term': {}})
+    assert compiled_expression_7(expr).body == {
+        'bool': {
+            'must': [{'term': {'status': 1}}],
+            'filter': {'term': {}},
+        }
+    }
+    assert compiled_expression_7._dispatch_table[Bool].__name__ == \
+        'visit_query_expression'
+    assert Params in compiled_expression_7._dispatch_table
+    assert dict in compiled_expression_7._dispatch_table
+    assert list in compiled_expression_7._dispatch_table
+
+
+def test_dispatch_table_respects_overridden_visitors():
+    class Custom(Expression):
+        __visit_name__ = 'custom'
+
+    class _CompiledExpression(Compiler_7_0.compiled_expression):
+        def visit_custom(self, expr):
+            return 'custom'
+
+    class _OtherCompiledExpression(_CompiledExpression):
+        def visit_custom(self, expr):
+            return 'other'
+
+    assert _CompiledExpression(Custom()).body == 'custom'
+    assert _OtherCompiledExpression(Custom()).body == 'other'
+    assert _CompiledExpression([Custom()]).body == ['custom']
+
+
+def test_dispatch_document_class(compiler):
+    assert compiler.compiled_put_mapping(ProductDocument).body == {
+        'properties': {'status': {'type': 'integer'}}
+    }
+
+
+def test_memoize_repeated_expressions():
+    status_filter = Bool(must=[ProductDocument.status == 1])
+    sq = SearchQuery(Bool(filter=[status_filter], should=[status_filter]))
+    expected = {
+        'query': {
+            'bool': {
+                'filter': [{'bool': {'must': [{'term': {'status': 1}}]}}],
+                'should': [{'bool': {'must': [{'term': {'status': 1}}]}}],
+            }
+        }
+    }
+
+    body = sq.to_dict(Compiler_7_0)
+    assert body == expected
+    assert body['query']['bool']['filter'][0] is not \
+        body['query']['bool']['should'][0]
+    body['query']['bool']['filter'][0]['bool']['must'] = []
+    assert body['query']['bool']['should'][0] == \
+        {'bool': {'must': [{'term': {'status': 1}}]}}
+
+    body = sq.with_compiled_cache(CompiledExpressionCache()) \
+        .to_dict(Compiler_7_0)
+    assert body == expected
+    assert body['query']['bool']['filter'][0] is \
+        body['query']['bool']['should'][0]
+
+
+def test_compiled_cache():
+    status_filter = ProductDocument.status.in_([1, 2])
+    status_agg = Terms(ProductDocument.status)
+
+    def make_query(cache, status_filter=status_filter):
+        return (
+            SearchQuery(ProductDocument.status == 3)
+            .filter(status_filter)
+            .aggs(statuses=status_agg)
+            .with_compiled_cache(cache)
+        )
+
+    cache = CompiledExpressionCache()
+    body = Compiler_7_0.compiled_query(make_query(cache)).body
+    assert body == {
+        'query': {
+            'bool': {
+                'must': {'term': {'status': 3}},
+                'filter': {'terms': {'status': [1, 2]}},
+            }
+        },
+        'aggregations': {'statuses': {'terms': {'field': 'status'}}},
+    }
+    assert cache.hits == 0
+
+    other_body = Compiler_7_0.compiled_query(make_query(cache)).body
+    assert other_body == body
+    assert other_body['query']['bool']['filter'] is \
+        body['query']['bool']['filter']
+    assert other_body['aggregations']['statuses'] is \
+        body['aggregations']['statuses']
+    assert cache.hits > 0
+
+    # compiled bodies depend on the compiler version
+    other_body = Compiler_6_0.compiled_query(make_query(cache)).body
+    assert other_body['query']['bool']['filter'] is not \
+        body['query']['bool']['filter']
+
+    # equal expression is a different object
+    other_body = Compiler_7_0.compiled_query(
+        make_query(cache, ProductDocument.status.in_([1, 2]))
+    ).body
+    assert other_body['query']['bool']['filter'] is not \
+        body['query']['bool']['filter']
+
+    cache = CompiledExpressionCache(structural=True)
+    body = Compiler_7_0.compiled_query(make_query(cache)).body
+    other_body = Compiler_7_0.compiled_query(
+        make_query(cache, ProductDocument.status.in_([1, 2]))
+    ).body
+    assert other_body['query']['bool']['filter'] is \
+        body['query']['bool']['filter']
+    other_body = Compiler_7_0.compiled_query(
+        make_query(cache, ProductDocument.status.in_([1]))
+    ).body
+    assert other_body['query']['bool']['filter'] == \
+        {'terms': {'status': [1]}}
@@ -887,3 +887,133 @@ def test_document_instance__to_source_with_validation(compiler):
     with pytest.raises(ValidationError):
         doc = ProductDocument(name=123, status=1 << 31)
         doc.to_source(compiler, validate=True)
+
+
+def test_document_class_hit_decoder():
+    class SuggestDocument(CompletionDoc):
+        rank = Field(Float)
+
+    decoder = SuggestDocument._get_hit_decoder()
+    assert SuggestDocument._get_hit_decoder() is decoder
+    assert ('_id', '_id') in decoder.mapping_fields
+    assert decoder.source_fields['suggest'] == ('suggest', None)
+    assert decoder.source_fields['rank'][0] == 'rank'
+    assert decoder.source_fields['rank'][1]('1.5') == 1.5
+    assert decoder.source_fields['rank'][1](None) is None
+    assert decoder.convert_unmapped is None
+
+    doc = SuggestDocument(_hit={
+        '_id': '1',
+        '_source': {'suggest': {'input': ['test']}, 'rank': 2, 'extra': 3},
+    })
+    assert doc._id == '1'
+    assert doc.suggest == {'input': ['test']}
+    assert doc.rank == 2.0
+    assert isinstance(doc.rank, float)
+    assert doc.extra == 3
+
+    SuggestDocument.status = Field(Integer)
+    assert SuggestDocument._get_hit_decoder() is not decoder
+    doc = SuggestDocument(_hit={'_source': {'status': '7'}})
+    assert doc.status == 7
+
+
+def test_document_class_caches_of_subclasses():
+    class ProductDocument(Document):
+        name = Field(String)
+
+    class PhoneDocument(ProductDocument):
+        model = Field(String)
+
+    decoder = PhoneDocument._get_hit_decoder()
+    compact_doc_cls = PhoneDocument._get_compact_doc_cls()
+    plan = PhoneDocument._get_source_plan()
+
+    ProductDocument.status = Field(Integer)
+    assert PhoneDocument._get_hit_decoder() is not decoder
+    assert PhoneDocument._get_source_plan() is not plan
+    new_compact_doc_cls = PhoneDocument._get_compact_doc_cls()
+    assert new_compact_doc_cls is not compact_doc_cls
+    assert new_compact_doc_cls.__bases__ == (
+        ProductDocument._get_compact_doc_cls(),
+    )
+
+
+def test_document_class_hit_decoder__custom_source_processing():
+    class CustomDocument(Document):
+        name = Field(String)
+
+        def _process_source_key_value(self, key, value):
+            return key, 'custom:{}'.format(value)
+
+    assert CustomDocument._get_hit_decoder().source_fields is None
+
+    doc = CustomDocument(_hit={'_id': '1', '_source': {'name': 'test'}})
+    assert doc._id == '1'
+    assert doc.name == 'custom:test'
+
+
+def test_dynamic_document_hit_decoder():
+    class ProductDynamicDocument(DynamicDocument):
+        group = Field(Object(GroupDocument))
+        status = Field(Integer)
+
+    doc = ProductDynamicDocument(_hit={
+        '_source': {
+            'status': '1',
+            'group': {'id': 2},
+            'stock': {'count': 3},
+            'attrs': {'color': 'red'},
+        }
+    })
+    assert doc.status == 1
+    assert isinstance(doc.group, GroupDocument)
+    assert doc.group.id == 2
+    assert isinstance(doc.stock, DynamicDocument)
+    assert doc.stock.count == 3
+    assert isinstance(doc.attrs, DynamicDocument)
+    assert doc.attrs.color == 'red'
+
+
+def test_document_class_source_plan(compiler):
+    class ProductDocument(Document):
+        __doc_type__ = 'product'
+
+        name = Field(String, required=True)
+        status = Field(Integer)
+        tags = Field(List(String))
+
+    plan = ProductDocument._get_source_plan()
+    assert ProductDocument._get_source_plan() is plan
+    assert plan.doc_type == 'product'
+    assert not plan.has_parent
+    assert sorted(plan.fields) == ['name', 'status', 'tags']
+    assert plan.fields['status'].validate_only
+    assert not plan.fields['tags'].validate_only
+    assert [f.attr_name for f in plan.required_fields] == ['name']
+    assert '_id' in plan.skip_attr_names
+
+    doc = ProductDocument(_id=1, name='Test', status='2', tags=3)
+    assert doc.to_source(compiler) == {
+        'name': 'Test', 'status': '2', 'tags': ['3']
+    }
+    assert doc.to_source(compiler, validate=True) == {
+        'name': 'Test', 'status': 2, 'tags': ['3']
+    }
+
+    ProductDocument.rank = Field(Float, required=True)
+    assert ProductDocument._get_source_plan() is not plan
+    with pytest.raises(ValidationError):
+        doc.to_source(compiler, validate=True)
+
+
+def test_dynamic_document_source_plan(compiler):
+    class ProductDynamicDocument(DynamicDocument):
+        status = Field(Integer)
+
+    doc = ProductDynamicDocument(
+        _id=1, _routing=2, status=1, color='red', stock={'count': 3}
+    )
+    assert doc.to_source(compiler) == {
+        'status': 1, 'color': 'red', 'stock': {'count': 3}
+    }
@@ -1,3 +1,4 @@
+from elasticmagic import agg
 from elasticmagic import Document
 from elasticmagic import DynamicDocument
 from elasticmagic import (
@@ -684,6 +685,46 @@ class ExpressionTestCase(BaseTestCase):
             set()
         )
 
+    def test_fingerprint(self):
+        class Doc(Document):
+            status = Field(Integer)
+            name = Field(String)
+
+        def make_expr(status=0, mapper=None):
+            return Bool(
+                must=[Doc.name.match('phone'), Doc.status.in_([status, 2])],
+                filter=Range(Doc.status, gte=status),
+            ), agg.Terms(Doc.status, size=10, instance_mapper=mapper)
+
+        self.assertEqual(
+            [e.fingerprint() for e in make_expr()],
+            [e.fingerprint() for e in make_expr(mapper=lambda ids: {})],
+        )
+        self.assertNotEqual(
+            make_expr()[0].fingerprint(), make_expr(status=1)[0].fingerprint()
+        )
+        self.assertNotEqual(
+            Term(Doc.status, 1).fingerprint(),
+            Term(Doc.status, '1').fingerprint()
+        )
+        self.assertNotEqual(
+            Term(Doc.status, 1).fingerprint(),
+            Term(Field('status'), 1).fingerprint()
+        )
+        self.assertEqual(
+            (DynamicDocument.fields.status == 1).fingerprint(),
+            (DynamicDocument.fields.status == 1).fingerprint()
+        )
+
+        terms_agg = agg.Terms(Doc.status)
+        fingerprint = terms_agg.fingerprint()
+        self.assertIs(terms_agg.fingerprint(), fingerprint)
+        self.assertEqual(terms_agg.clone().fingerprint(), fingerprint)
+        self.assertNotEqual(
+            terms_agg.aggs(max_price=agg.Max(Doc.status)).fingerprint(),
+            fingerprint
+        )
+
     def test_field(self):
         self.assertEqual(Field().get_type().__class__, Type)
         self.assertIs(Field().get_name(), None)
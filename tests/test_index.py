@@ -1,6 +1,7 @@
 from unittest.mock import Mock
 
 from elasticmagic import Cluster, Index, Document, DynamicDocument, MatchAll, Field
+from elasticmagic import SearchQuery
 from elasticmagic import actions
 from elasticmagic.compiler import Compiler_6_0
 from elasticmagic.types import String, Date
@@ -416,3 +417,68 @@ class IndexTest(BaseTestCase):
             }
         )
         self.assertIsNone(result.hit)
+
+    def test_parallel_scan(self):
+        def page(scroll_id, slice_id, *doc_ids):
+            return {
+                '_scroll_id': scroll_id,
+                'hits': {
+                    'hits': [
+                        {'_id': '{}-{}'.format(slice_id, doc_id),
+                         '_type': 'product', '_source': {}}
+                        for doc_id in doc_ids
+                    ],
+                },
+            }
+
+        def search(index, scroll, body):
+            slice_id = body['slice']['id']
+            return page('{}-1'.format(slice_id), slice_id, 1, 2)
+
+        def scroll(scroll_id, scroll):
+            slice_id, _, page_num = scroll_id.partition('-')
+            next_scroll_id = '{}-{}'.format(slice_id, int(page_num) + 1)
+            if page_num == '1':
+                return page(next_scroll_id, slice_id, 3)
+            return page(next_scroll_id, slice_id)
+
+        self.client.search = Mock(side_effect=search)
+        self.client.scroll = Mock(side_effect=scroll)
+        self.client.clear_scroll = Mock(return_value={'succeeded': True})
+
+        ProductDoc = self.index['product']
+        sq = SearchQuery(doc_cls=ProductDoc)
+        with self.index.parallel_scan(
+                sq, slices=3, size=2, max_buffered_pages=1
+        ) as docs:
+            doc_ids = sorted(doc._id for doc in docs)
+        self.assertEqual(
+            doc_ids,
+            ['{}-{}'.format(slice_id, doc_id)
+             for slice_id in range(3) for doc_id in range(1, 4)]
+        )
+        self.assertEqual(docs.pages, 6)
+        self.assertEqual(docs.hits, 9)
+        self.assertEqual(self.client.search.call_count, 3)
+        for slice_id in range(3):
+            self.client.search.assert_any_call(
+                index='test', scroll='1m',
+                body={
+                    'size': 2,
+                    'sort': ['_doc'],
+                    'slice': {'id': slice_id, 'max': 3},
+                },
+            )
+            self.client.clear_scroll.assert_any_call(
+                scroll_id='{}-3'.format(slice_id)
+            )
+
+        self.client.clear_scroll.reset_mock()
+        docs = self.index.parallel_scan(sq, slices=2, size=2)
+        next(docs)
+        docs.close()
+        self.assertEqual(self.client.clear_scroll.call_count, 2)
+
+        self.client.scroll = Mock(side_effect=ValueError('Test error'))
+        with self.assertRaises(ValueError):
+            list(self.index.parallel_scan(sq, slices=2, size=2))
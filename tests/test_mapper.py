@@ -0,0 +1,179 @@
+import asyncio
+
+from elasticmagic import agg, types
+from elasticmagic import Document, Field
+from elasticmagic.mapper import CachedInstanceMapper
+from elasticmagic.result import SearchResult
+from elasticmagic.util import LRUCache
+
+import pytest
+
+
+class ProductDocument(Document):
+    __doc_type__ = 'product'
+
+    name = Field(types.String)
+    status = Field(types.Integer)
+
+
+def make_raw_result(ids):
+    return {
+        'hits': {
+            'total': {'value': len(ids), 'relation': 'eq'},
+            'hits': [
+                {'_id': _id, '_type': 'product', '_source': {}}
+                for _id in ids
+            ],
+        },
+        'aggregations': {
+            'statuses': {
+                'buckets': [{'key': 1, 'doc_count': 3}]
+            },
+        },
+    }
+
+
+def test_cached_instance_mapper():
+    calls = []
+
+    def instance_mapper(ids):
+        calls.append(ids)
+        return {_id: 'instance #{}'.format(_id) for _id in ids if _id != '4'}
+
+    mapper = CachedInstanceMapper(instance_mapper, maxsize=2)
+
+    res = SearchResult(
+        make_raw_result(['1', '2', '1']),
+        doc_cls_map={'product': ProductDocument},
+        instance_mapper={ProductDocument: mapper},
+    )
+    assert res.hits[0].instance == 'instance #1'
+    assert res.hits[2].instance == 'instance #1'
+    assert calls == [['1', '2']]
+    assert (mapper.hits, mapper.misses) == (0, 2)
+
+    res = SearchResult(
+        make_raw_result(['2', '3', '4']),
+        doc_cls_map={'product': ProductDocument},
+        instance_mapper={ProductDocument: mapper},
+    )
+    assert [doc.instance for doc in res.hits] == [
+        'instance #2', 'instance #3', None
+    ]
+    assert calls == [['1', '2'], ['3', '4']]
+    assert (mapper.hits, mapper.misses) == (1, 4)
+    assert mapper.hit_rate == 0.2
+
+    # '1' was evicted
+    assert mapper(['1', '3']) == {'1': 'instance #1', '3': 'instance #3'}
+    assert calls[-1] == ['1']
+
+    mapper.clear()
+    assert mapper(['3']) == {'3': 'instance #3'}
+    assert calls[-1] == ['3']
+
+
+def test_cached_instance_mapper_ttl():
+    now = [0.0]
+    calls = []
+
+    def instance_mapper(keys):
+        calls.append(keys)
+        return {key: 'status #{}'.format(key) for key in keys}
+
+    mapper = CachedInstanceMapper(
+        instance_mapper,
+        cache=LRUCache(maxsize=10, ttl=60, timer=lambda: now[0]),
+    )
+    statuses_agg = agg.Terms(
+        ProductDocument.status, instance_mapper=mapper
+    )
+
+    def get_bucket_instance():
+        res = SearchResult(
+            make_raw_result([]), aggregations={'statuses': statuses_agg}
+        )
+        return res.get_aggregation('statuses').buckets[0].instance
+
+    assert get_bucket_instance() == 'status #1'
+    now[0] = 59.0
+    assert get_bucket_instance() == 'status #1'
+    assert calls == [[1]]
+    now[0] = 120.0
+    assert get_bucket_instance() == 'status #1'
+    assert calls == [[1], [1]]
+    assert (mapper.hits, mapper.misses) == (1, 2)
+
+
+def test_cached_instance_mapper_missing_ids():
+    now = [0.0]
+    calls = []
+
+    def instance_mapper(ids):
+        calls.append(ids)
+        return {_id: 'instance #{}'.format(_id) for _id in ids if _id != '2'}
+
+    mapper = CachedInstanceMapper(
+        instance_mapper,
+        cache=LRUCache(maxsize=10, ttl=60, timer=lambda: now[0]),
+    )
+    assert mapper(['1', '2']) == {'1': 'instance #1'}
+    assert mapper(['1', '2']) == {'1': 'instance #1'}
+    assert calls == [['1', '2']]
+    assert (mapper.hits, mapper.misses) == (2, 2)
+
+    now[0] = 120.0
+    assert mapper(['2']) == {}
+    assert calls == [['1', '2'], ['2']]
+
+
+@pytest.mark.asyncio
+async def test_populate_instances_async():
+    calls = []
+    in_flight = [0, 0]
+
+    def make_mapper(name):
+        async def instance_mapper(keys):
+            calls.append((name, keys))
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight)
+            await asyncio.sleep(0)
+            in_flight[0] -= 1
+            return {key: '{} #{}'.format(name, key) for key in keys}
+        return instance_mapper
+
+    product_mapper = make_mapper('product')
+    raw_result = make_raw_result(['1', '2'])
+    raw_result['aggregations']['statuses']['buckets'][0]['top'] = {
+        'hits': {'hits': [{'_id': '3', '_type': 'product', '_source': {}}]}
+    }
+    res = SearchResult(
+        raw_result,
+        aggregations={
+            'statuses': agg.Terms(
+                ProductDocument.status,
+                instance_mapper=make_mapper('status'),
+                columnar=True,
+                aggs={
+                    'top': agg.TopHits(instance_mapper=product_mapper),
+                },
+            ),
+        },
+        doc_cls_map={'product': ProductDocument},
+        instance_mapper=CachedInstanceMapper(product_mapper),
+        compact_documents=True,
+    )
+    bucket = res.get_aggregation('statuses').buckets[0]
+    with pytest.raises(TypeError):
+        bucket.instance
+    calls.clear()
+
+    await res.populate_instances()
+
+    assert [doc.instance for doc in res.hits] == ['product #1', 'product #2']
+    assert bucket.instance == 'status #1'
+    assert bucket.get_aggregation('top').hits[0].instance == 'product #3'
+    assert sorted(calls) == [
+        ('product', ['1', '2']), ('product', ['3']), ('status', [1]),
+    ]
+    assert in_flight[1] == 3
@@ -0,0 +1,253 @@
+from elasticmagic import (
+    Bool, ConstantScore, Document, Field, Match, QueryRescorer, Range,
+    SearchQuery, Term, Terms,
+)
+from elasticmagic.compiler import Compiler_7_0
+from elasticmagic.optimizer import FILTER, QUERY, SCORE
+from elasticmagic.optimizer import OptimizationReport, QueryOptimizer
+from elasticmagic.types import Integer, Date, Text
+
+
+class ProductDocument(Document):
+    __doc_type__ = 'product'
+
+    status = Field(Integer)
+    tenant_id = Field(Integer)
+    created_at = Field(Date)
+    name = Field(Text)
+
+
+def compile_expr(expr):
+    return Compiler_7_0.compiled_expression(expr).body
+
+
+def test_flatten_and_merge():
+    optimizer = QueryOptimizer()
+    report = OptimizationReport()
+    expr = Bool(
+        filter=[
+            Bool(filter=[ProductDocument.tenant_id == 1]),
+            ProductDocument.status != 0,
+            Bool(must_not=[ProductDocument.status == 1]),
+            ProductDocument.tenant_id == 1,
+            ConstantScore(filter=ProductDocument.created_at >= 'now-1d'),
+        ],
+        must_not=[
+            Bool(should=[
+                ProductDocument.status == 2,
+                ProductDocument.status.in_([2, 3]),
+            ]),
+            Bool(must_not=[ProductDocument.name.match('phone')]),
+        ],
+    )
+    optimized = optimizer.optimize(expr, context=FILTER, report=report)
+    assert compile_expr(optimized) == {
+        'bool': {
+            'filter': [
+                {'term': {'tenant_id': 1}},
+                {'range': {'created_at': {'gte': 'now-1d'}}},
+                {'match': {'name': 'phone'}},
+            ],
+            'must_not': {'terms': {'status': [2, 3, 0, 1]}},
+        }
+    }
+    assert report.clauses_before == 15
+    assert report.clauses_after == 5
+    assert report.reduction == 10
+    assert report.flattened == 3
+    assert report.unwrapped == 3
+    assert report.deduplicated == 1
+    assert report.merged == 3
+    assert optimizer.report.reduction == 10
+
+
+def test_unchanged_expressions():
+    optimizer = QueryOptimizer()
+    status_filter = ProductDocument.status == 1
+    expr = Bool(must=Match(ProductDocument.name, 'phone'), filter=[
+        status_filter, ProductDocument.tenant_id.in_([1, 2]),
+    ])
+    assert optimizer.optimize(expr) is expr
+    assert optimizer.optimize(status_filter) is status_filter
+
+    # terms with parameters and on _id are not merged
+    expr = Bool(must_not=[
+        Terms(ProductDocument.status, [1], boost=2),
+        ProductDocument.status == 2,
+        ProductDocument._id == 1,
+        ProductDocument._id.in_([2, 3]),
+    ])
+    assert optimizer.optimize(expr) is expr
+
+    # should clauses stay optional
+    expr = Bool(
+        filter=ProductDocument.status != 0,
+        should=ProductDocument.name.match('phone'),
+    )
+    assert optimizer.optimize(expr, context=FILTER) is expr
+    expr = Bool(
+        should=[
+            ProductDocument.name.match('phone'),
+            ProductDocument.name.match('tablet'),
+        ],
+        must_not=Bool(must_not=ProductDocument.status == 0),
+    )
+    assert optimizer.optimize(expr, context=QUERY) is expr
+    assert optimizer.optimize(expr, context=FILTER) is expr
+
+
+def test_move_to_filter():
+    optimizer = QueryOptimizer()
+    expr = Bool(
+        must=[
+            Match(ProductDocument.name, 'phone'),
+            Bool(must=[ProductDocument.created_at >= 'now-1d']),
+            ConstantScore(filter=ProductDocument.status == 1),
+        ],
+        should=[
+            Bool(must=[ProductDocument.tenant_id.in_([1])]),
+        ],
+    )
+    assert compile_expr(optimizer.optimize(expr, context=QUERY)) == {
+        'bool': {
+            'must': {'match': {'name': 'phone'}},
+            'filter': [
+                {'constant_score': {'filter': {'term': {'status': 1}}}},
+                {'range': {'created_at': {'gte': 'now-1d'}}},
+            ],
+            'should': {'terms': {'tenant_id': [1]}},
+        }
+    }
+    assert optimizer.report.moved_to_filter == 2
+
+    # absolute scores are kept
+    assert compile_expr(optimizer.optimize(expr, context=SCORE)) == {
+        'bool': {
+            'must': [
+                {'match': {'name': 'phone'}},
+                {'range': {'created_at': {'gte': 'now-1d'}}},
+                {'constant_score': {'filter': {'term': {'status': 1}}}},
+            ],
+            'should': {'terms': {'tenant_id': [1]}},
+        }
+    }
+
+
+def test_merge_should_in_filter_context():
+    optimizer = QueryOptimizer()
+    expr = Bool(filter=[
+        Bool(should=[
+            ProductDocument.status == 1,
+            Bool(should=[ProductDocument.status == 2, Term('tag', 'a')]),
+            ProductDocument.status.in_([3]),
+        ]),
+        Bool(should=[
+            ProductDocument.status == 1,
+            ProductDocument.status == 2,
+        ], minimum_should_match=2),
+    ])
+    assert compile_expr(optimizer.optimize(expr, context=FILTER)) == {
+        'bool': {
+            'filter': [
+                {
+                    'bool': {
+                        'should': [
+                            {'terms': {'status': [1, 2, 3]}},
+                            {'term': {'tag': 'a'}},
+                        ]
+                    }
+                },
+                {
+                    'bool': {
+                        'should': [
+                            {'term': {'status': 1}},
+                            {'term': {'status': 2}},
+                        ],
+                        'minimum_should_match': 2,
+                    }
+                },
+            ]
+        }
+    }
+
+
+def test_merge_ranges():
+    expr = Bool(filter=[
+        ProductDocument.created_at >= 'now-7d',
+        ProductDocument.status > 1,
+        ProductDocument.created_at < 'now',
+        ProductDocument.created_at < 'now-1d',
+        Range(ProductDocument.created_at, lt='2020', format='yyyy'),
+    ])
+    assert QueryOptimizer().optimize(expr, context=FILTER) is expr
+
+    optimizer = QueryOptimizer(merge_ranges=True)
+    assert compile_expr(optimizer.optimize(expr, context=FILTER)) == {
+        'bool': {
+            'filter': [
+                {'range': {'created_at': {'gte': 'now-7d', 'lt': 'now'}}},
+                {'range': {'status': {'gt': 1}}},
+                {'range': {'created_at': {'lt': 'now-1d'}}},
+                {'range': {'created_at': {'lt': '2020', 'format': 'yyyy'}}},
+            ]
+        }
+    }
+    assert optimizer.report.merged == 1
+
+
+def test_search_query_optimizer():
+    sq = (
+        SearchQuery(ProductDocument.name.match('phone'))
+        .filter(ProductDocument.status != 0)
+        .filter(ProductDocument.status != 1)
+        .post_filter(ProductDocument.tenant_id == 1)
+        .post_filter(ProductDocument.tenant_id == 1)
+    )
+    optimized_sq = sq.with_optimizer()
+    assert optimized_sq.fingerprint() != sq.fingerprint()
+    assert optimized_sq.with_optimizer(enabled=False).fingerprint() == \
+        sq.fingerprint()
+
+    compiled_query = Compiler_7_0.compiled_query(optimized_sq)
+    assert compiled_query.body == {
+        'query': {
+            'bool': {
+                'must': {'match': {'name': 'phone'}},
+                'must_not': {'terms': {'status': [0, 1]}},
+            }
+        },
+        'post_filter': {'term': {'tenant_id': 1}},
+    }
+    assert compiled_query.optimization_report.reduction == 5
+    assert Compiler_7_0.compiled_query(sq).optimization_report is None
+
+    assert Compiler_7_0.compiled_count_query(optimized_sq).body == {
+        'query': {
+            'bool': {
+                'filter': {'match': {'name': 'phone'}},
+                'must_not': {'terms': {'status': [0, 1]}},
+            }
+        },
+        'post_filter': {'term': {'tenant_id': 1}},
+    }
+
+
+def test_search_query_optimizer_with_rescores():
+    sq = (
+        SearchQuery(Bool.must(
+            ProductDocument.name.match('phone'),
+            ProductDocument.created_at >= 'now-1d',
+        ))
+        .rescore(QueryRescorer(
+            ProductDocument.name.match('smartphone'), score_mode='multiply'
+        ))
+        .with_optimizer()
+    )
+    assert Compiler_7_0.compiled_query(sq).body['query'] == {
+        'bool': {
+            'must': [
+                {'match': {'name': 'phone'}},
+                {'range': {'created_at': {'gte': 'now-1d'}}},
+            ]
+        }
+    }
@@ -3,6 +3,7 @@ import pytest
 from elasticmagic import (
     Document,
     Field,
+    Param,
 )
 from elasticmagic.agg import (
     TopHits,
@@ -655,6 +656,32 @@ def test_search_query_filter_by_ids_no_mapping_types(compiler):
         assert compiled_query.params == {}
 
 
+@pytest.mark.parametrize('compiler', compilers_no_mapping_types)
+def test_prepare_search_query_with_doc_classes_from_factory(compiler):
+    def make_doc_cls(doc_type):
+        class FactoryDocument(Document):
+            __doc_type__ = doc_type
+            __parent__ = None
+
+            rank = Field(Integer)
+
+        return FactoryDocument
+
+    ADocument = make_doc_cls('a')
+    BDocument = make_doc_cls('b')
+
+    def make_query(doc_cls):
+        return SearchQuery(doc_cls=doc_cls) \
+            .filter(doc_cls.rank == Param('r'))
+
+    make_query(ADocument).prepare(compiler).bind(r=1)
+    bound = make_query(BDocument).prepare(compiler).bind(r=1)
+    assert bound.body['query']['bool']['filter'][1] == {
+        'terms': {'_doc_type_join': ['b']}
+    }
+    assert bound.doc_classes == (BDocument,)
+
+
 @pytest.mark.parametrize('compiler', compilers_no_mapping_types)
 def test_search_query_with_doc_value_fields(compiler):
     sq = (
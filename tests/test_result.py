@@ -1,5 +1,18 @@
+import pickle
+
 from elasticmagic import agg, types
-from elasticmagic.result import SearchResult
+from elasticmagic import Document, DynamicDocument, Field
+from elasticmagic.result import LazyHits, SearchResult
+from elasticmagic.document import CompactDocument
+
+import pytest
+
+
+class PickledDocument(Document):
+    __doc_type__ = 'pickled'
+
+    name = Field(types.String)
+    group = Field(types.Object(DynamicDocument))
 
 
 def test_search_result_with_error_and_aggregations():
@@ -9,3 +22,368 @@ def test_search_result_with_error_and_aggregations():
         aggregations={'types': agg.Terms(field='type', type=types.Integer)}
     )
     assert res.aggregations['types'].buckets == []
+
+
+def test_search_result_lazy_hits():
+    class ProductDocument(Document):
+        __doc_type__ = 'product'
+
+        name = Field(types.String)
+
+    raw_result = {
+        'hits': {
+            'total': {'value': 120, 'relation': 'eq'},
+            'max_score': 2.5,
+            'hits': [
+                {
+                    '_id': str(i),
+                    '_type': 'product',
+                    '_index': 'test',
+                    '_score': 2.5 - i,
+                    '_source': {'name': 'Product #{}'.format(i)},
+                }
+                for i in range(3)
+            ],
+        },
+        'aggregations': {
+            'types': {'buckets': [{'key': '1', 'doc_count': 120}]},
+        },
+    }
+    res = SearchResult(
+        raw_result,
+        aggregations={'types': agg.Terms(field='type', type=types.Integer)},
+        doc_cls_map={'product': ProductDocument},
+        lazy_hits=True,
+    )
+    assert isinstance(res.hits, LazyHits)
+    assert res.total == 120
+    assert res.max_score == 2.5
+    assert len(res) == 3
+    assert res.aggregations['types'].buckets[0].key == 1
+    assert res.hits._docs == [None, None, None]
+
+    doc = res.hits[1]
+    assert isinstance(doc, ProductDocument)
+    assert doc._id == '1'
+    assert doc.name == 'Product #1'
+    assert res.hits[1] is doc
+    assert res.hits._docs[0] is None
+    assert res.hits._docs[2] is None
+
+    assert res.hits[-1]._id == '2'
+    assert [d._id for d in res.hits[:2]] == ['0', '1']
+    assert [d._id for d in res] == ['0', '1', '2']
+    assert list(res)[1] is doc
+
+
+def test_search_result_compact_documents():
+    class ProductDocument(Document):
+        __doc_type__ = 'product'
+
+        name = Field(types.String)
+        price = Field(types.Float)
+        group = Field(types.Object(DynamicDocument))
+        unused = Field(types.Integer)
+
+    raw_result = {
+        'hits': {
+            'total': 2,
+            'max_score': 1.5,
+            'hits': [
+                {
+                    '_id': '1',
+                    '_type': 'product',
+                    '_index': 'test',
+                    '_score': 1.5,
+                    '_source': {
+                        'name': 'Product #1',
+                        'price': 10,
+                        'group': {'id': 7},
+                        'extra': [1, 2],
+                    },
+                    'highlight': {'name': ['<em>Product</em> #1']},
+                    'sort': [1.5],
+                },
+                {
+                    '_id': '2',
+                    '_type': 'user',
+                    '_index': 'test',
+                    '_source': {'login': 'root'},
+                },
+            ],
+        },
+    }
+
+    def instance_mapper(ids):
+        return {i: 'instance #{}'.format(i) for i in ids}
+
+    res = SearchResult(
+        raw_result,
+        doc_cls_map={'product': ProductDocument},
+        instance_mapper=instance_mapper,
+        compact_documents=True,
+    )
+    doc = res.hits[0]
+    assert isinstance(doc, CompactDocument)
+    assert not isinstance(doc, Document)
+    assert not isinstance(doc, DynamicDocument._get_compact_doc_cls())
+    assert not hasattr(doc, '__dict__')
+    assert type(doc) is ProductDocument._get_compact_doc_cls()
+    assert doc.__doc_cls__ is ProductDocument
+    assert doc.get_doc_type() == 'product'
+    assert doc._id == '1'
+    assert doc._index == 'test'
+    assert doc._score == 1.5
+    assert doc._routing is None
+    assert doc.name == 'Product #1'
+    assert doc.price == 10.0
+    assert isinstance(doc.price, float)
+    assert doc.group.id == 7
+    assert doc.unused is None
+    assert doc.extra == [1, 2]
+    assert doc.get_highlight() == {'name': ['<em>Product</em> #1']}
+    assert doc.get_sort_values() == [1.5]
+    assert doc.get_matched_queries() == []
+    assert doc.get_hit_fields() == {}
+    assert doc.instance == 'instance #1'
+    try:
+        doc.unknown
+    except AttributeError:
+        pass
+    else:
+        assert False, 'AttributeError was not raised'
+    try:
+        doc.name = 'Updated'
+    except AttributeError:
+        pass
+    else:
+        assert False, 'AttributeError was not raised'
+    assert doc.name == 'Product #1'
+
+    user = res.hits[1]
+    assert isinstance(user, DynamicDocument._get_compact_doc_cls())
+    assert not isinstance(user, ProductDocument._get_compact_doc_cls())
+    assert user._id == '2'
+    assert user.login == 'root'
+
+
+def test_compact_documents_hierarchy():
+    class ProductDocument(Document):
+        __doc_type__ = 'product'
+
+        name = Field(types.String)
+
+    class PhoneDocument(ProductDocument):
+        __doc_type__ = 'phone'
+
+        model = Field(types.String)
+
+    raw_result = {
+        'hits': {
+            'total': 1,
+            'hits': [
+                {
+                    '_id': '1',
+                    '_type': 'phone',
+                    '_source': {'name': 'Phone', 'model': 'X'},
+                },
+            ],
+        },
+    }
+    res = SearchResult(
+        raw_result,
+        doc_cls_map={'phone': PhoneDocument},
+        instance_mapper=lambda ids: {i: 'phone #{}'.format(i) for i in ids},
+        compact_documents=True,
+    )
+    doc = res.hits[0]
+    compact_phone_cls = PhoneDocument._get_compact_doc_cls()
+    assert type(doc) is compact_phone_cls
+    assert compact_phone_cls.__bases__ == (
+        ProductDocument._get_compact_doc_cls(),
+    )
+    assert compact_phone_cls.__slots__ == ('model',)
+    assert not hasattr(doc, '__dict__')
+    assert doc.name == 'Phone'
+    assert doc.model == 'X'
+    assert doc.instance == 'phone #1'
+
+
+def test_compact_documents_pickle():
+    raw_result = {
+        'hits': {
+            'total': 1,
+            'max_score': 1.5,
+            'hits': [
+                {
+                    '_id': '1',
+                    '_type': 'pickled',
+                    '_index': 'test',
+                    '_score': 1.5,
+                    '_source': {
+                        'name': 'Product #1',
+                        'group': {'id': 7},
+                        'extra': [1, 2],
+                    },
+                    'sort': [1.5],
+                },
+            ],
+        },
+    }
+    res = SearchResult(
+        raw_result,
+        doc_cls_map={'pickled': PickledDocument},
+        compact_documents=True,
+    )
+
+    doc = pickle.loads(pickle.dumps(res.hits[0]))
+    assert type(doc) is PickledDocument._get_compact_doc_cls()
+    assert doc._id == '1'
+    assert doc._score == 1.5
+    assert doc.name == 'Product #1'
+    assert doc.group.id == 7
+    assert doc.extra == [1, 2]
+    assert doc.get_sort_values() == [1.5]
+    assert doc.get_highlight() == {}
+    assert doc.instance is None
+
+
+def test_search_result_to_columns():
+    class ProductDocument(Document):
+        __doc_type__ = 'product'
+
+        name = Field(types.Keyword)
+        status = Field(types.Integer)
+        price = Field(types.Float)
+        available = Field(types.Boolean)
+        created_at = Field(types.Date)
+        tags = Field(types.List(types.Integer))
+
+    raw_result = {
+        'hits': {
+            'total': 2,
+            'hits': [
+                {
+                    '_id': '1', '_type': 'product', '_score': 2.0,
+                    '_source': {
+                        'name': 'Product #1', 'status': 1, 'price': 9.5,
+                        'available': True,
+                        'created_at': '2020-01-02T03:04:05Z',
+                        'tags': 1,
+                        'stock': {'count': 4},
+                    },
+                },
+                {
+                    '_id': '2', '_type': 'product', '_score': 1.0,
+                    '_source': {
+                        'name': 'Product #2', 'status': None,
+                        'created_at': 1577934245000, 'tags': [1, 2],
+                    },
+                    'fields': {'stock.count': [5]},
+                },
+            ],
+        },
+    }
+    res = SearchResult(
+        raw_result, doc_cls_map={'product': ProductDocument}, lazy_hits=True,
+    )
+    columns = res.to_columns()
+    assert list(columns) == [
+        '_id', 'name', 'status', 'price', 'available', 'created_at', 'tags'
+    ]
+    assert len(columns) == 2
+    assert columns['status'].typecode == 'q'
+    assert columns['price'].typecode == 'd'
+    assert columns['available'].typecode == 'b'
+    assert columns['created_at'].typecode == 'q'
+    assert columns['tags'].typecode is None
+    assert columns.to_dict() == {
+        '_id': ['1', '2'],
+        'name': ['Product #1', 'Product #2'],
+        'status': [1, None],
+        'price': [9.5, None],
+        'available': [1, None],
+        'created_at': [1577934245000, 1577934245000],
+        'tags': [1, [1, 2]],
+    }
+    # documents were not created
+    assert repr(res.hits) == '<LazyHits hits=2 materialized=0>'
+
+    columns = res.to_columns(
+        [ProductDocument.price, '_score', 'stock.count']
+    )
+    assert columns.to_dict() == {
+        'price': [9.5, None],
+        '_score': [2.0, 1.0],
+        'stock.count': [4, 5],
+    }
+    assert columns['_score'].typecode == 'd'
+    assert columns['stock.count'].typecode is None
+
+
+def test_search_result_to_columns_fallback():
+    class ProductDocument(Document):
+        __doc_type__ = 'product'
+
+        status = Field(types.Integer)
+        available = Field(types.Boolean)
+
+    raw_result = {
+        'hits': {
+            'total': 3,
+            'hits': [
+                {
+                    '_id': '1', '_type': 'product',
+                    '_source': {'status': 1, 'available': True},
+                },
+                {
+                    '_id': '2', '_type': 'product',
+                    '_source': {'status': 2.0, 'available': [True, False]},
+                },
+                {
+                    '_id': '3', '_type': 'product',
+                    '_source': {'status': 1.7, 'available': False},
+                },
+            ],
+        },
+    }
+    res = SearchResult(raw_result, doc_cls_map={'product': ProductDocument})
+    columns = res.to_columns()
+    assert columns['status'].typecode is None
+    assert columns['available'].typecode is None
+    assert columns.to_dict() == {
+        '_id': ['1', '2', '3'],
+        'status': [1, 2, 1.7],
+        'available': [1, [True, False], False],
+    }
+
+
+def test_search_result_to_columns_numpy():
+    np = pytest.importorskip('numpy')
+
+    class ProductDocument(Document):
+        __doc_type__ = 'product'
+
+        status = Field(types.Integer)
+        created_at = Field(types.Date)
+
+    res = SearchResult(
+        {
+            'hits': {
+                'hits': [
+                    {'_id': '1', '_source': {
+                        'status': 1, 'created_at': '2020-01-01T00:00:00',
+                    }},
+                    {'_id': '2', '_source': {'created_at': 0}},
+                ],
+            },
+        },
+        doc_cls_map={'_doc': ProductDocument},
+    )
+    columns = res.to_columns(
+        [ProductDocument.status, ProductDocument.created_at]
+    ).to_numpy()
+    assert isinstance(columns['status'], np.ma.MaskedArray)
+    assert columns['status'].tolist() == [1, None]
+    assert columns['created_at'].dtype == np.dtype('datetime64[ms]')
+    assert str(columns['created_at'][0]) == '2020-01-01T00:00:00.000'
@@ -1,13 +1,17 @@
 import datetime
 import warnings
-from unittest.mock import Mock
+from unittest.mock import MagicMock, Mock
 
 from elasticmagic import (
-    Document, DynamicDocument,
-    SearchQuery, Params, Term, MultiMatch,
+    Cluster, Document, DynamicDocument,
+    SearchQuery, Param, Params, Term, MultiMatch,
     FunctionScore, Sort, QueryRescorer, agg
 )
+from elasticmagic.cache import BaseResultCache
+from elasticmagic.cache import LRUResultCache
+from elasticmagic.compiler import CompilationError
 from elasticmagic.compiler import Compiler_7_0
+from elasticmagic.document import CompactDocument
 from elasticmagic.search import FunctionScoreSettings
 from elasticmagic.function import FieldValueFactor, Weight
 from elasticmagic.util import collect_doc_classes
@@ -1623,3 +1627,625 @@ class SearchQueryTest(BaseTestCase):
             {},
             compiler=Compiler_7_0,
         )
+
+    def test_prepare(self):
+        self.client.search = Mock(
+            return_value={
+                'hits': {
+                    'hits': [
+                        {
+                            '_id': '1',
+                            '_type': 'product',
+                            '_index': 'test',
+                            '_source': {'name': 'LG'},
+                        }
+                    ],
+                    'max_score': 1,
+                    'total': 1
+                }
+            }
+        )
+        ProductDoc = self.index['product']
+        sq = (
+            self.index.search_query(routing=123)
+            .filter(
+                ProductDoc.user_id == Param('user_id'),
+                ProductDoc.status.in_(Param('statuses')),
+                ProductDoc.price.range(gte=Param('min_price'), lt=1000),
+            )
+            .limit(10)
+        )
+        prepared_query = sq.prepare()
+        self.assertEqual(
+            prepared_query.param_names,
+            {'user_id', 'statuses', 'min_price'}
+        )
+        self.assertIs(sq.prepare()._compiled_query,
+                      prepared_query._compiled_query)
+        self.assertIs(sq.limit(10).prepare()._compiled_query,
+                      prepared_query._compiled_query)
+        self.assertIsNot(sq.limit(20).prepare()._compiled_query,
+                         prepared_query._compiled_query)
+        self.assertIs(
+            sq.limit(10).prepare(key='products')._compiled_query,
+            sq.limit(10).prepare(key='products')._compiled_query,
+        )
+
+        expected_body = {
+            'query': {
+                'bool': {
+                    'filter': [
+                        {'term': {'user_id': 1}},
+                        {'terms': {'status': [0, 1]}},
+                        {'range': {'price': {'gte': 10, 'lt': 1000}}},
+                    ]
+                }
+            },
+            'size': 10,
+        }
+        self.assertEqual(
+            prepared_query.to_dict(user_id=1, statuses=[0, 1], min_price=10),
+            expected_body
+        )
+        self.assertEqual(
+            prepared_query.to_dict(user_id=2, statuses=[], min_price=0),
+            {
+                'query': {
+                    'bool': {
+                        'filter': [
+                            {'term': {'user_id': 2}},
+                            {'terms': {'status': []}},
+                            {'range': {'price': {'gte': 0, 'lt': 1000}}},
+                        ]
+                    }
+                },
+                'size': 10,
+            }
+        )
+        # template is not modified by binding
+        self.assertEqual(
+            prepared_query.to_dict(user_id=1, statuses=[0, 1], min_price=10),
+            expected_body
+        )
+
+        result = prepared_query.get_result(
+            user_id=1, statuses=[0, 1], min_price=10
+        )
+        self.client.search.assert_called_with(
+            index='test', routing=123, body=expected_body
+        )
+        self.assertEqual(result.total, 1)
+        self.assertIsInstance(result.hits[0], ProductDoc)
+        self.assertEqual(result.hits[0].name, 'LG')
+
+        with self.assertRaises(CompilationError):
+            prepared_query.to_dict(user_id=1)
+        with self.assertRaises(CompilationError):
+            prepared_query.to_dict(
+                user_id=1, statuses=[0, 1], min_price=10, max_price=100
+            )
+        with self.assertRaises(CompilationError):
+            sq.to_dict()
+
+        paginated_query = (
+            self.index.search_query(ProductDoc.status == Param('status'))
+            .limit(Param('limit'))
+            .offset(Param('offset'))
+            .prepare()
+        )
+        self.assertEqual(
+            paginated_query.param_names, {'status', 'limit', 'offset'}
+        )
+        self.assertEqual(
+            paginated_query.to_dict(status=1, limit=5, offset=10),
+            {'query': {'term': {'status': 1}}, 'size': 5, 'from': 10}
+        )
+        with self.assertRaises(CompilationError):
+            self.index.search_query().limit(Param('limit')).to_dict()
+
+    def test_lazy_hits(self):
+        self.client.search = Mock(
+            return_value={
+                'hits': {
+                    'hits': [
+                        {
+                            '_id': '1',
+                            '_type': 'product',
+                            '_index': 'test',
+                            '_source': {'name': 'LG'},
+                        }
+                    ],
+                    'max_score': 1,
+                    'total': 1
+                }
+            }
+        )
+        ProductDoc = self.index['product']
+        sq = self.index.search_query(doc_cls=ProductDoc)
+        self.assertIsInstance(sq.get_result().hits, list)
+
+        sq = sq.with_lazy_hits()
+        result = sq.get_result()
+        self.assertEqual(len(result.hits), 1)
+        self.assertEqual(result.hits._docs, [None])
+        docs = list(sq)
+        self.assertIsInstance(docs[0], ProductDoc)
+        self.assertEqual(docs[0].name, 'LG')
+        self.assertIs(result.hits[0], docs[0])
+
+        self.assertIsInstance(
+            sq.with_lazy_hits(False).get_result().hits, list
+        )
+
+    def test_iter_all_scroll(self):
+        def hit(doc_id):
+            return {
+                '_id': str(doc_id), '_type': 'product', '_index': 'test',
+                '_source': {'name': 'Product #{}'.format(doc_id)},
+            }
+
+        def page(scroll_id, *doc_ids):
+            return {
+                '_scroll_id': scroll_id,
+                'hits': {
+                    'total': 3,
+                    'hits': [hit(doc_id) for doc_id in doc_ids],
+                },
+            }
+
+        ProductDoc = self.index['product']
+        sq = self.index.search_query(doc_cls=ProductDoc)
+
+        self.client.search = Mock(return_value=page('s1', 1, 2))
+        self.client.scroll = Mock(
+            side_effect=[page('s2', 3), page('s3')]
+        )
+        self.client.clear_scroll = Mock(return_value={'succeeded': True})
+        with sq.iter_all(size=2, scroll='5m') as docs:
+            self.assertEqual(
+                [(doc._id, doc.name) for doc in docs],
+                [('1', 'Product #1'), ('2', 'Product #2'),
+                 ('3', 'Product #3')]
+            )
+        self.assertEqual(docs.pages, 2)
+        self.assertEqual(docs.hits, 3)
+        self.assertGreater(docs.pages_per_sec, 0)
+        self.client.search.assert_called_once_with(
+            index='test', scroll='5m', body={'size': 2, 'sort': ['_doc']},
+        )
+        self.client.scroll.assert_called_with(
+            scroll_id='s2', scroll='5m'
+        )
+        self.client.clear_scroll.assert_called_once_with(scroll_id='s3')
+
+        # closing iterator in the middle clears the prefetched scroll
+        self.client.scroll = Mock(
+            side_effect=[page('s2', 3), page('s3')]
+        )
+        self.client.clear_scroll.reset_mock()
+        docs = sq.iter_all(size=2)
+        self.assertEqual(next(docs)._id, '1')
+        docs.close()
+        self.assertEqual(self.client.scroll.call_count, 1)
+        self.client.clear_scroll.assert_called_once_with(scroll_id='s2')
+
+        # without prefetching
+        self.client.scroll = Mock(
+            side_effect=[page('s2', 3), page('s3')]
+        )
+        self.client.clear_scroll.reset_mock()
+        docs = sq.iter_all(size=2, prefetch=False)
+        self.assertEqual(next(docs)._id, '1')
+        self.assertEqual(self.client.scroll.call_count, 0)
+        docs.close()
+        self.client.clear_scroll.assert_called_once_with(scroll_id='s1')
+
+    def test_iter_all_point_in_time(self):
+        def page(pit_id, *doc_ids):
+            return {
+                'pit_id': pit_id,
+                'hits': {
+                    'hits': [
+                        {'_id': str(doc_id), '_type': 'product',
+                         '_source': {}, 'sort': [doc_id]}
+                        for doc_id in doc_ids
+                    ],
+                },
+            }
+
+        ProductDoc = self.index['product']
+        sq = self.index.search_query(doc_cls=ProductDoc) \
+            .order_by(ProductDoc.rank.desc())
+
+        self.client.open_point_in_time = Mock(return_value={'id': 'p0'})
+        self.client.search = Mock(
+            side_effect=[page('p1', 1, 2), page('p2', 3)]
+        )
+        self.client.close_point_in_time = Mock(
+            return_value={'succeeded': True, 'num_freed': 1}
+        )
+        docs = sq.iter_all(size=2, point_in_time=True, keep_alive='2m')
+        self.assertEqual([doc._id for doc in docs], ['1', '2', '3'])
+        self.assertEqual(docs.pages, 2)
+        self.client.open_point_in_time.assert_called_once_with(
+            index='test', keep_alive='2m'
+        )
+        self.client.search.assert_called_with(
+            body={
+                'size': 2,
+                'sort': [{'rank': 'desc'}],
+                'search_after': (2,),
+                'pit': {'id': 'p1', 'keep_alive': '2m'},
+            }
+        )
+        self.client.close_point_in_time.assert_called_once_with(
+            body={'id': 'p2'}
+        )
+
+        self.assertRaises(
+            ValueError,
+            lambda: list(
+                SearchQuery(cluster=self.cluster).iter_all(point_in_time=True)
+            )
+        )
+
+    def test_iter_columns(self):
+        def page(scroll_id, *doc_ids):
+            return {
+                '_scroll_id': scroll_id,
+                'hits': {
+                    'total': 3,
+                    'hits': [
+                        {
+                            '_id': str(doc_id), '_type': 'product',
+                            '_index': 'test',
+                            '_source': {'rank': doc_id * 1.5},
+                        }
+                        for doc_id in doc_ids
+                    ],
+                },
+            }
+
+        ProductDoc = self.index['product']
+        sq = self.index.search_query(doc_cls=ProductDoc)
+
+        self.client.search = Mock(return_value=page('s1', 1, 2))
+        self.client.scroll = Mock(side_effect=[page('s2', 3), page('s3')])
+        self.client.clear_scroll = Mock(return_value={'succeeded': True})
+        pages = list(sq.iter_columns(['_id', 'rank'], size=2))
+        self.assertEqual(
+            [p.to_dict() for p in pages],
+            [
+                {'_id': ['1', '2'], 'rank': [1.5, 3.0]},
+                {'_id': ['3'], 'rank': [4.5]},
+            ]
+        )
+        self.client.clear_scroll.assert_called_once_with(scroll_id='s3')
+
+    def test_compact_documents(self):
+        self.client.search = Mock(
+            return_value={
+                'hits': {
+                    'hits': [
+                        {
+                            '_id': '1',
+                            '_type': 'product',
+                            '_index': 'test',
+                            '_source': {'name': 'LG'},
+                        }
+                    ],
+                    'max_score': 1,
+                    'total': 1
+                }
+            }
+        )
+        ProductDoc = self.index['product']
+        sq = self.index.search_query(doc_cls=ProductDoc)
+        doc = sq.get_result().hits[0]
+        self.assertNotIsInstance(doc, CompactDocument)
+
+        sq = sq.with_compact_documents()
+        doc = sq.get_result().hits[0]
+        self.assertIsInstance(doc, CompactDocument)
+        self.assertIsInstance(doc, ProductDoc._get_compact_doc_cls())
+        self.assertIs(doc.__doc_cls__, ProductDoc)
+        self.assertEqual(doc._id, '1')
+        self.assertEqual(doc.name, 'LG')
+        self.assertRaises(AttributeError, setattr, doc, 'name', 'Sony')
+
+        self.assertNotIsInstance(
+            sq.with_compact_documents(False).get_result().hits[0],
+            CompactDocument
+        )
+
+    def test_result_cache(self):
+        self.client.search = Mock(
+            return_value={
+                'hits': {
+                    'hits': [
+                        {'_id': '1', '_type': 'product', '_index': 'test'}
+                    ],
+                    'max_score': 1,
+                    'total': 1
+                }
+            }
+        )
+        self.client.count = Mock(return_value={'count': 1})
+
+        class DictResultCache(BaseResultCache):
+            def __init__(self):
+                super(DictResultCache, self).__init__()
+                self.data = {}
+
+            def _get(self, key):
+                return self.data.get(key, (None, None))[0]
+
+            def _set(self, key, raw_result, ttl):
+                self.data[key] = (raw_result, ttl)
+
+        cache = DictResultCache()
+        ProductDoc = self.index['product']
+
+        def make_query(status=0):
+            return self.index.search_query(ProductDoc.status == status) \
+                .with_result_cache(ttl=60, cache=cache)
+
+        res1 = make_query().get_result()
+        res2 = make_query().get_result()
+        self.assertEqual(self.client.search.call_count, 1)
+        self.assertEqual(res2.hits[0]._id, '1')
+        self.assertIsNot(res1.hits[0], res2.hits[0])
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(
+            [ttl for _, ttl in cache.data.values()], [60]
+        )
+
+        make_query(1).get_result()
+        self.assertEqual(self.client.search.call_count, 2)
+        make_query().count()
+        make_query().count()
+        self.assertEqual(self.client.count.call_count, 1)
+        self.assertEqual((cache.hits, cache.misses), (2, 3))
+
+        make_query().with_result_cache(enabled=False).get_result()
+        make_query().with_scroll('1m').get_result()
+        self.assertEqual(self.client.search.call_count, 4)
+        self.assertEqual(len(cache.data), 3)
+
+        default_cache_sq = self.index.search_query().with_result_cache()
+        self.assertIs(
+            default_cache_sq.get_context().result_cache,
+            SearchQuery._default_result_cache
+        )
+        # empty cache must not be replaced with the default one
+        empty_cache = LRUResultCache()
+        self.assertIs(
+            self.index.search_query().with_result_cache(cache=empty_cache)
+            .get_context().result_cache,
+            empty_cache
+        )
+
+    def test_lru_result_cache_returns_copies(self):
+        self.client.search = Mock(
+            return_value={
+                'hits': {
+                    'hits': [
+                        {
+                            '_id': '1', '_type': 'product', '_index': 'test',
+                            '_source': {'name': 'LG', 'tags': ['tv']},
+                        }
+                    ],
+                    'max_score': 1,
+                    'total': 1
+                }
+            }
+        )
+        cache = LRUResultCache()
+
+        def get_result():
+            return self.index.search_query(doc_cls=self.index['product']) \
+                .with_result_cache(cache=cache) \
+                .get_result()
+
+        res = get_result()
+        res.hits[0].tags.append('phone')
+        res = get_result()
+        self.assertEqual(res.hits[0].tags, ['tv'])
+        res.hits[0].tags.append('phone')
+        res.raw['hits']['hits'][0]['_source']['name'] = 'Samsung'
+        res = get_result()
+        self.assertEqual(res.hits[0].tags, ['tv'])
+        self.assertEqual(res.hits[0].name, 'LG')
+        self.assertEqual(self.client.search.call_count, 1)
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+    def test_result_cache_is_separated_by_clusters(self):
+        raw_result = {'hits': {'hits': [], 'max_score': 1, 'total': 0}}
+        cache = LRUResultCache()
+
+        def make_cluster(hosts):
+            client = MagicMock()
+            client.transport.hosts = hosts
+            client.search = Mock(return_value=raw_result)
+            return Cluster(client, compiler=Compiler_7_0)
+
+        clusters = [
+            make_cluster([{'host': 'es1'}]),
+            make_cluster([{'host': 'es2'}]),
+            make_cluster([{'host': 'es1'}]),
+            make_cluster(None),
+        ]
+        for cluster in clusters:
+            cluster['test'].search_query() \
+                .with_result_cache(cache=cache) \
+                .get_result()
+        self.assertEqual(
+            [c.get_client().search.call_count for c in clusters],
+            [1, 1, 0, 1]
+        )
+
+    def test_clone_shares_state(self):
+        f = DynamicDocument.fields
+
+        sq1 = SearchQuery().filter(f.status == 0).aggs(
+            statuses=agg.Terms(f.status)
+        )
+        sq2 = sq1.filter(f.price > 1).aggs(
+            {'prices': agg.Min(f.price)}, statuses=None
+        )
+        sq3 = sq1.filter(f.rank > 2)
+        self.assertIs(sq2._filters._parent, sq1._filters)
+        self.assertIs(sq3._filters._parent, sq1._filters)
+        self.assertEqual(len(sq1.get_context().filters), 1)
+        self.assert_expression(
+            sq2,
+            {
+                'query': {
+                    'bool': {
+                        'filter': [
+                            {'term': {'status': 0}},
+                            {'range': {'price': {'gt': 1}}},
+                        ]
+                    }
+                },
+                'aggregations': {
+                    'prices': {'min': {'field': 'price'}}
+                }
+            }
+        )
+        self.assertEqual(list(sq1.get_context().aggregations), ['statuses'])
+        self.assertEqual(
+            list(sq2.aggs(statuses=agg.Terms(f.status)).get_context()
+                 .aggregations),
+            ['prices', 'statuses']
+        )
+
+    def test_builder(self):
+        f = DynamicDocument.fields
+
+        sq = SearchQuery.builder()
+        self.assertIs(sq.filter(f.status == 0), sq)
+        self.assertIs(sq.aggs(statuses=agg.Terms(f.status)), sq)
+        sq.order_by(f.rank.desc()).limit(10).source(f.name)
+        self.assertIs(sq.freeze(), sq)
+        expected = {
+            'query': {'bool': {'filter': {'term': {'status': 0}}}},
+            'aggregations': {'statuses': {'terms': {'field': 'status'}}},
+            'sort': [{'rank': 'desc'}],
+            'size': 10,
+            '_source': ['name'],
+        }
+        self.assert_expression(sq, expected)
+        self.assertIsNot(sq.limit(20), sq)
+        self.assert_expression(sq, expected)
+
+        self.client.search = Mock(
+            return_value={'hits': {'hits': [], 'max_score': 1, 'total': 0}}
+        )
+        ProductDoc = self.index['product']
+        sq = self.index.search_query()
+        result = sq.get_result()
+        with sq.mutate() as mutable_sq:
+            self.assertIs(mutable_sq, sq)
+            self.assertIs(sq.filter(ProductDoc.status == 1), sq)
+            clone = sq.clone()
+            self.assertIsNot(clone.limit(1), clone)
+            # mutation resets the cached result
+            self.assertIsNot(sq.get_result(), result)
+        self.assertIsNot(sq.limit(1), sq)
+        self.assertEqual(self.client.search.call_count, 2)
+        self.assert_expression(
+            sq, {'query': {'bool': {'filter': {'term': {'status': 1}}}}}
+        )
+
+    def test_aggregations_are_cached(self):
+        f = DynamicDocument.fields
+
+        sq = SearchQuery().aggs(statuses=agg.Terms(f.status))
+        aggs = sq._aggregations
+        self.assertIs(sq._aggregations, aggs)
+        self.assertEqual(list(aggs), ['statuses'])
+
+        sq2 = sq.aggs(ranks=agg.Terms(f.rank))
+        self.assertEqual(list(sq2._aggregations), ['statuses', 'ranks'])
+        self.assertIs(sq._aggregations, aggs)
+
+        sq = SearchQuery.builder().aggs(statuses=agg.Terms(f.status))
+        self.assertEqual(list(sq._aggregations), ['statuses'])
+        sq.aggs(statuses=None)
+        self.assertEqual(list(sq._aggregations), [])
+
+    def test_fingerprint(self):
+        ProductDoc = self.index['product']
+
+        def make_query(status=0):
+            return (
+                self.index.search_query(ProductDoc.name.match('phone'))
+                .filter(ProductDoc.status == status)
+                .aggs(statuses=agg.Terms(ProductDoc.status))
+                .limit(10)
+            )
+
+        sq = make_query()
+        self.assertEqual(sq.fingerprint(), make_query().fingerprint())
+        self.assertEqual(
+            sq.fingerprint(),
+            make_query()
+            .with_instance_mapper(lambda ids: {})
+            .fingerprint()
+        )
+        self.assertNotEqual(sq.fingerprint(), make_query(1).fingerprint())
+        self.assertNotEqual(sq.fingerprint(), sq.limit(20).fingerprint())
+        self.assertNotEqual(
+            sq.fingerprint(), sq.filter(ProductDoc.price > 1).fingerprint()
+        )
+        self.assertNotEqual(
+            sq.fingerprint(),
+            SearchQuery(ProductDoc.name.match('phone'))
+            .filter(ProductDoc.status == 0)
+            .aggs(statuses=agg.Terms(ProductDoc.status))
+            .limit(10)
+            .fingerprint()
+        )
+        # filters added at once and one by one make the same query
+        f1, f2 = ProductDoc.status == 0, ProductDoc.price > 1
+        self.assertEqual(
+            SearchQuery().filter(f1, f2).fingerprint(),
+            SearchQuery().filter(f1).filter(f2).fingerprint()
+        )
+
+        with sq.mutate():
+            sq.limit(20)
+        self.assertEqual(
+            sq.fingerprint(), make_query().limit(20).fingerprint()
+        )
+
+        # equal prepared queries share the template
+        # but results are processed with their own options
+        self.client.search = Mock(
+            return_value={
+                'hits': {
+                    'hits': [{'_id': '1', '_type': 'product'}],
+                    'max_score': 1,
+                    'total': 1
+                }
+            }
+        )
+        sq = self.index.search_query(
+            ProductDoc.name.match(Param('name'))
+        )
+        prepared_query = sq.prepare()
+        other_prepared_query = sq \
+            .with_instance_mapper(lambda ids: {i: 'product' for i in ids}) \
+            .prepare()
+        self.assertIs(
+            other_prepared_query._compiled_query,
+            prepared_query._compiled_query
+        )
+        self.assertIsNone(
+            prepared_query.get_result(name='phone').hits[0].instance
+        )
+        self.assertEqual(
+            other_prepared_query.get_result(name='phone').hits[0].instance,
+            'product'
+        )
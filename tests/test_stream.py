@@ -0,0 +1,83 @@
+import io
+
+import pytest
+
+from elasticmagic.stream import JsonStreamReader
+
+
+RAW = (
+    '{"took": 12, "hits": {"total": 1234567, "hits": ['
+    '{"_id": "1", "_source": {"name": "\\u0422\\u0435\\u0441\\u0442"}}, '
+    '{"_id": "2", "_source": {"name": "Тест", "price": 1.25e3}}'
+    ']}, "empty": {}, "list": [], "_scroll_id": "abc"}'
+)
+
+
+def read_response(reader):
+    res = {}
+    for key in reader.iter_object():
+        if key == 'hits':
+            hits = res['hits'] = {}
+            for hits_key in reader.iter_object():
+                if hits_key == 'hits':
+                    hits['hits'] = [
+                        reader.read_value() for _ in reader.iter_array()
+                    ]
+                else:
+                    hits[hits_key] = reader.read_value()
+        else:
+            res[key] = reader.read_value()
+    return res
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 64 * 1024])
+def test_json_stream_reader(chunk_size):
+    expected = {
+        'took': 12,
+        'hits': {
+            'total': 1234567,
+            'hits': [
+                {'_id': '1', '_source': {'name': 'Тест'}},
+                {'_id': '2', '_source': {'name': 'Тест', 'price': 1250.0}},
+            ],
+        },
+        'empty': {},
+        'list': [],
+        '_scroll_id': 'abc',
+    }
+    assert read_response(
+        JsonStreamReader(RAW, chunk_size=chunk_size)
+    ) == expected
+    assert read_response(
+        JsonStreamReader(RAW.encode('utf-8'), chunk_size=chunk_size)
+    ) == expected
+    assert read_response(
+        JsonStreamReader(
+            io.BytesIO(RAW.encode('utf-8')), chunk_size=chunk_size
+        )
+    ) == expected
+
+
+def test_json_stream_reader_empty_containers():
+    reader = JsonStreamReader(iter([b' { ', b'} ']))
+    assert list(reader.iter_object()) == []
+
+    reader = JsonStreamReader(['[', ' ]'])
+    assert list(reader.iter_array()) == []
+
+
+def test_json_stream_reader_invalid():
+    reader = JsonStreamReader('[1, 2}', chunk_size=2)
+    items = reader.iter_array()
+    next(items)
+    assert reader.read_value() == 1
+    next(items)
+    assert reader.read_value() == 2
+    with pytest.raises(ValueError):
+        next(items)
+
+    reader = JsonStreamReader('{"a": tru', chunk_size=2)
+    keys = reader.iter_object()
+    assert next(keys) == 'a'
+    with pytest.raises(ValueError):
+        reader.read_value()
@@ -5,6 +5,7 @@ import pytest
 
 from elasticmagic.compiler import Compiler_7_0
 from elasticmagic.document import DynamicDocument
+from elasticmagic.expression import Field
 from elasticmagic.types import (
     Type, String, Byte, Short, Integer, Long, Float, Double, Date, Boolean,
     Binary, Ip, Object, List, GeoPoint, Completion, ValidationError,
@@ -125,6 +126,54 @@ def test_date():
         datetime.datetime(2009, 11, 15, 14, 12, 12)
 
 
+def test_date_formats():
+    utc = datetime.timezone.utc
+    t = Date()
+    assert t.to_python('2009-11-15T14:12:12.123Z') == \
+        datetime.datetime(2009, 11, 15, 14, 12, 12, 123000, tzinfo=utc)
+    assert t.to_python('2009-11-15T14:12:12+03:00') == \
+        datetime.datetime(2009, 11, 15, 11, 12, 12, tzinfo=utc)
+    assert t.to_python('2009-11-15') == datetime.datetime(2009, 11, 15)
+    assert t.to_python(1258294332000) == \
+        datetime.datetime(2009, 11, 15, 14, 12, 12, tzinfo=utc)
+    # falls back to dateutil
+    assert t.to_python('15 Nov 2009 14:12') == \
+        datetime.datetime(2009, 11, 15, 14, 12)
+    dt = datetime.datetime(2009, 11, 15, 14, 12, 12)
+    assert t.to_python(dt) is dt
+
+    t = Date(format='epoch_second')
+    assert t.to_python(1258294332) == \
+        datetime.datetime(2009, 11, 15, 14, 12, 12, tzinfo=utc)
+    assert t.to_python('1258294332') == \
+        datetime.datetime(2009, 11, 15, 14, 12, 12, tzinfo=utc)
+
+    t = Date(format='strict_date_optional_time||epoch_millis')
+    assert t.to_python('1258294332000') == \
+        datetime.datetime(2009, 11, 15, 14, 12, 12, tzinfo=utc)
+    assert t.to_python('2009-11-15T14:12:12') == dt
+
+
+def test_date_format_mapping_option():
+    class PostDocument(DynamicDocument):
+        created_at = Field(Date, format='epoch_second')
+        updated_at = Field(Date(format='epoch_millis'))
+
+    assert PostDocument.created_at.get_type().format == 'epoch_second'
+    doc = PostDocument(_hit={
+        '_source': {'created_at': 1258294332, 'updated_at': 1258294332000}
+    })
+    assert doc.created_at == doc.updated_at == datetime.datetime(
+        2009, 11, 15, 14, 12, 12, tzinfo=datetime.timezone.utc
+    )
+    assert Compiler_7_0.compiled_put_mapping(PostDocument).body == {
+        'properties': {
+            'created_at': {'type': 'date', 'format': 'epoch_second'},
+            'updated_at': {'type': 'date', 'format': 'epoch_millis'},
+        }
+    }
+
+
 def test_boolean():
     t = Boolean()
     assert t.to_python(None) is None
@@ -1,6 +1,7 @@
 from .base import BaseTestCase
 
-from elasticmagic.util import merge_params
+from elasticmagic.util import LRUCache, PersistentTuple, merge_params
+from elasticmagic.util import get_fingerprint
 from elasticmagic.expression import Params
 
 
@@ -36,3 +37,87 @@ class UtilsTest(BaseTestCase):
                           lambda: merge_params(original, (), None))
         self.assertRaises(AssertionError,
                           lambda: merge_params(original, (), []))
+
+    def test_lru_cache(self):
+        now = [100.0]
+        cache = LRUCache(maxsize=2, ttl=10, timer=lambda: now[0])
+        cache.set('a', 1)
+        cache.set_many({'b': 2, 'c': 3})
+        self.assertEqual(len(cache), 2)
+        self.assertNotIn('a', cache)
+        self.assertEqual(cache.get_many(['a', 'b', 'c']), {'b': 2, 'c': 3})
+
+        now[0] = 105.0
+        cache.set('b', 20)
+        now[0] = 110.0
+        self.assertIsNone(cache.get('c'))
+        self.assertEqual(cache.get('b'), 20)
+        self.assertEqual(cache.pop('b'), 20)
+        self.assertEqual(len(cache), 0)
+
+    def test_lru_cache_maxbytes(self):
+        now = [0.0]
+        cache = LRUCache(
+            maxsize=10, ttl=10, timer=lambda: now[0], maxbytes=10, sizeof=len
+        )
+        cache.set('a', 'xxxx')
+        cache.set('b', 'yyyy', ttl=100)
+        self.assertEqual(cache.size_bytes, 8)
+        cache.set('c', 'zzzz')
+        self.assertNotIn('a', cache)
+        self.assertEqual(cache.size_bytes, 8)
+        # too big item is not stored
+        cache.set('d', 'x' * 11)
+        self.assertNotIn('d', cache)
+
+        now[0] = 50.0
+        self.assertIsNone(cache.get('c'))
+        self.assertEqual(cache.get('b'), 'yyyy')
+        self.assertEqual(cache.size_bytes, 4)
+
+    def test_persistent_tuple(self):
+        empty = PersistentTuple()
+        t1 = empty + (1, 2)
+        t2 = t1 + (3,)
+        t3 = t1 + (4, 5)
+        self.assertIs(empty + (), empty)
+        self.assertEqual(len(t2), 3)
+        self.assertEqual(len(t3), 4)
+        self.assertIs(t2._parent, t1)
+        self.assertIs(t3._parent, t1)
+        self.assertEqual(t3.to_tuple(), (1, 2, 4, 5))
+        self.assertEqual(list(t2), [1, 2, 3])
+        self.assertEqual(t2[-1], 3)
+        self.assertEqual(t2, (1, 2, 3))
+        self.assertEqual(t2, PersistentTuple([1, 2, 3]))
+        self.assertNotEqual(t2, t3)
+        self.assertFalse(empty)
+        self.assertEqual(hash(t2), hash((1, 2, 3)))
+        self.assertEqual(repr(t2), 'PersistentTuple((1, 2, 3))')
+
+    def test_persistent_tuple_fingerprint(self):
+        t = PersistentTuple()
+        for i in range(5000):
+            t = t + (i,)
+        self.assertEqual(
+            t.fingerprint(), PersistentTuple(range(5000)).fingerprint()
+        )
+        self.assertEqual(
+            (t + (1,)).fingerprint(),
+            PersistentTuple(list(range(5000)) + [1]).fingerprint()
+        )
+
+    def test_fingerprint_of_classes(self):
+        def make_cls():
+            class Doc(object):
+                pass
+            return Doc
+
+        fingerprints = set()
+        for _ in range(100):
+            # ids of garbage collected classes can be reused
+            fingerprints.add(get_fingerprint(make_cls()))
+        self.assertEqual(len(fingerprints), 100)
+        doc_cls = make_cls()
+        self.assertEqual(get_fingerprint(doc_cls), get_fingerprint(doc_cls))
+        self.assertEqual(get_fingerprint(len), get_fingerprint(len))
@@ -112,6 +112,37 @@ async def test_scroll(es_index, all_cars):
     await es_index.clear_scroll(scroll_id=res.scroll_id)
 
 
+@pytest.mark.asyncio
+async def test_iter_all(es_index, all_cars):
+    sq = es_index.search_query(doc_cls=Car)
+
+    async with sq.iter_all(size=5) as docs:
+        cars = [doc async for doc in docs]
+    assert len(cars) == 11
+    assert len(set(car._id for car in cars)) == 11
+    assert docs.pages == 3
+    assert docs.hits == 11
+    assert docs.pages_per_sec > 0
+
+    docs = sq.iter_all(size=5, point_in_time=True, prefetch=False)
+    cars = [doc async for doc in docs]
+    assert len(cars) == 11
+    assert len(set(car._id for car in cars)) == 11
+    assert docs.pages == 3
+
+
+@pytest.mark.asyncio
+async def test_parallel_scan(es_index, all_cars):
+    async with es_index.parallel_scan(
+            es_index.search_query(doc_cls=Car), slices=2, size=3,
+            max_buffered_pages=1,
+    ) as docs:
+        cars = [doc async for doc in docs]
+    assert len(cars) == 11
+    assert len(set(car._id for car in cars)) == 11
+    assert docs.hits == 11
+
+
 @pytest.mark.asyncio
 async def test_disabled_stored_fields(es_index, cars):
     res = await es_index.search_query().stored_fields("_none_").get_result()